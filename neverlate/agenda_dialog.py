@@ -0,0 +1,506 @@
+# pylint: disable=no-name-in-module
+"""Agenda dialog: a scrollable list of the events of past and future days."""
+from __future__ import annotations
+
+import bisect
+import collections
+import datetime
+import functools
+import logging
+import traceback
+import typing
+from typing import Any, Callable, Optional
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QThread
+from PySide6.QtGui import QBrush, QFont
+from PySide6.QtWidgets import (
+    QAbstractItemView,
+    QDialog,
+    QHBoxLayout,
+    QHeaderView,
+    QPushButton,
+    QTableView,
+    QVBoxLayout,
+)
+
+from neverlate.main_dialog import LIGHT_GREY, WHITE
+from neverlate.utils import LOCAL_TIMEZONE, day_start, get_icon, now_datetime
+
+if typing.TYPE_CHECKING:
+    from PySide6.QtGui import QShowEvent
+
+    from neverlate.google_cal_downloader import Calendar, GoogleCalDownloader, TimeEvent
+
+logger = logging.getLogger("NeverLate")
+
+# Table columns
+AGENDA_TIME = 0
+AGENDA_SUMMARY = 1
+AGENDA_CALENDAR = 2
+AGENDA_HEADERS = ("Time", "Event", "Calendar")
+
+# Days shown when the agenda is first opened
+INITIAL_PAST_DAYS = 7
+INITIAL_FUTURE_DAYS = 28
+# Days added when scrolling past the first/last day
+EXTEND_DAYS = 28
+# Download this many days around the visible ones, so scrolling doesn't wait for each day
+PREFETCH_DAYS = 7
+# Maximum number of days downloaded at once
+MAX_FETCH_DAYS = 31
+# Number of days whose events are kept (least recently viewed ones are dropped first)
+DAY_BUCKET_CACHE_SIZE = 120
+
+
+class DayBuckets:
+    """Least recently used cache of the events of days."""
+
+    def __init__(self, max_days: int = DAY_BUCKET_CACHE_SIZE) -> None:
+        self.max_days = max_days
+        self._days = (
+            collections.OrderedDict()
+        )  # type: collections.OrderedDict[datetime.date, list[TimeEvent]]
+
+    def __contains__(self, day: datetime.date) -> bool:
+        return day in self._days
+
+    def get(self, day: datetime.date) -> Optional[list[TimeEvent]]:
+        """Events of a day (marking it as recently used). None if not loaded."""
+        events = self._days.get(day)
+        if events is not None:
+            self._days.move_to_end(day)
+        return events
+
+    def peek(self, day: datetime.date) -> Optional[list[TimeEvent]]:
+        """Events of a day, without marking it as used. None if not loaded."""
+        return self._days.get(day)
+
+    def put(self, day: datetime.date, events: list[TimeEvent]) -> list[datetime.date]:
+        """
+        Keep the events of a day.
+
+        Returns:
+            list[date]: Days dropped to make room.
+        """
+        self._days[day] = events
+        self._days.move_to_end(day)
+        evicted = []
+        while len(self._days) > self.max_days:
+            evicted.append(self._days.popitem(last=False)[0])
+        return evicted
+
+    def clear(self) -> None:
+        """Forget all days."""
+        self._days.clear()
+
+
+class FetchDays(QThread):
+    """Thread to download the events of a range of days."""
+
+    def __init__(self, gcal: GoogleCalDownloader) -> None:
+        super().__init__()
+        self.gcal = gcal
+        self.calendars = []  # type: list[Calendar]
+        self.first_day = datetime.date.today()
+        self.last_day = self.first_day
+        self.events = None  # type: Optional[list[TimeEvent]]  # None = the download failed
+
+    def run(self):
+        """Main entry point."""
+        self.events = None
+        try:
+            self.events = self.gcal.download_range(
+                self.calendars,
+                day_start(self.first_day),
+                day_start(self.last_day + datetime.timedelta(days=1)),
+            )
+        except:
+            line = "=" * 80
+            logger.error("%s\n%s\n%s", line, traceback.format_exc(), line)
+
+
+@functools.lru_cache(maxsize=None)
+def _brush(header: bool) -> QBrush:
+    """Shared (cached) background brush of the day header/event rows."""
+    return QBrush(LIGHT_GREY if header else WHITE, Qt.BrushStyle.SolidPattern)
+
+
+@functools.lru_cache(maxsize=None)
+def _font(header: bool, declined: bool) -> QFont:
+    """Shared (cached) font. Declined events are in a strikethrough & italic font."""
+    font = QFont()
+    font.setBold(header)
+    font.setItalic(declined)
+    font.setStrikeOut(declined)
+    return font
+
+
+class AgendaModel(QAbstractTableModel):
+    """
+    Table model of a contiguous range of days: a header row per day, followed by the day's events
+    once they're downloaded. Days are downloaded on demand (see `request_days`), and the range
+    grows as the user scrolls past either end.
+    """
+
+    def __init__(
+        self,
+        gcal: GoogleCalDownloader,
+        calendars: Callable[[], list[Calendar]],
+        parent: Optional[QObject] = None,
+    ) -> None:
+        """
+        Args:
+            gcal (GoogleCalDownloader): Downloads the events.
+            calendars (Callable[[], list[Calendar]]): The calendars to show.
+            parent (QObject, optional): Parent object.
+        """
+        super().__init__(parent)
+        self._calendars = calendars
+        self.buckets = DayBuckets()
+        today = datetime.date.today()
+        self._days = [
+            today + datetime.timedelta(days=offset)
+            for offset in range(-INITIAL_PAST_DAYS, INITIAL_FUTURE_DAYS)
+        ]  # type: list[datetime.date]
+        self._starts = []  # type: list[int]  # First row of each day
+        self._num_rows = 0
+        self._update_starts()
+
+        self._fetch_thread = FetchDays(gcal)
+        self._fetch_thread.finished.connect(self._fetch_finished)
+        self._wanted = None  # type: Optional[tuple[datetime.date, datetime.date]]
+
+    # ============================== Rows ==============================
+
+    def _day_size(self, day: datetime.date) -> int:
+        """Number of rows of a day: the header + its events."""
+        events = self.buckets.peek(day)
+        return 1 + (len(events) if events else 0)
+
+    def _update_starts(self) -> None:
+        """Recompute the first row of each day."""
+        self._starts = []
+        row = 0
+        for day in self._days:
+            self._starts.append(row)
+            row += self._day_size(day)
+        self._num_rows = row
+
+    def _shift_starts(self, idx: int, num_rows: int) -> None:
+        """A day gained (or lost) rows: move the days after it."""
+        for following in range(idx + 1, len(self._starts)):
+            self._starts[following] += num_rows
+        self._num_rows += num_rows
+
+    def _day_index(self, row: int) -> int:
+        """Index (in self._days) of the day a row belongs to."""
+        return bisect.bisect_right(self._starts, row) - 1
+
+    def day_at(self, row: int) -> Optional[datetime.date]:
+        """Day a row belongs to."""
+        if not 0 <= row < self._num_rows:
+            return None
+        return self._days[self._day_index(row)]
+
+    def day_row(self, day: datetime.date) -> int:
+        """Header row of a day. -1 if the day isn't in the range."""
+        if not self._days or not self._days[0] <= day <= self._days[-1]:
+            return -1
+        return self._starts[(day - self._days[0]).days]
+
+    def event_at(self, row: int) -> Optional[TimeEvent]:
+        """Event of a row. None for the day headers."""
+        if not 0 <= row < self._num_rows:
+            return None
+        idx = self._day_index(row)
+        offset = row - self._starts[idx]
+        if offset == 0:
+            return None
+        return self.buckets.peek(self._days[idx])[offset - 1]
+
+    # ============================== Qt model ==============================
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:  # pylint: disable=invalid-name
+        return 0 if parent.isValid() else self._num_rows
+
+    def columnCount(  # pylint: disable=invalid-name
+        self, parent: QModelIndex = QModelIndex()
+    ) -> int:
+        return 0 if parent.isValid() else len(AGENDA_HEADERS)
+
+    def headerData(  # pylint: disable=invalid-name
+        self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole
+    ) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return AGENDA_HEADERS[section]
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        event = self.event_at(row)
+        if role == Qt.DisplayRole:
+            if event is None:
+                day = self.day_at(row)
+                if column == AGENDA_TIME:
+                    return day.strftime("%a %b %d, %Y")
+                if column == AGENDA_SUMMARY:
+                    events = self.buckets.peek(day)
+                    if events is None:
+                        return "Loading..."
+                    return "" if events else "No events"
+                return None
+            if column == AGENDA_TIME:
+                return event.time_range_label
+            if column == AGENDA_SUMMARY:
+                return event.summary
+            if column == AGENDA_CALENDAR:
+                return event.calendar.summary
+            return None
+        if role == Qt.BackgroundRole:
+            return _brush(event is None)
+        if role == Qt.FontRole:
+            return _font(
+                event is None,
+                event is not None and column == AGENDA_SUMMARY and event.declined,
+            )
+        return None
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:  # pylint: disable=invalid-name
+        # The future never ends
+        return not parent.isValid()
+
+    def fetchMore(self, parent: QModelIndex) -> None:  # pylint: disable=invalid-name
+        """Scrolled to the last day, add more future days."""
+        if parent.isValid():
+            return
+        self.extend_future()
+
+    # ============================== Range ==============================
+
+    def extend_future(self, num_days: int = EXTEND_DAYS) -> None:
+        """Add days after the last one."""
+        last_day = self._days[-1]
+        self.beginInsertRows(QModelIndex(), self._num_rows, self._num_rows + num_days - 1)
+        self._days += [last_day + datetime.timedelta(days=i + 1) for i in range(num_days)]
+        self._update_starts()
+        self.endInsertRows()
+
+    def extend_past(self, num_days: int = EXTEND_DAYS) -> int:
+        """
+        Add days before the first one.
+
+        Returns:
+            int: Number of rows added at the top.
+        """
+        first_day = self._days[0]
+        new_days = [first_day - datetime.timedelta(days=num_days - i) for i in range(num_days)]
+        num_rows = sum(self._day_size(day) for day in new_days)
+        self.beginInsertRows(QModelIndex(), 0, num_rows - 1)
+        self._days = new_days + self._days
+        self._update_starts()
+        self.endInsertRows()
+        return num_rows
+
+    def reload(self) -> None:
+        """Forget the downloaded days (e.g. the events or visible calendars changed)."""
+        self.beginResetModel()
+        self.buckets.clear()
+        self._update_starts()
+        self.endResetModel()
+
+    # ============================== Downloading ==============================
+
+    def request_days(self, first_day: datetime.date, last_day: datetime.date) -> None:
+        """
+        The user is looking at these days. Download the ones (and the days around them) that
+        aren't loaded yet.
+
+        Args:
+            first_day (date): First visible day.
+            last_day (date): Last visible day.
+        """
+        day = first_day
+        while day <= last_day:
+            self.buckets.get(day)  # Recently used: keep it
+            day += datetime.timedelta(days=1)
+        self._wanted = (first_day, last_day)
+        self._fetch_next()
+
+    def _fetch_next(self) -> None:
+        """Download the closest missing days to the wanted ones, unless already downloading."""
+        if self._wanted is None or self._fetch_thread.isRunning():
+            return
+        first_day, last_day = self._wanted
+        margin = datetime.timedelta(days=PREFETCH_DAYS)
+        missing = [
+            day
+            for day in self._days
+            if first_day - margin <= day <= last_day + margin and day not in self.buckets
+        ]
+        if not missing:
+            self._wanted = None
+            return
+        # Visible days first
+        visible = [day for day in missing if first_day <= day <= last_day]
+        start = visible[0] if visible else missing[0]
+        end = missing[-1]
+        if (end - start).days >= MAX_FETCH_DAYS:
+            end = start + datetime.timedelta(days=MAX_FETCH_DAYS - 1)
+        self._fetch_thread.calendars = self._calendars()
+        self._fetch_thread.first_day = start
+        self._fetch_thread.last_day = end
+        self._fetch_thread.start()
+
+    def _fetch_finished(self) -> None:
+        """Show the downloaded days."""
+        events = self._fetch_thread.events
+        if events is None:
+            # Failed. Try again when the user scrolls.
+            self._wanted = None
+            return
+        first_day = self._fetch_thread.first_day
+        last_day = self._fetch_thread.last_day
+        day_events = {}  # type: dict[datetime.date, list[TimeEvent]]
+        day = first_day
+        while day <= last_day:
+            day_events[day] = []
+            day += datetime.timedelta(days=1)
+        for event in events:
+            # Events spanning midnight show up on each day
+            day = max(first_day, event.start_time.astimezone(LOCAL_TIMEZONE).date())
+            end_day = min(last_day, event.end_time.astimezone(LOCAL_TIMEZONE).date())
+            while day <= end_day:
+                if event.end_time > day_start(day):
+                    day_events[day].append(event)
+                day += datetime.timedelta(days=1)
+
+        for day, events_ in day_events.items():
+            for evicted in self.buckets.put(day, events_):
+                self._set_day_rows(evicted, None)
+            self._set_day_rows(day, events_)
+        self._fetch_next()
+
+    def _set_day_rows(self, day: datetime.date, events: Optional[list[TimeEvent]]) -> None:
+        """
+        The events of a day were loaded (or dropped) - update its rows. The buckets must already
+        hold the new events. Only the rows of this day change: other days put in (or dropped from)
+        the buckets meanwhile keep their rows until their own update.
+        """
+        row = self.day_row(day)
+        if row < 0:
+            return
+        idx = (day - self._days[0]).days
+        old_size = (
+            self._starts[idx + 1] if idx + 1 < len(self._starts) else self._num_rows
+        ) - row
+        new_size = 1 + (len(events) if events else 0)
+        if new_size > old_size:
+            self.beginInsertRows(QModelIndex(), row + old_size, row + new_size - 1)
+            self._shift_starts(idx, new_size - old_size)
+            self.endInsertRows()
+        elif new_size < old_size:
+            self.beginRemoveRows(QModelIndex(), row + new_size, row + old_size - 1)
+            self._shift_starts(idx, new_size - old_size)
+            self.endRemoveRows()
+        self.dataChanged.emit(
+            self.index(row, 0), self.index(row + new_size - 1, len(AGENDA_HEADERS) - 1)
+        )
+
+    def stop(self) -> None:
+        """Stop downloading (i.e. quitting)."""
+        self._fetch_thread.finished.disconnect()
+        self._fetch_thread.terminate()
+
+
+class AgendaDialog(QDialog):
+    """Dialog showing the events of past and future days, downloaded as the user scrolls."""
+
+    def __init__(
+        self, gcal: GoogleCalDownloader, calendars: Callable[[], list[Calendar]]
+    ) -> None:
+        """
+        Args:
+            gcal (GoogleCalDownloader): Downloads the events.
+            calendars (Callable[[], list[Calendar]]): The calendars to show.
+        """
+        super().__init__()
+        self.setWindowTitle("NeverLate: Agenda")
+        self.setWindowIcon(get_icon("tray_icon.png"))
+
+        self.model = AgendaModel(gcal, calendars, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.verticalHeader().hide()
+        # Every row has the same height, so the view doesn't need to measure them (virtualized)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(
+            self.table.fontMetrics().height() + 8
+        )
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setColumnWidth(AGENDA_TIME, 160)
+        self.table.setColumnWidth(AGENDA_SUMMARY, 320)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionMode(QAbstractItemView.NoSelection)
+        self.table.setFocusPolicy(Qt.NoFocus)
+        self.table.verticalScrollBar().valueChanged.connect(self.scrolled)
+        self.model.rowsInserted.connect(self._rows_inserted)
+        self.model.rowsRemoved.connect(self._rows_removed)
+
+        self.today_button = QPushButton("Today")
+        self.today_button.clicked.connect(self.scroll_to_today)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(self.table)
+        layout = QHBoxLayout()
+        layout.addStretch()
+        layout.addWidget(self.today_button)
+        main_layout.addLayout(layout)
+        self.setLayout(main_layout)
+        self.resize(700, 500)
+
+    def showEvent(self, event: QShowEvent):  # pylint: disable=invalid-name
+        super().showEvent(event)
+        self.model.reload()
+        self.scroll_to_today()
+
+    def scroll_to_today(self):
+        """Show today at the top."""
+        row = self.model.day_row(now_datetime().date())
+        if row >= 0:
+            self.table.scrollTo(self.model.index(row, 0), QAbstractItemView.PositionAtTop)
+        self.scrolled()
+
+    def _rows_inserted(self, _parent: QModelIndex, first: int, last: int):
+        """Rows were added above the visible ones (e.g. a day loaded) - keep showing the same rows."""
+        scroll_bar = self.table.verticalScrollBar()
+        if first <= scroll_bar.value():
+            self.table.updateGeometries()
+            scroll_bar.setValue(scroll_bar.value() + last - first + 1)
+
+    def _rows_removed(self, _parent: QModelIndex, first: int, last: int):
+        """Rows were removed above the visible ones - keep showing the same rows."""
+        scroll_bar = self.table.verticalScrollBar()
+        if last < scroll_bar.value():
+            scroll_bar.setValue(scroll_bar.value() - (last - first + 1))
+
+    def scrolled(self, *_args):
+        """Load the visible days. Add past days when scrolled to the top."""
+        scroll_bar = self.table.verticalScrollBar()
+        if scroll_bar.value() == scroll_bar.minimum() and self.isVisible():
+            # Keeps showing the same rows, see _rows_inserted
+            self.model.extend_past()
+            return  # Scrolling calls this again
+
+        viewport = self.table.viewport()
+        first_row = self.table.rowAt(0)
+        last_row = self.table.rowAt(viewport.height() - 1)
+        if last_row < 0:
+            last_row = self.model.rowCount() - 1
+        first_day = self.model.day_at(max(0, first_row))
+        last_day = self.model.day_at(last_row)
+        if first_day is not None and last_day is not None:
+            self.model.request_days(first_day, last_day)
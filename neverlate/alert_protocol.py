@@ -0,0 +1,60 @@
+"""
+Messages between the app and the pop-up process: one JSON object per line, with a "type" (see
+the COMMAND_* and OUTPUT_* constants) and the alert "id".
+
+Commands (app -> pop-up process):
+    {"type": "show", "id": str, "title": str, "start_time": str (iso), "video_uri": str,
+     "others": list[str] (other events in the same dialog)}
+    {"type": "update", "id": str, "title": str, "start_time": str (iso), "video_uri": str,
+     "others": list[str]}
+    {"type": "close", "id": str}
+Results (pop-up process -> app):
+    {"type": "snooze", "id": str, "seconds": int}
+    {"type": "dismiss", "id": str}
+    {"type": "join", "id": str}
+    {"type": "closed", "id": str}
+    {"type": "heartbeat"}  (every HEARTBEAT_INTERVAL seconds, while dialogs are open)
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+HEARTBEAT_INTERVAL = 5  # Seconds
+# The pop-up process is considered hung after missing heartbeats for this long (in seconds)
+HEARTBEAT_TIMEOUT = 30
+
+
+def encode_message(message_type: str, **fields: Any) -> str:
+    """
+    Frame a message.
+
+    Args:
+        message_type (str): Type of message, e.g. COMMAND_SHOW.
+        **fields: Content of the message.
+
+    Returns:
+        str: Line to send (newline terminated).
+    """
+    fields["type"] = message_type
+    # No raw newlines in the output, even if the fields contain some
+    return json.dumps(fields) + "\n"
+
+
+def decode_message(line: str) -> dict[str, Any]:
+    """
+    Parse a message.
+
+    Args:
+        line (str): Received line.
+
+    Raises:
+        ValueError: If the line isn't a valid message.
+
+    Returns:
+        dict: The message, with at least a "type".
+    """
+    message = json.loads(line)
+    if not isinstance(message, dict) or not isinstance(message.get("type"), str):
+        raise ValueError(f"Invalid message: {line!r}")
+    return message
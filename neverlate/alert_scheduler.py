@@ -0,0 +1,163 @@
+"""Fires event alerts at their deadlines, instead of checking every event every second."""
+# pylint: disable=no-name-in-module
+from __future__ import annotations
+
+import heapq
+import itertools
+import time
+from typing import TYPE_CHECKING, Optional
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal, Slot
+
+if TYPE_CHECKING:
+    from neverlate.event_alerter import EventAlerter
+
+# Never sleep longer than this (in seconds). Catches wall clock changes (e.g. suspend/resume),
+# which the (monotonic) timer doesn't see.
+MAX_SLEEP = 60
+# Seconds before an alert that `alert_approaching` is emitted (e.g. to check the event is still on)
+APPROACH_LEAD = 15
+# Wall clock and monotonic time drifting apart more than this (in seconds) between two ticks
+# means the wall clock jumped (e.g. the computer woke up from sleep)
+MAX_CLOCK_DRIFT = 5
+
+
+class AlertScheduler(QObject):
+    """
+    Priority queue of alerters keyed on their next alert time. A single-shot timer is armed for
+    the earliest deadline, so nothing runs while no alert is due.
+    """
+
+    clock_jumped = Signal(float)  # Seconds the wall clock jumped by (e.g. time asleep)
+    alert_approaching = Signal(str)  # Key of an alerter that's about to alert (APPROACH_LEAD)
+    _reschedule_requested = Signal(str)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._heap = []  # type: list[tuple[float, int, str]]  # (deadline, tie breaker, key)
+        self._counter = itertools.count()
+        self._deadlines = {}  # type: dict[str, float]  # Key -> current deadline
+        # (deadline - APPROACH_LEAD, tie breaker, key, deadline)
+        self._approach_heap = []  # type: list[tuple[float, int, str, float]]
+        self._alerters = {}  # type: dict[str, EventAlerter]
+        # Wall clock and monotonic time of the last tick, to detect wall clock jumps
+        self._last_tick = (time.time(), time.monotonic())
+
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._fire)
+
+        # Alerters may change from other threads - always reschedule in ours
+        self._reschedule_requested.connect(self._reschedule, Qt.QueuedConnection)
+
+    def schedule(self, key: str, alerter: EventAlerter) -> None:
+        """
+        Add an alerter, or re-key it after it changed (synced, snoozed, dismissed...).
+
+        Args:
+            key (str): Unique key of the alerter.
+            alerter (EventAlerter): Alerter to schedule.
+        """
+        self._alerters[key] = alerter
+        alerter.on_change = lambda: self._reschedule_requested.emit(key)
+        self._push(key, time.time())
+        self._arm()
+
+    def remove(self, key: str) -> None:
+        """Stop scheduling an alerter."""
+        alerter = self._alerters.pop(key, None)
+        if alerter is not None:
+            alerter.on_change = None
+        # Heap entries are dropped lazily
+        self._deadlines.pop(key, None)
+        self._arm()
+
+    def stop(self) -> None:
+        """Stop the timer (i.e. quitting)."""
+        self._timer.stop()
+
+    def next_deadline(self) -> Optional[float]:
+        """Epoch time of the next alert, None if there's nothing to alert about."""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _push(self, key: str, now: float) -> None:
+        """(Re)compute the deadline of an alerter."""
+        deadline = self._alerters[key].next_alert_time(now)
+        if deadline is None:
+            self._deadlines.pop(key, None)
+            return
+        if self._deadlines.get(key) == deadline:
+            return  # Unchanged, already in the heap
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if deadline - APPROACH_LEAD > now:
+            heapq.heappush(
+                self._approach_heap,
+                (deadline - APPROACH_LEAD, next(self._counter), key, deadline),
+            )
+
+    def _drop_stale(self) -> None:
+        """Remove heap entries of removed or re-keyed alerters."""
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        while (
+            self._approach_heap
+            and self._deadlines.get(self._approach_heap[0][2]) != self._approach_heap[0][3]
+        ):
+            heapq.heappop(self._approach_heap)
+
+    def _arm(self) -> None:
+        """Arm the timer for the earliest deadline (or approaching alert)."""
+        deadline = self.next_deadline()
+        if self._approach_heap:
+            approach_time = self._approach_heap[0][0]
+            deadline = approach_time if deadline is None else min(deadline, approach_time)
+        if deadline is None:
+            self._timer.stop()
+            return
+        delay = min(max(0.0, deadline - time.time()), MAX_SLEEP)
+        self._timer.start(int(delay * 1000))
+
+    def _check_clock(self) -> None:
+        """Emit `clock_jumped` if the wall clock jumped since the last tick."""
+        last_wall, last_monotonic = self._last_tick
+        self._last_tick = (time.time(), time.monotonic())
+        drift = (self._last_tick[0] - last_wall) - (self._last_tick[1] - last_monotonic)
+        if abs(drift) > MAX_CLOCK_DRIFT:
+            self.clock_jumped.emit(drift)
+
+    @Slot()
+    def _fire(self) -> None:
+        """Alert everything that is due."""
+        # Before alerting: everything overdue after a jump should be alerted about as a whole
+        self._check_clock()
+        now = time.time()
+        self._drop_stale()
+        approaching = []
+        while self._approach_heap and self._approach_heap[0][0] <= now:
+            _, _, key, deadline = heapq.heappop(self._approach_heap)
+            if self._deadlines.get(key) == deadline and deadline > now:
+                approaching.append(key)
+            self._drop_stale()
+        for key in approaching:
+            self.alert_approaching.emit(key)
+
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            if self._deadlines.pop(key, None) is not None:
+                due.append(key)
+            self._drop_stale()
+        for key in due:
+            self._alerters[key].update(now)
+            self._push(key, now)
+        self._arm()
+
+    @Slot(str)
+    def _reschedule(self, key: str) -> None:
+        """An alerter changed, re-key it."""
+        if key in self._alerters:
+            self._push(key, time.time())
+            self._arm()
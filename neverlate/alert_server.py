@@ -0,0 +1,465 @@
+"""
+Shows the alert dialogs: either in the long lived pop-up process (pop_up_alert.py), or directly
+in the app's process.
+"""
+# pylint: disable=no-name-in-module
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from PySide6.QtCore import QProcess, QTimer
+
+from neverlate.alert_protocol import (
+    HEARTBEAT_INTERVAL,
+    HEARTBEAT_TIMEOUT,
+    decode_message,
+    encode_message,
+)
+from neverlate.constants import (
+    COMMAND_CLOSE,
+    COMMAND_SHOW,
+    COMMAND_UPDATE,
+    OUTPUT_CLOSED,
+    OUTPUT_HEARTBEAT,
+)
+from neverlate.google_cal_downloader import TimeEvent
+from neverlate.pop_up_alert import AlertDialogs, warm_up
+from neverlate.preferences import PREFERENCES
+from neverlate.utils import pretty_datetime
+
+logger = logging.getLogger("NeverLate")
+
+# Don't restart the pop-up process right away if it dies sooner than this (in seconds) after
+# being started - it would most likely die again. It's restarted after MIN_UPTIME seconds instead,
+# doubling each time it dies that quickly again, up to MAX_RESTART_DELAY.
+MIN_UPTIME = 5
+MAX_RESTART_DELAY = 300
+
+# Alert admission: at most this many dialogs are open at once, each showing at most this many
+# events. Other alerts wait (by start time) for a dialog to close.
+MAX_OPEN_DIALOGS = 2
+MAX_EVENTS_PER_DIALOG = 5
+
+# Called with the result of an alert, e.g. {"type": "snooze", "id": alert_id, "seconds": 60}.
+# None if the pop-up process failed.
+ResultCallback = Callable[[Optional[Dict[str, Any]]], None]
+
+
+def dialog_fields(time_events: list[TimeEvent]) -> dict[str, Any]:
+    """
+    What a dialog shows about its events: the first one, and a line per other event.
+
+    Args:
+        time_events (list[TimeEvent]): Events of the dialog, by start time.
+
+    Returns:
+        dict: Fields of the show/update commands (besides the ID).
+    """
+    first = time_events[0]
+    return {
+        "title": first.summary,
+        "start_time": first.start_time.isoformat(),
+        "video_uri": first.video_url,
+        "others": [
+            f"{pretty_datetime(time_event.start_time)}  {time_event.summary}"
+            for time_event in time_events[1:]
+        ],
+    }
+
+
+class PopUpProcess:
+    """
+    Supervises the pop-up process showing all the alert dialogs. The process is started ahead of
+    time, so alerts don't pay for starting a Python interpreter and Qt, and it's restarted if it
+    dies or hangs (stops sending heartbeats while dialogs are open - when idle, neither process
+    wakes up).
+
+    Everything runs in the main thread, driven by QProcess/QTimer signals: no thread waits for a
+    dialog, no matter how many are open.
+    """
+
+    APP_PATH = os.path.join(os.path.dirname(__file__), "pop_up_alert.py")
+
+    def __init__(self) -> None:
+        # Qt objects are created on start(), once there's a QApplication
+        self._process = None  # type: Optional[QProcess]
+        self._watchdog = None  # type: Optional[QTimer]
+        self._restart_timer = None  # type: Optional[QTimer]
+        self._started_time = 0.0  # Monotonic time the process was last started
+        self._restart_delay = 0.0  # Seconds
+        self._restart_time = 0.0  # Monotonic time - not started again before then
+        self._heartbeat_time = 0.0  # Monotonic time of the last heartbeat
+        self._callbacks = {}  # type: dict[str, ResultCallback]  # Alert ID -> callback
+
+    def start(self) -> None:
+        """Start the pop-up process now, so it's ready for the first alert."""
+        if self._watchdog is None:
+            self._watchdog = QTimer()
+            self._watchdog.timeout.connect(self._check_heartbeat)
+            self._restart_timer = QTimer()
+            self._restart_timer.setSingleShot(True)
+            self._restart_timer.timeout.connect(self._restart)
+        self._ensure_running()
+
+    def stop(self) -> None:
+        """Stop the pop-up process (closing any dialogs)."""
+        if self._watchdog is not None:
+            self._watchdog.stop()
+            self._restart_timer.stop()
+        self._callbacks.clear()
+        process, self._process = self._process, None
+        if process is None:
+            return
+        process.finished.disconnect()
+        process.closeWriteChannel()  # The process quits when its input is closed
+        if not process.waitForFinished(2000):
+            process.kill()
+            process.waitForFinished(1000)
+
+    def show(
+        self, dialog_id: str, time_events: list[TimeEvent], callback: ResultCallback
+    ) -> None:
+        """
+        Show an alert dialog.
+
+        Args:
+            dialog_id (str): Unique ID of the dialog.
+            time_events (list[TimeEvent]): Events to alert about, by start time.
+            callback (ResultCallback): Called once the user closes the dialog.
+        """
+        if not self._send(COMMAND_SHOW, id=dialog_id, **dialog_fields(time_events)):
+            # Waiting to restart the process - fail once the caller is done showing
+            QTimer.singleShot(0, lambda: callback(None))
+            return
+        self._callbacks[dialog_id] = callback
+        self._update_watchdog()
+
+    def update(self, dialog_id: str, time_events: list[TimeEvent]) -> None:
+        """Show the latest details of the events (e.g. one moved) in an alert dialog."""
+        if dialog_id in self._callbacks:
+            self._send(COMMAND_UPDATE, id=dialog_id, **dialog_fields(time_events))
+
+    def close(self, dialog_id: str) -> None:
+        """Close an alert dialog (its callback gets a "closed" result)."""
+        if dialog_id in self._callbacks:
+            self._send(COMMAND_CLOSE, id=dialog_id)
+
+    def _ensure_running(self) -> Optional[QProcess]:
+        """Start the pop-up process if it isn't running. None if it can't be restarted yet."""
+        if self._process is not None:
+            return self._process
+        if time.monotonic() < self._restart_time:
+            return None
+        process = QProcess()
+        process.setProcessChannelMode(QProcess.ForwardedErrorChannel)
+        process.readyReadStandardOutput.connect(lambda: self._read_results(process))
+        process.finished.connect(lambda *_: self._process_ended(process))
+        process.errorOccurred.connect(lambda error: self._process_error(process, error))
+        self._process = process
+        self._started_time = time.monotonic()
+        self._heartbeat_time = self._started_time
+        process.start("python", [self.APP_PATH])
+        logger.debug("Started the pop-up process")
+        return process
+
+    def _send(self, command: str, **fields: Any) -> bool:
+        """Send a command to the pop-up process. False if it isn't running."""
+        process = self._ensure_running()
+        if process is None:
+            return False
+        process.write(encode_message(command, **fields).encode("utf-8"))
+        return True
+
+    def _read_results(self, process: QProcess) -> None:
+        """Handle the results the pop-up process sent."""
+        while process.canReadLine():
+            line = process.readLine().data().decode("utf-8", "replace")
+            try:
+                result = decode_message(line)
+            except ValueError:
+                logger.debug("Invalid message from the pop-up process: %s", line.strip())
+                continue
+            if result["type"] == OUTPUT_HEARTBEAT:
+                self._heartbeat_time = time.monotonic()
+                continue
+            callback = self._callbacks.pop(result.get("id", ""), None)
+            if callback is None:
+                logger.debug("Result for an unknown alert: %s", line.strip())
+                continue
+            callback(result)
+            self._update_watchdog()
+
+    def _process_ended(self, process: QProcess) -> None:
+        """The pop-up process exited (or failed to start)."""
+        if self._process is not process:
+            return  # Stopped
+        self._process = None
+        process.deleteLater()
+        logger.error("The pop-up process exited unexpectedly (%s)", process.exitCode())
+        callbacks, self._callbacks = self._callbacks, {}
+        for callback in callbacks.values():
+            callback(None)
+        self._update_watchdog()
+        if time.monotonic() - self._started_time > MIN_UPTIME:
+            self._restart_delay = 0.0
+        else:
+            self._restart_delay = min(max(MIN_UPTIME, self._restart_delay * 2), MAX_RESTART_DELAY)
+            logger.error("Restarting the pop-up process in %g seconds", self._restart_delay)
+        self._restart_time = time.monotonic() + self._restart_delay
+        if self._restart_timer is not None:
+            self._restart_timer.start(int(self._restart_delay * 1000))
+
+    def _restart(self) -> None:
+        """Start the pop-up process again, once the restart delay is over."""
+        self._restart_time = 0.0  # (The timer may fire a bit early)
+        self._ensure_running()
+
+    def _process_error(self, process: QProcess, error: QProcess.ProcessError) -> None:
+        """Something went wrong with the pop-up process."""
+        # Crashes etc. are followed by `finished`, failing to start isn't
+        if error == QProcess.FailedToStart:
+            logger.error("Unable to start the pop-up process: %s", process.errorString())
+            self._process_ended(process)
+
+    def _update_watchdog(self) -> None:
+        """Expect heartbeats only while dialogs are open (the pop-up process sends them then)."""
+        if self._watchdog is None:
+            return
+        if not self._callbacks:
+            self._watchdog.stop()
+        elif not self._watchdog.isActive():
+            # The heartbeats (re)start with the first dialog
+            self._heartbeat_time = time.monotonic()
+            self._watchdog.start(HEARTBEAT_INTERVAL * 1000)
+
+    def _check_heartbeat(self) -> None:
+        """Kill the pop-up process if it stopped sending heartbeats."""
+        if self._process is None:
+            return
+        if time.monotonic() - self._heartbeat_time > HEARTBEAT_TIMEOUT:
+            logger.error("The pop-up process is not responding, restarting it")
+            self._process.kill()
+
+
+class InProcessAlerts:
+    """
+    Shows the alert dialogs in the app's own QApplication: no process to talk to, so they show up
+    within a frame or two. On some platforms, a (tray) app's dialogs may not come up on the
+    workspace the user is on though - use the pop-up process there.
+    """
+
+    def __init__(self) -> None:
+        self._dialogs = None  # type: Optional[AlertDialogs]  # Created on start()
+        self._callbacks = {}  # type: dict[str, ResultCallback]  # Alert ID -> callback
+
+    def start(self) -> None:
+        """Load what the dialogs need now, so the first alert shows up quickly."""
+        if self._dialogs is None:
+            self._dialogs = AlertDialogs(self._on_result)
+            warm_up()
+
+    def stop(self) -> None:
+        """Close all the dialogs."""
+        self._callbacks.clear()
+        if self._dialogs is not None:
+            self._dialogs.close_all()
+
+    def show(
+        self, dialog_id: str, time_events: list[TimeEvent], callback: ResultCallback
+    ) -> None:
+        """Show an alert dialog. (See PopUpProcess.show)"""
+        self.start()
+        self._callbacks[dialog_id] = callback
+        self._dialogs.show(dialog_id, **dialog_fields(time_events))
+
+    def update(self, dialog_id: str, time_events: list[TimeEvent]) -> None:
+        """Show the latest details of the events (e.g. one moved) in an alert dialog."""
+        if self._dialogs is not None:
+            self._dialogs.update(dialog_id, **dialog_fields(time_events))
+
+    def close(self, dialog_id: str) -> None:
+        """Close an alert dialog (its callback gets a "closed" result)."""
+        if self._dialogs is not None:
+            self._dialogs.close(dialog_id)
+
+    def _on_result(self, result: str, **fields: Any) -> None:
+        """The user closed a dialog."""
+        callback = self._callbacks.pop(fields["id"], None)
+        if callback is not None:
+            callback(dict(fields, type=result))
+
+
+class _Alert:
+    """An event to alert about."""
+
+    __slots__ = ("alert_id", "callback", "time_event")
+
+    def __init__(self, alert_id: str, time_event: TimeEvent, callback: ResultCallback) -> None:
+        self.alert_id = alert_id
+        self.time_event = time_event
+        self.callback = callback
+
+    def __lt__(self, other: _Alert) -> bool:
+        return self.time_event.start_epoch < other.time_event.start_epoch
+
+
+class AlertServer:
+    """
+    Shows the alert dialogs with the backend selected in the preferences. Dialogs already open
+    stay with the backend that showed them.
+
+    Admission control: alerts requested together (in the same event loop iteration, e.g. after
+    waking up from sleep or a sync bringing in many events) are merged into one dialog, at most
+    MAX_OPEN_DIALOGS dialogs are open at once, and the other alerts wait by start time.
+    """
+
+    def __init__(self) -> None:
+        self.pop_up_process = PopUpProcess()
+        self.in_process = InProcessAlerts()
+        self._queue = []  # type: list[_Alert]  # Waiting for a dialog, by start time
+        self._dialogs = {}  # type: dict[str, list[_Alert]]  # Dialog ID -> its alerts
+        self._backends = {}  # type: dict[str, Any]  # Dialog ID -> backend showing it
+        self._dialog_ids = {}  # type: dict[str, str]  # Alert ID -> dialog ID
+        self._admit_timer = None  # type: Optional[QTimer]  # Created once there's a QApplication
+        self._hold_until = 0.0  # Monotonic time - no new dialogs until then
+
+    @property
+    def backend(self) -> Any:
+        """Backend new alerts are shown with."""
+        return self.in_process if PREFERENCES.in_process_alerts else self.pop_up_process
+
+    def start(self) -> None:
+        """Get the backend ready for the first alert."""
+        self.backend.start()
+
+    def stop(self) -> None:
+        """Close all the dialogs."""
+        if self._admit_timer is not None:
+            self._admit_timer.stop()
+        self._queue.clear()
+        self._dialogs.clear()
+        self._backends.clear()
+        self._dialog_ids.clear()
+        self.pop_up_process.stop()
+        self.in_process.stop()
+
+    def hold(self, seconds: float) -> None:
+        """
+        Don't open new dialogs for a while: all the alerts requested meanwhile are merged. (e.g.
+        right after waking up from sleep, while the computer is busy and events are synced.)
+
+        Args:
+            seconds (float): How long to hold the alerts for.
+        """
+        self._hold_until = max(self._hold_until, time.monotonic() + seconds)
+        self._schedule_admission()
+
+    def show(self, alert_id: str, time_event: TimeEvent, callback: ResultCallback) -> None:
+        """
+        Alert about an event: queue it, it's shown as soon as admitted.
+
+        Args:
+            alert_id (str): Unique ID of the alert.
+            time_event (TimeEvent): Event to alert about.
+            callback (ResultCallback): Called once the user closes the dialog.
+        """
+        bisect.insort(self._queue, _Alert(alert_id, time_event, callback))
+        self._schedule_admission()
+
+    def update(self, alert_id: str, time_event: TimeEvent) -> None:
+        """Show the latest details of the event (e.g. it moved) in its alert dialog."""
+        alert = self._find_alert(alert_id)
+        if alert is None:
+            return
+        alert.time_event = time_event
+        dialog_id = self._dialog_ids.get(alert_id)
+        if dialog_id is None:
+            self._queue.sort()
+        else:
+            self._dialogs[dialog_id].sort()
+            self._backends[dialog_id].update(
+                dialog_id, [alert.time_event for alert in self._dialogs[dialog_id]]
+            )
+
+    def close(self, alert_id: str) -> None:
+        """Close the alert (its callback gets a "closed" result)."""
+        alert = self._find_alert(alert_id)
+        if alert is None:
+            return
+        dialog_id = self._dialog_ids.get(alert_id)
+        if dialog_id is not None and len(self._dialogs[dialog_id]) == 1:
+            self._backends[dialog_id].close(dialog_id)
+            return
+        # Queued, or one of several events in a dialog
+        if dialog_id is None:
+            self._queue.remove(alert)
+        else:
+            del self._dialog_ids[alert_id]
+            self._dialogs[dialog_id].remove(alert)
+            self._backends[dialog_id].update(
+                dialog_id, [alert.time_event for alert in self._dialogs[dialog_id]]
+            )
+        alert.callback({"type": OUTPUT_CLOSED, "id": alert_id})
+
+    def _find_alert(self, alert_id: str) -> Optional[_Alert]:
+        """Alert (queued or shown) by ID."""
+        dialog_id = self._dialog_ids.get(alert_id)
+        alerts = self._queue if dialog_id is None else self._dialogs[dialog_id]
+        for alert in alerts:
+            if alert.alert_id == alert_id:
+                return alert
+        return None
+
+    def _schedule_admission(self) -> None:
+        """Admit the queued alerts once the current event loop iteration is done."""
+        if self._admit_timer is None:
+            self._admit_timer = QTimer()
+            self._admit_timer.setSingleShot(True)
+            self._admit_timer.timeout.connect(self._admit)
+        delay = max(0.0, self._hold_until - time.monotonic())
+        self._admit_timer.start(int(delay * 1000))
+
+    def _admit(self) -> None:
+        """Show the queued alerts, as far as the limits allow."""
+        if time.monotonic() < self._hold_until:
+            self._schedule_admission()
+            return
+        while self._queue and len(self._dialogs) < MAX_OPEN_DIALOGS:
+            alerts = self._queue[:MAX_EVENTS_PER_DIALOG]
+            del self._queue[:MAX_EVENTS_PER_DIALOG]
+            if len(alerts) > 1:
+                logger.debug("Showing %d alerts in one dialog", len(alerts))
+            self._open_dialog(alerts)
+
+    def _open_dialog(self, alerts: list[_Alert]) -> None:
+        """Show a dialog for the alerts."""
+        dialog_id = uuid.uuid4().hex
+        backend = self.backend
+        self._dialogs[dialog_id] = alerts
+        self._backends[dialog_id] = backend
+        for alert in alerts:
+            self._dialog_ids[alert.alert_id] = dialog_id
+        backend.show(
+            dialog_id,
+            [alert.time_event for alert in alerts],
+            lambda result: self._dialog_closed(dialog_id, result),
+        )
+
+    def _dialog_closed(self, dialog_id: str, result: Optional[dict[str, Any]]) -> None:
+        """The user closed a dialog: the result applies to all its alerts."""
+        self._backends.pop(dialog_id, None)
+        alerts = self._dialogs.pop(dialog_id, [])
+        for alert in alerts:
+            del self._dialog_ids[alert.alert_id]
+        for alert in alerts:
+            alert.callback(None if result is None else dict(result, id=alert.alert_id))
+        if self._queue:
+            self._schedule_admission()
+
+
+ALERT_SERVER = AlertServer()
@@ -1,4 +1,12 @@
-OUTPUT_DISMISS = "DISMISS"
-OUTPUT_SNOOZE = "SNOOZE"
+OUTPUT_DISMISS = "dismiss"
+OUTPUT_JOIN = "join"  # Dismissed and joined the video conference
+OUTPUT_SNOOZE = "snooze"
+OUTPUT_CLOSED = "closed"  # Dialog closed without dismissing/snoozing
+OUTPUT_HEARTBEAT = "heartbeat"  # The pop-up process is alive (and not hung)
+
+# Commands to the pop-up process
+COMMAND_SHOW = "show"
+COMMAND_UPDATE = "update"
+COMMAND_CLOSE = "close"
 
 APP_NAME = "NeverLate"
@@ -3,39 +3,78 @@
 from __future__ import annotations
 
 import logging
-import os
-import subprocess  # nosec
-import sys
-from datetime import datetime, timedelta
-from typing import Optional
+import time
+import uuid
+from typing import Any, Callable, Optional
 
-from PySide6.QtCore import QThread, Signal, Slot
+from PySide6.QtCore import Slot
 
-from neverlate.constants import OUTPUT_DISMISS, OUTPUT_SNOOZE
+from neverlate.alert_server import ALERT_SERVER
+from neverlate.constants import OUTPUT_DISMISS, OUTPUT_JOIN, OUTPUT_SNOOZE
 from neverlate.google_cal_downloader import TimeEvent
 from neverlate.preferences import PREFERENCES
-from neverlate.utils import now_datetime
 
 logger = logging.getLogger("NeverLate")
 
+# Seconds before alerting again when an alert couldn't be shown (e.g. the pop-up process died)
+FAILED_ALERT_RETRY = 10
+
 
 class EventAlerter:
     """Alert about a timed event."""
 
-    _snooze_until_time: Optional[datetime]
+    _snooze_until_time: Optional[float]  # Epoch time
     time_event: TimeEvent
     has_alerted: bool  # Trure if an alert has been displayed ever
     dismissed_alerts: bool  # True if the user has dismissed the alert dialog
-    _alerter: PopUpAlerterThread  # Thread monitoring subprocess for the pop-up dialogs
+    secs_till_alert: int  # Result of time_till_alert() from the last update()
+    on_change: Optional[Callable[[], None]]  # Called when the alert time changes
+    on_state_change: Optional[Callable[[EventAlerter], None]]  # Called to save the state
+    alert_id: Optional[str]  # ID of the open pop-up dialog
 
     def __init__(self, time_event: TimeEvent) -> None:
         self.time_event = time_event
         self.has_alerted = False
         self.dismissed_alerts = False
-        self._alerter = PopUpAlerterThread(self.time_event)
-        self._alerter.dismissed_signal.connect(self._dismiss_alerts)
-        self._alerter.snooze_signal.connect(self.snooze)
+        self.alert_id = None
         self._snooze_until_time = None
+        self.secs_till_alert = -1
+        self.on_change = None
+        self.on_state_change = None
+
+    def _save_state(self):
+        """The alert state changed - save it."""
+        if self.on_state_change is not None:
+            self.on_state_change(self)
+
+    def _changed(self):
+        """The next alert time may have changed."""
+        self._save_state()
+        if self.on_change is not None:
+            self.on_change()
+
+    def get_state(self) -> dict[str, Any]:
+        """The alert state, to save it (see set_state)."""
+        return {
+            "has_alerted": self.has_alerted,
+            "dismissed": self.dismissed_alerts,
+            "snooze_until": self._snooze_until_time,
+        }
+
+    def set_state(
+        self, has_alerted: bool, dismissed: bool, snooze_until: Optional[float]
+    ) -> None:
+        """
+        Restore the saved alert state (e.g. from before a restart).
+
+        Args:
+            has_alerted (bool): An alert has been shown.
+            dismissed (bool): The user dismissed the alerts.
+            snooze_until (float|None): Epoch time the alert is snoozed until.
+        """
+        self.has_alerted = has_alerted
+        self.dismissed_alerts = dismissed
+        self._snooze_until_time = snooze_until
 
     @Slot()
     def _dismiss_alerts(self):
@@ -44,22 +83,30 @@ class EventAlerter:
         """
         self.dismissed_alerts = True
 
+    def is_alerting(self) -> bool:
+        """True if the pop-up dialog is open."""
+        return self.alert_id is not None
+
+    def update_event(self, time_event: TimeEvent) -> None:
+        """
+        Use the latest (downloaded) data of the event. An open pop-up is updated in place.
+
+        Args:
+            time_event (TimeEvent): Latest data of the event.
+        """
+        previous, self.time_event = self.time_event, time_event
+        if self.alert_id is not None and (
+            previous.summary,
+            previous.start_epoch,
+            previous.video_url,
+        ) != (time_event.summary, time_event.start_epoch, time_event.video_url):
+            ALERT_SERVER.update(self.alert_id, time_event)
+
     def close_pop_up(self):
-        """Close any pop-up dialog threads.  Call before terminating."""
-        self.dismissed_alerts = True
-        try:
-            if self._alerter.isRunning():
-                logger.debug("TERMINATING A POP UP: %s", self.time_event.summary)
-                if sys.platform == "win32":
-                    subprocess.call(  # nosec
-                        ["taskkill", "/F", "/T", "/PID", str(self._alerter.process.pid)]
-                    )
-                else:
-                    self._alerter.process.kill()
-                    self._alerter.process.terminate()
-                self._alerter.terminate()
-        except RuntimeError:
-            pass
+        """Close any pop-up dialog.  Call before terminating."""
+        if self.alert_id is not None:
+            logger.debug("CLOSING A POP UP: %s", self.time_event.summary)
+            ALERT_SERVER.close(self.alert_id)
 
     def reset_alert(self):
         """
@@ -68,6 +115,7 @@ class EventAlerter:
         self.close_pop_up()
         self.dismissed_alerts = False
         self.has_alerted = False
+        self._changed()
 
     @Slot(int)
     def snooze(self, seconds: int = 0) -> None:
@@ -77,96 +125,94 @@ class EventAlerter:
         Args:
             seconds (int): How many seconds to snooze for.
         """
-        self._snooze_until_time = now_datetime() + timedelta(seconds=seconds)
+        self._snooze_until_time = time.time() + seconds
 
-    def time_till_alert(self) -> int:
+    def time_till_alert(self, now: Optional[float] = None) -> int:
         """Seconds until a notification should appear.
 
+        Args:
+            now (float, optional): Current epoch time (shared by a whole update). Defaults to the
+                current time.
+
         Returns:
             int: Seconds till event. Less than zero = do not alert.
         """
-        if (
-            self.dismissed_alerts
-            or self.time_event.has_declined()
-            or self.time_event.has_ended()
-            or self._alerter.isRunning()  # Already alerted
-        ):
+        if now is None:
+            now = time.time()
+        alert_time = self.next_alert_time(now)
+        if alert_time is None:
             return -1
+        return max(0, int(alert_time - now))
+
+    def next_alert_time(self, now: Optional[float] = None) -> Optional[float]:
+        """Epoch time a notification should appear.
+
+        Args:
+            now (float, optional): Current epoch time. Defaults to the current time.
+
+        Returns:
+            float|None: None = do not alert.
+        """
+        if not self.will_alert(now):
+            return None
         if self.has_alerted and self._snooze_until_time:
-            secs_till_alert = (self._snooze_until_time - now_datetime()).total_seconds()
-            return max(0, int(secs_till_alert))
+            return self._snooze_until_time
         padding = 0 if self.has_alerted else PREFERENCES.alert_padding * 60
-        secs_till_alert = (self.time_event.start_time - now_datetime()).total_seconds()
-        return max(0, int(secs_till_alert) - padding)
+        return self.time_event.start_epoch - padding
+
+    def update(self, now: Optional[float] = None):
+        """General function that should be called regularly to see if it should display an alert.
 
-    def update(self):
-        """General function that should be called regularly to see if it should display an alert."""
-        secs_till = self.time_till_alert()
-        if secs_till != 0:
+        Args:
+            now (float, optional): Current epoch time (shared by a whole update). Defaults to the
+                current time.
+        """
+        self.secs_till_alert = self.time_till_alert(now)
+        if self.secs_till_alert != 0:
             return
         # Display an alert
         self.has_alerted = True
-        self._alerter.start()
+        self._save_state()
+        self.secs_till_alert = -1
+        self.alert_id = uuid.uuid4().hex
+        ALERT_SERVER.show(self.alert_id, self.time_event, self._pop_up_closed)
+
+    def _pop_up_closed(self, result: Optional[dict[str, Any]]) -> None:
+        """
+        The user closed the pop-up dialog.
 
-    def will_alert(self) -> bool:
+        Args:
+            result (dict|None): The user's choice (see alert_protocol). None if the dialog failed.
+        """
+        self.alert_id = None
+        if result is None:
+            # Something bad happened. Alert again shortly
+            logger.error("Unable to show the alert for %s", self.time_event.summary)
+            self.snooze(FAILED_ALERT_RETRY)
+        else:
+            logger.debug("Closed event, output: %s", result)
+            if result["type"] == OUTPUT_SNOOZE:
+                self.snooze(int(result["seconds"]))
+            elif result["type"] in (OUTPUT_DISMISS, OUTPUT_JOIN):
+                self._dismiss_alerts()
+        self._changed()
+
+    def will_alert(self, now: Optional[float] = None) -> bool:
         """Certain events will not alert (the user isn't attending, the meeting has ended already,
         the user dismissed the dialog, etc.  This function returns 'True' if this meeting will
         not alert.
+
+        Args:
+            now (float, optional): Current epoch time (shared by a whole update). Defaults to the
+                current time.
         """
         # fmt: off
         if (
             self.dismissed_alerts
-            or self.time_event.has_declined()    
-            or self.time_event.has_ended()    
-            or self._alerter.isRunning()  # Already alerted
+            or self.time_event.declined
+            or self.time_event.has_ended(now)
+            or self.is_alerting()  # Already alerted
         ):
             return False
         # fmt: on
         return True
-
-
-class PopUpAlerterThread(QThread):
-    """Thread to monitor subprocess of an alert dialog."""
-
-    APP_PATH = os.path.join(os.path.dirname(__file__), "pop_up_alert.py")
-    process: subprocess.Popen
-    dismissed_signal = Signal()
-    snooze_signal = Signal(int)
-
-    def __init__(self, time_event: TimeEvent) -> None:
-        super().__init__()
-
-        self.time_event = time_event
-
-    def run(self):
-        """Main function to spawn a dialog and wait for it to be closed."""
-        cmd = ["python", self.APP_PATH]
-        cmd += [
-            self.time_event.summary,
-            self.time_event.start_time.isoformat(),
-            self.time_event.get_video_url(),
-        ]
-        #  If MacOSX, no shell. If Windows, use shell. Linux = ??.  Otherwise pop-ups don't work. Not too sure why.
-        use_shell = sys.platform == "win32"
-        self.process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=use_shell,  # nosec
-        )
-        result = self.process.wait()
-        output = self.process.stdout.read().decode()
-        err = self.process.stderr.read().decode()
-        if result != 0:
-            # Something bad happened. Just alert aga
-            logger.error(err)
-            return
-        else:
-            if len(output.splitlines()) > 1:
-                logger.debug("Closed event, output: %s", output)
-            output = output.splitlines()[-1] if output else ""
-            if output.startswith(OUTPUT_SNOOZE):
-                snooze_time = int(output.split()[-1])
-                self.snooze_signal.emit(snooze_time)
-            elif output.startswith(OUTPUT_DISMISS):
-                self.dismissed_signal.emit()
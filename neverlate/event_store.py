@@ -0,0 +1,331 @@
+"""
+Local cache of the downloaded calendars and events, so we can start up (and alert) offline. Also
+keeps the alert state of the events (alerted, dismissed, snoozed) across restarts.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Optional
+
+from neverlate.utils import app_local_data_dir
+
+logger = logging.getLogger("NeverLate")
+
+# Bump when the tables change. Older databases are discarded (it's only a cache).
+SCHEMA_VERSION = 2
+
+
+class EventStore:
+    """
+    SQLite database mirroring the raw calendar list and event items from the API, along with the
+    sync token of each calendar, and the alert state of the events. Safe to use from the download
+    thread and the main thread.
+    """
+
+    def __init__(self, file_path: Optional[str] = None) -> None:
+        self.file_path = file_path or os.path.join(app_local_data_dir(), "events.db")
+        self._lock = threading.Lock()
+        try:
+            self._connection = self._connect(self.file_path)
+        except sqlite3.OperationalError as err:
+            # Locked, read-only, disk full...: the file itself may well be fine, leave it alone
+            logger.warning("Unable to open the event cache (%s), keeping it in memory", err)
+            self._connection = self._connect(":memory:")
+        except sqlite3.DatabaseError as err:
+            logger.warning("Event cache is corrupt (%s), starting from scratch", err)
+            self._connection = self._recreate()
+
+    def _recreate(self) -> sqlite3.Connection:
+        """Replace the (corrupt) database with an empty one. In memory if that fails too."""
+        try:
+            os.remove(self.file_path)
+            return self._connect(self.file_path)
+        except (OSError, sqlite3.DatabaseError) as err:
+            logger.warning("Unable to recreate the event cache (%s), keeping it in memory", err)
+            return self._connect(":memory:")
+
+    def _connect(self, file_path: str) -> sqlite3.Connection:
+        """Open the database, (re)creating the tables if needed."""
+        connection = sqlite3.connect(file_path, check_same_thread=False)
+        try:
+            self._create_tables(connection)
+        except sqlite3.DatabaseError:
+            connection.close()
+            raise
+        return connection
+
+    @staticmethod
+    def _create_tables(connection: sqlite3.Connection) -> None:
+        """Check the database, and create the tables (dropping those of older versions)."""
+        (result,) = connection.execute("PRAGMA integrity_check").fetchone()
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"integrity check failed: {result}")
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            connection.executescript(
+                """
+                DROP TABLE IF EXISTS calendars;
+                DROP TABLE IF EXISTS events;
+                DROP TABLE IF EXISTS sync_tokens;
+                DROP TABLE IF EXISTS alert_states;
+                DROP TABLE IF EXISTS "values";
+                """
+            )
+        connection.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS calendars (
+                position INTEGER PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, event_id)
+            );
+            CREATE TABLE IF NOT EXISTS sync_tokens (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT NOT NULL,
+                window TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS "values" (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS alert_states (
+                event_key TEXT PRIMARY KEY,
+                has_alerted INTEGER NOT NULL,
+                dismissed INTEGER NOT NULL,
+                snooze_until REAL,
+                end_epoch REAL NOT NULL
+            );
+            PRAGMA user_version = {SCHEMA_VERSION};
+            """
+        )
+        connection.commit()
+
+    def clear(self) -> None:
+        """Remove everything (i.e. the user logged out)."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM calendars")
+            self._connection.execute("DELETE FROM events")
+            self._connection.execute("DELETE FROM sync_tokens")
+            self._connection.execute("DELETE FROM alert_states")
+            self._connection.execute('DELETE FROM "values"')
+
+    def load_calendars(self) -> list[dict[str, Any]]:
+        """
+        Raw calendar list items, in the order they were downloaded.
+
+        Returns:
+            list[dict]
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT data FROM calendars ORDER BY position"
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def save_calendars(self, items: list[dict[str, Any]]) -> None:
+        """
+        Replace the calendar list.
+
+        Args:
+            items (list[dict]): Raw calendar list items from the API.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM calendars")
+            self._connection.executemany(
+                "INSERT INTO calendars (position, data) VALUES (?, ?)",
+                [(idx, json.dumps(item)) for idx, item in enumerate(items)],
+            )
+
+    def load_value(self, key: str, default: Any = None) -> Any:
+        """
+        A value saved with save_value.
+
+        Args:
+            key (str): Name of the value.
+            default (Any, optional): Returned if there's no such value. Defaults to None.
+
+        Returns:
+            Any
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT data FROM "values" WHERE key = ?', (key,)
+            ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def save_value(self, key: str, value: Any) -> None:
+        """
+        Save a (JSON serializable) value, e.g. the ETag of the calendar list.
+
+        Args:
+            key (str): Name of the value.
+            value (Any): Value to save.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO "values" (key, data) VALUES (?, ?)',
+                (key, json.dumps(value)),
+            )
+
+    def load_events(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        Raw event items of all calendars.
+
+        Returns:
+            dict[str, list[dict]]: Calendar ID -> event items.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT calendar_id, data FROM events"
+            ).fetchall()
+            # Calendars that were synced but have no events still need to show up
+            calendar_ids = self._connection.execute(
+                "SELECT calendar_id FROM sync_tokens"
+            ).fetchall()
+        events = {calendar_id: [] for (calendar_id,) in calendar_ids}
+        for calendar_id, data in rows:
+            events.setdefault(calendar_id, []).append(json.loads(data))
+        return events
+
+    def load_sync_tokens(self) -> dict[str, dict[str, str]]:
+        """
+        Sync tokens of the calendars.
+
+        Returns:
+            dict[str, dict[str, str]]: Calendar ID -> {"sync_token": str, "window": str}
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT calendar_id, sync_token, window FROM sync_tokens"
+            ).fetchall()
+        return {
+            calendar_id: {"sync_token": sync_token, "window": window}
+            for calendar_id, sync_token, window in rows
+        }
+
+    def save_events(
+        self,
+        calendar_id: str,
+        items: list[dict[str, Any]],
+        full_sync: bool,
+        sync_token: Optional[str],
+        window: str,
+    ) -> None:
+        """
+        Write through the result of syncing a calendar, along with its new sync token.
+
+        Args:
+            calendar_id (str): Calendar the items belong to.
+            items (list[dict]): Raw event items from the API. Cancelled items are removed.
+            full_sync (bool): The items are all the events of the calendar (replace, don't merge).
+            sync_token (str|None): Token for the next incremental sync.
+            window (str): Time window the sync token belongs to.
+        """
+        with self._lock, self._connection:
+            if full_sync:
+                self._connection.execute(
+                    "DELETE FROM events WHERE calendar_id = ?", (calendar_id,)
+                )
+            for item in items:
+                if item.get("status") == "cancelled":
+                    self._connection.execute(
+                        "DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                        (calendar_id, item["id"]),
+                    )
+                else:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO events (calendar_id, event_id, data) VALUES (?, ?, ?)",
+                        (calendar_id, item["id"], json.dumps(item)),
+                    )
+            if sync_token:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sync_tokens (calendar_id, sync_token, window) VALUES (?, ?, ?)",
+                    (calendar_id, sync_token, window),
+                )
+            else:
+                self._connection.execute(
+                    "DELETE FROM sync_tokens WHERE calendar_id = ?", (calendar_id,)
+                )
+
+    def remove_events(self, calendar_id: str, event_ids: list[str]) -> None:
+        """
+        Remove events (e.g. they're no longer in the time window).
+
+        Args:
+            calendar_id (str): Calendar the events belong to.
+            event_ids (list[str]): Google event IDs.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                [(calendar_id, event_id) for event_id in event_ids],
+            )
+
+    def load_alert_state(self, event_key: str) -> Optional[dict[str, Any]]:
+        """
+        Alert state of an event.
+
+        Args:
+            event_key (str): Identity of the event (TimeEvent.id).
+
+        Returns:
+            dict|None: {"has_alerted": bool, "dismissed": bool, "snooze_until": float|None}. None
+                if the event never alerted.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT has_alerted, dismissed, snooze_until FROM alert_states WHERE event_key = ?",
+                (event_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "has_alerted": bool(row[0]),
+            "dismissed": bool(row[1]),
+            "snooze_until": row[2],
+        }
+
+    def save_alert_state(
+        self,
+        event_key: str,
+        end_epoch: float,
+        has_alerted: bool,
+        dismissed: bool,
+        snooze_until: Optional[float],
+    ) -> None:
+        """
+        Save the alert state of an event.
+
+        Args:
+            event_key (str): Identity of the event (TimeEvent.id).
+            end_epoch (float): End of the event - the state is removed some time after.
+            has_alerted (bool): An alert has been shown.
+            dismissed (bool): The user dismissed the alerts.
+            snooze_until (float|None): Epoch time the alert is snoozed until.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO alert_states "
+                "(event_key, has_alerted, dismissed, snooze_until, end_epoch) VALUES (?, ?, ?, ?, ?)",
+                (event_key, has_alerted, dismissed, snooze_until, end_epoch),
+            )
+
+    def remove_alert_states(self, ended_before: float) -> None:
+        """
+        Remove the alert states of past events.
+
+        Args:
+            ended_before (float): Remove the events that ended before this epoch time.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM alert_states WHERE end_epoch < ?", (ended_before,)
+            )
@@ -1,42 +1,136 @@
 from __future__ import annotations
 
 import datetime
+import functools
+import json
+import logging
+import math
 import os
+import sys
+import threading
 import time
 import traceback
 from pprint import pprint as pp
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
 
 # Google imports
+import httplib2
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import Resource, build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import Resource, build, build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 
-from neverlate.utils import app_local_data_dir, now_datetime
-
-# from googleapiclient.errors import HttpError
+from neverlate.event_store import EventStore
+from neverlate.preferences import PREFERENCES
+from neverlate.retry_policy import (
+    AdaptiveInterval,
+    Backoff,
+    CircuitBreaker,
+    TokenBucket,
+    is_rate_limited,
+    is_retryable,
+    retry_after,
+)
+from neverlate.utils import app_local_data_dir, day_start, now_datetime, pretty_datetime
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 
 EMAIL = None
 
+# HTTP status Google returns when a sync token is no longer valid and a full sync is required
+HTTP_GONE = 410
+# HTTP status of a deleted event (that is no longer kept as a cancelled one)
+HTTP_NOT_FOUND = 404
+# HTTP status of a conditional request (If-None-Match) when the resource didn't change
+HTTP_NOT_MODIFIED = 304
+# Maximum number of requests Google accepts in one batch HTTP request
+BATCH_SIZE = 50
+
+ONE_DAY = datetime.timedelta(days=1)
+
+# Back off from a failing calendar for 1 minute, doubling up to 1 hour (in seconds)
+CALENDAR_BACKOFF_BASE = 60
+CALENDAR_BACKOFF_MAX = 60 * 60
+
+# The calendar list rarely changes: revalidate it this often (in seconds), rather than on every
+# refresh. The user can also refresh it from the preferences.
+CALENDAR_LIST_TTL = 24 * 60 * 60
+
+# Partial responses - only the fields that Calendar and TimeEvent read
+CALENDAR_LIST_FIELDS = (
+    "etag,nextPageToken,items(id,summary,summaryOverride,primary,selected,deleted)"
+)
+EVENT_ITEM_FIELDS = ",".join(
+    (
+        "id",
+        "recurringEventId",
+        "originalStartTime",
+        "status",
+        "summary",
+        "eventType",
+        "start/dateTime",
+        "end/dateTime",
+        "attendees(self,responseStatus)",
+        "conferenceData/entryPoints(entryPointType,uri)",
+    )
+)
+EVENT_FIELDS = f"nextPageToken,nextSyncToken,items({EVENT_ITEM_FIELDS})"
+
+# Request budget (requests per minute). The API quota is per project, shared by all the users.
+REQUEST_BUDGET_PER_MINUTE = 30
+
+# Timeout (in seconds) of single event downloads right before alerting - alerts can't wait long
+EVENT_GET_TIMEOUT = 10
+
+logger = logging.getLogger("NeverLate")
+
+# Keep the raw API data on Calendar and TimeEvent objects (for debugging only - it's bulky)
+KEEP_RAW_DATA = False
+
+_DISCOVERY_DOCUMENT = None  # type: Optional[dict[str, Any]]
+
+
+def _calendar_discovery_document() -> Optional[dict[str, Any]]:
+    """
+    Calendar v3 discovery document shipped with the google API client. Parsed once per process,
+    so logging in again doesn't pay for it again.
+
+    Returns:
+        dict|None: None if the client library doesn't ship the document.
+    """
+    global _DISCOVERY_DOCUMENT  # pylint: disable=global-statement
+    if _DISCOVERY_DOCUMENT is None:
+        document = discovery_cache.get_static_doc("calendar", "v3")
+        if document:
+            _DISCOVERY_DOCUMENT = json.loads(document)
+    return _DISCOVERY_DOCUMENT
+
 
 class Calendar:
     """
     Google calendar data model
     """
 
+    __slots__ = ("_data", "id", "primary", "selected", "summary")
+
     summary: str
     id: str
     primary: bool
     selected: bool  # Is the user displaying the calendary by default
 
     def __init__(self, data: dict[Any, Any]) -> None:
-        self._data = data
-        self.id = data["id"]
+        self.id = sys.intern(data["id"])
+        self.update(data)
+
+    def update(self, data: dict[Any, Any]) -> None:
+        """Update from calendar list data. (Events keep referencing the same Calendar object.)"""
+        self._data = data if KEEP_RAW_DATA else None  # type: Optional[dict[Any, Any]]
         self.primary = data.get("primary", False)
         self.summary = data.get("summaryOverride", data.get("summary", "<No Title>"))
         if self.primary:
@@ -65,9 +159,41 @@ class Calendar:
 class TimeEvent:
     """
     Calendar event data model for time-based events (not all day events).
+
+    Everything needed is extracted from the API data up front, and the (bulky) API data is dropped
+    unless KEEP_RAW_DATA is on.
     """
 
+    __slots__ = (
+        "_event",
+        "calendar",
+        "declined",
+        "end_epoch",
+        "end_time",
+        "event_id",
+        "id",
+        "response_status",
+        "start_epoch",
+        "start_time",
+        "summary",
+        "time_range_label",
+        "version",
+        "video_url",
+    )
+
     calendar: Calendar
+    id: str  # Identity: calendar + event + recurring instance. Doesn't change when the event does.
+    event_id: str  # Google's event ID
+    version: int  # Hash of the content we use - changes when the event does (e.g. it moved)
+    summary: str
+    start_time: datetime.datetime
+    end_time: datetime.datetime
+    start_epoch: float  # start_time as a timestamp
+    end_epoch: float  # end_time as a timestamp
+    video_url: str  # Empty if the event has no video conference
+    response_status: str  # The user's response (accepted, declined...). Empty if not an attendee
+    declined: bool  # The user declined the event
+    time_range_label: str  # e.g. "9:00 - 9:30 AM"
 
     def __init__(self, item: dict[Any, Any], calendar: Calendar):
         """
@@ -88,20 +214,45 @@ class TimeEvent:
         ):
             raise ValueError("Invalid data type - not a calendar event")
         self.calendar = calendar
-        self._event = item  # type: dict[str, Any]
-        self.summary = self._event.get("summary", "<No Title>")
+        self._event = item if KEEP_RAW_DATA else None  # type: Optional[dict[str, Any]]
+        self.summary = item.get("summary", "<No Title>")
 
         # Get start and end times as datetime objects
-        st_time = self._event["start"]["dateTime"]
+        st_time = item["start"]["dateTime"]
         self.start_time = datetime.datetime.fromisoformat(st_time)
         # self.start_time = datetime.datetime.strptime(st_time[:19], "%Y-%m-%dT%H:%M:%S")
-        end_time = self._event["end"]["dateTime"]
+        end_time = item["end"]["dateTime"]
         self.end_time = datetime.datetime.fromisoformat(end_time)
+        self.start_epoch = self.start_time.timestamp()
+        self.end_epoch = self.end_time.timestamp()
+
+        self.video_url = self._find_video_url(item)
+        self.response_status = ""
+        for attendee in item.get("attendees", []):
+            # Only the user is included (maxAttendees=1)
+            self.response_status = attendee.get("responseStatus", "")
+            break
+        self.declined = self.response_status == "declined"
+
+        start_label = pretty_datetime(self.start_time).split()[0]
+        self.time_range_label = f"{start_label} - {pretty_datetime(self.end_time)}"
+
+        self.event_id = item["id"]
+        original_start = item.get("originalStartTime", {})
         self.id = "::".join(
             (
-                self._event["id"],
-                self.start_time.isoformat(),
-                self.get_video_url(),
+                calendar.id,
+                item.get("recurringEventId", self.event_id),
+                original_start.get("dateTime", original_start.get("date", "")),
+            )
+        )
+        self.version = hash(
+            (
+                self.summary,
+                self.start_epoch,
+                self.end_epoch,
+                self.video_url,
+                self.response_status,
             )
         )
 
@@ -128,11 +279,10 @@ class TimeEvent:
             + ">"
         )
 
-    def get_seconds_till_event(self) -> float:
-        return (self.start_time - now_datetime()).total_seconds()
-
-    def get_video_url(self) -> str:
-        entry_points = self._event.get("conferenceData", {}).get("entryPoints", [])
+    @staticmethod
+    def _find_video_url(item: dict[Any, Any]) -> str:
+        """Video conference URL of an event item."""
+        entry_points = item.get("conferenceData", {}).get("entryPoints", [])
         for entry_point in entry_points:
             if entry_point.get("entryPointType", "") == "video":
                 return entry_point["uri"]
@@ -143,14 +293,102 @@ class TimeEvent:
                 return entry_point.get("uri")
         return ""
 
+    def get_seconds_till_event(self, now: Optional[float] = None) -> float:
+        return self.start_epoch - (time.time() if now is None else now)
+
+    def get_video_url(self) -> str:
+        return self.video_url
+
     def has_declined(self) -> bool:
-        for attendee in self._event.get("attendees", []):
-            # if attendee["email"] == "bwalters@wayfair.com":
-            return attendee["responseStatus"] == "declined"
-        return False
+        return self.declined
+
+    def has_ended(self, now: Optional[float] = None) -> bool:
+        """
+        Args:
+            now (float, optional): Current epoch time (i.e. shared by a whole update). Defaults to
+                the current time.
+        """
+        return self.end_epoch < (time.time() if now is None else now)
+
+
+class _GzipHttp:
+    """
+    Wraps an http object so batch requests ask for a gzipped response. (The API client only does
+    this for the individual requests inside the batch, not for the batch request itself.)
+    """
+
+    def __init__(self, http: Any) -> None:
+        self._http = http
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._http, name)
+
+    def request(self, uri: str, method: str = "GET", body=None, headers=None, **kwargs):
+        """Send the request, asking for a gzipped response."""
+        headers = dict(headers or {})
+        headers["accept-encoding"] = "gzip, deflate"
+        # Google only compresses responses for user agents that include "gzip"
+        headers["user-agent"] = (headers.get("user-agent", "") + " (gzip)").strip()
+        return self._http.request(uri, method, body=body, headers=headers, **kwargs)
 
-    def has_ended(self) -> bool:
-        return (self.end_time - now_datetime()).total_seconds() < 0
+
+class _SyncJob:
+    """
+    Progress of syncing the events of one calendar, which may take several batch requests.
+
+    An incremental sync first downloads the changes since the sync token was issued, then the
+    days that entered the window since the last sync (if any).
+    """
+
+    def __init__(
+        self,
+        calendar: Calendar,
+        window: str,
+        sync_token: Optional[str] = None,
+        new_days: Optional[tuple[datetime.datetime, datetime.datetime]] = None,
+    ) -> None:
+        self.calendar = calendar
+        self.window = window  # Days being synced (see window_key)
+        self.sync_token = sync_token  # None = full sync
+        self.new_days = new_days  # Time range that entered the window. Incremental syncs only.
+        self.fetching_new_days = False  # The changes are in, downloading the new days
+        self.next_sync_token = None  # type: Optional[str]  # From the changes
+        self.page_token = None  # type: Optional[str]
+        self.items = []  # type: list[dict[str, Any]]
+        self.done = False
+
+    def restart(self, window: str) -> None:
+        """Restart as a full sync of the window (i.e. the sync token expired)."""
+        self.window = window
+        self.sync_token = None
+        self.new_days = None
+        self.fetching_new_days = False
+        self.next_sync_token = None
+        self.page_token = None
+        self.items = []
+
+
+def window_key(first_day: datetime.date, last_day: datetime.date) -> str:
+    """Key of the days synced with a sync token, e.g. '2024-01-01/2024-01-02'."""
+    return f"{first_day.isoformat()}/{last_day.isoformat()}"
+
+
+def parse_window_key(key: str) -> Optional[tuple[datetime.date, datetime.date]]:
+    """First & last day of a window key. None if it's not a valid key (e.g. an old format)."""
+    try:
+        first_day, last_day = key.split("/")
+        return (
+            datetime.date.fromisoformat(first_day),
+            datetime.date.fromisoformat(last_day),
+        )
+    except ValueError:
+        return None
+
+
+def window_times(key: str) -> tuple[datetime.datetime, datetime.datetime]:
+    """Start of the first day & end of the last day of a (valid) window key."""
+    first_day, last_day = parse_window_key(key)
+    return day_start(first_day), day_start(last_day + ONE_DAY)
 
 
 class GoogleCalDownloader:  # (QObject):
@@ -165,13 +403,44 @@ class GoogleCalDownloader:  # (QObject):
 
     def __init__(self):
         super().__init__()
-        self.service = None
-        # self.service = build("calendar", "v3", credentials=self.creds)  # type: Resource
+        self._credentials = None  # type: Optional[Credentials]
+        self._service = None  # type: Optional[Resource]
+        self._service_lock = threading.Lock()
+        # The API client's http connection can't be shared between threads (e.g. the refresh and
+        # the agenda downloading days)
+        self._request_lock = threading.RLock()
         self._cred_file_path = os.path.join(
             os.path.dirname(__file__), "credentials.json"
         )
 
         self.user_token_file_path = os.path.join(app_local_data_dir(), "token.json")
+        self.store = EventStore()
+
+        # Incremental sync state. Calendar ID -> {"sync_token": str, "window": str (window_key)}
+        self._sync_tokens = {}  # type: dict[str, dict[str, str]]
+        # Calendar ID -> event ID -> event. Only calendars that have been synced are present.
+        self._calendar_events = {}  # type: dict[str, dict[str, TimeEvent]]
+        # Calendar list cache: ETag to revalidate it with, and when it was last (re)validated
+        self._calendar_list_etag = None  # type: Optional[str]
+        self._calendar_list_time = 0.0
+        self._calendar_list_backoff = Backoff(CALENDAR_BACKOFF_BASE, CALENDAR_BACKOFF_MAX)
+
+        # Refresh cadence: calendars that change often are synced more often
+        self.refresh_limits = (
+            PREFERENCES.download_cal_freq * 60,
+            PREFERENCES.download_cal_max_interval * 60,
+        )  # type: tuple[float, float]  # Seconds between syncs of a calendar: floor, ceiling
+        self._cadences = {}  # type: dict[str, AdaptiveInterval]  # Calendar ID -> cadence
+
+        # Failure handling
+        self.circuit_breaker = CircuitBreaker()
+        self._calendar_backoffs = {}  # type: dict[str, Backoff]  # Calendar ID -> backoff
+        self._rate_limit_error = None  # type: Optional[Exception]  # During a refresh
+
+        # Request budget: when it runs short, calendars with imminent events are synced first
+        self.request_budget = TokenBucket(REQUEST_BUDGET_PER_MINUTE)
+        self.deferred_calendars = []  # type: list[Calendar]  # Waiting for budget
+        self.deferred_count = 0  # Calendar syncs deferred in total
 
     def logout(self):
         """
@@ -180,7 +449,37 @@ class GoogleCalDownloader:  # (QObject):
         if os.path.exists(self.user_token_file_path):
             os.remove(self.user_token_file_path)
 
-        self.service = None
+        # Sync state belongs to the logged out user
+        self._sync_tokens.clear()
+        self._calendar_events.clear()
+        self._calendar_list_etag = None
+        self._calendar_list_time = 0.0
+        self._calendar_list_backoff.record_success()
+        self.store.clear()
+
+        self._credentials = None
+        self._service = None
+
+    @property
+    def service(self) -> Resource:
+        """
+        The calendar API client. Built the first time it's needed (normally in the download
+        thread), so logging in doesn't block the UI.
+        """
+        with self._service_lock:
+            if self._service is None:
+                if self._credentials is None:
+                    raise RuntimeError("Not logged in")
+                document = _calendar_discovery_document()
+                if document is not None:
+                    self._service = build_from_document(
+                        document, credentials=self._credentials
+                    )
+                else:
+                    self._service = build(
+                        "calendar", "v3", credentials=self._credentials
+                    )
+            return self._service
 
     def login(self, require_existing_credentials: bool = False) -> bool:
         """Gets google authentication credentails."""
@@ -197,7 +496,9 @@ class GoogleCalDownloader:  # (QObject):
             with open(self.user_token_file_path, "w") as token_file:
                 token_file.write(creds.to_json())
 
-        self.service = build("calendar", "v3", credentials=creds)  # type: Resource
+        # The API client is built lazily, see `service`
+        self._credentials = creds
+        self._service = None
         return True
 
     def get_existing_credentials(self) -> Credentials | None:
@@ -224,8 +525,99 @@ class GoogleCalDownloader:  # (QObject):
             except RefreshError:
                 return None
 
+    def load_cache(self, is_visible: Callable[[Calendar], bool]) -> None:
+        """
+        Load the calendars and events from the local cache, so we have something to show (and
+        alert about) before the first download finishes, or if the network is down.
+
+        Args:
+            is_visible (Callable[[Calendar], bool]): Whether a calendar's events should be used.
+        """
+        self._set_calendars({"items": self.store.load_calendars()})
+        calendar_list = self.store.load_value("calendar_list", {})
+        self._calendar_list_etag = calendar_list.get("etag")
+        self._calendar_list_time = calendar_list.get("time", 0.0)
+        calendars = {cal.id: cal for cal in self.calendars}
+        for calendar_id, items in self.store.load_events().items():
+            calendar = calendars.get(calendar_id)
+            if calendar is None:
+                continue
+            events = {}  # type: dict[str, TimeEvent]
+            self._apply_event_items(calendar, events, items)
+            self._calendar_events[calendar_id] = events
+        self._sync_tokens = self.store.load_sync_tokens()
+        self.events = self._gather_events(
+            [cal for cal in self.calendars if is_visible(cal)]
+        )
+
+    def execute_request(self, request: HttpRequest) -> Any:
+        """
+        Execute a single API request (e.g. watching a calendar), charged to the request budget.
+        The connection can't be shared between threads - don't call `request.execute()` directly.
+        Being rate limited slows down the refreshes too (see circuit_breaker).
+
+        Args:
+            request (HttpRequest): Request to execute.
+
+        Returns:
+            Any: The response.
+        """
+        with self._request_lock:
+            self.request_budget.spend(time.time())
+            try:
+                return request.execute()
+            except HttpError as err:
+                if is_rate_limited(err):
+                    self.circuit_breaker.record_failure(time.time(), err)
+                raise
+
     def update_calendars(self) -> None:
-        result = self.service.calendarList().list().execute()
+        """Download the calendar list, unless it didn't change."""
+        with self._request_lock:
+            try:
+                self.request_budget.spend(time.time())
+                response = self._calendar_list_request().execute()
+            except HttpError as err:
+                self._on_calendar_list("", {}, err)
+                return
+        self._on_calendar_list("", response, None)
+
+    def calendar_list_expired(self, now: Optional[float] = None) -> bool:
+        """
+        Whether the cached calendar list should be revalidated.
+
+        Args:
+            now (float, optional): Current epoch time. Defaults to the current time.
+        """
+        if now is None:
+            now = time.time()
+        return now >= self.calendar_list_due()
+
+    def calendar_list_due(self) -> float:
+        """Epoch time the calendar list should be revalidated. Later after failed downloads."""
+        return max(
+            self._calendar_list_time + CALENDAR_LIST_TTL,
+            self._calendar_list_backoff.next_attempt,
+        )
+
+    def expire_calendar_list(self) -> None:
+        """Revalidate the calendar list with the next refresh (e.g. the user asked for it)."""
+        self._calendar_list_time = 0.0
+        self._calendar_list_backoff.record_success()
+
+    def _calendar_list_request(self) -> HttpRequest:
+        """Request for the calendar list. Conditional if we have it already."""
+        request = self.service.calendarList().list(  # type: ignore
+            fields=CALENDAR_LIST_FIELDS
+        )
+        if self._calendar_list_etag and self.calendars:
+            request.headers["If-None-Match"] = self._calendar_list_etag
+        return request
+
+    def _set_calendars(self, result: dict[str, Any]) -> None:
+        """Set the calendars from a calendarList().list() response."""
+        # Reuse the existing Calendar objects, so events don't hold on to stale duplicates
+        existing = {cal.id: cal for cal in self.calendars}
         cal_ids = []
         for cal in result["items"]:
             if 0:
@@ -234,70 +626,750 @@ class GoogleCalDownloader:  # (QObject):
                 continue
             if cal.get("deleted"):
                 continue
-            cal = Calendar(cal)
-            cal_ids.append(cal)
+            calendar = existing.get(cal["id"])
+            if calendar is None:
+                calendar = Calendar(cal)
+            else:
+                calendar.update(cal)
+            cal_ids.append(calendar)
 
         self.calendars = cal_ids
 
+    def refresh(
+        self,
+        is_visible: Callable[[Calendar], bool],
+        calendar_ids: Optional[set[str]] = None,
+        force: bool = False,
+    ) -> None:
+        """
+        Sync the events of the visible calendars that are due (see next_calendar_refresh),
+        revalidating the calendar list if it expired (see CALENDAR_LIST_TTL). The calendar list
+        and the events are requested in the same batch, so a refresh normally costs a single round
+        trip (two if new calendars showed up).
+
+        Args:
+            is_visible (Callable[[Calendar], bool]): Whether a calendar's events should be synced.
+            calendar_ids (set[str], optional): Only sync these calendars (e.g. a push notification
+                said they changed), without downloading the calendar list. Defaults to a full
+                refresh.
+            force (bool, optional): Sync all the visible calendars, due or not (e.g. the user
+                asked for it). Defaults to False.
+        """
+        now = time.time()
+        self._rate_limit_error = None
+        try:
+            with self._request_lock:
+                self._refresh(is_visible, calendar_ids, force)
+        except RefreshError:
+            # Credential issue, the user needs to log in again
+            raise
+        except Exception as err:
+            self.circuit_breaker.record_failure(now, err)
+            raise
+        if self._rate_limit_error is not None:
+            # Some of the requests were rejected - the whole app needs to slow down
+            self.circuit_breaker.record_failure(now, self._rate_limit_error)
+        elif calendar_ids is None:
+            self.circuit_breaker.record_success()
+
+    def _refresh(
+        self,
+        is_visible: Callable[[Calendar], bool],
+        calendar_ids: Optional[set[str]],
+        force: bool,
+    ) -> None:
+        """See `refresh`."""
+        self._drop_past_events()
+        window = window_key(*self._window_days())
+        visible_calendars = [cal for cal in self.calendars if is_visible(cal)]
+        if calendar_ids is not None:
+            self._execute_sync_jobs(
+                self._budget_jobs(
+                    self._sync_jobs(
+                        [cal for cal in visible_calendars if cal.id in calendar_ids], window
+                    )
+                )
+            )
+            self.events = self._gather_events(visible_calendars)
+            return
+
+        now = time.time()
+        due_calendars = [
+            cal
+            for cal in visible_calendars
+            if force or self.next_calendar_refresh(cal, now) <= now
+        ]
+        include_calendar_list = self.calendar_list_expired(now)
+        self._execute_sync_jobs(
+            self._budget_jobs(self._sync_jobs(due_calendars, window), int(include_calendar_list)),
+            include_calendar_list=include_calendar_list,
+        )
+
+        # Calendars that were just added to the calendar list
+        known_ids = {cal.id for cal in visible_calendars}
+        new_jobs = self._budget_jobs(
+            self._sync_jobs(
+                [cal for cal in self.calendars if is_visible(cal) and cal.id not in known_ids],
+                window,
+            )
+        )
+        if new_jobs:
+            self._execute_sync_jobs(new_jobs)
+
+        self._finish_update([cal for cal in self.calendars if is_visible(cal)])
+
+    def next_update_time(self, is_visible: Callable[[Calendar], bool]) -> float:
+        """
+        Epoch time the next refresh should happen: when the first calendar (or the calendar
+        list) is due, backing off after failed refreshes.
+
+        Args:
+            is_visible (Callable[[Calendar], bool]): Whether a calendar's events are synced.
+
+        Returns:
+            float
+        """
+        if self.circuit_breaker.backoff.failures:
+            return self.circuit_breaker.next_attempt
+        return min(
+            [self.next_calendar_refresh(cal) for cal in self.calendars if is_visible(cal)]
+            + [self.calendar_list_due()]
+        )
+
+    def next_calendar_refresh(self, calendar: Calendar, now: Optional[float] = None) -> float:
+        """
+        Epoch time a calendar is due to be synced. Calendars that changed recently are synced
+        more often (see refresh_limits). Later if the calendar is backing off after failures, or
+        waiting for the request budget.
+
+        Args:
+            calendar (Calendar): Calendar to sync.
+            now (float, optional): Current epoch time. Defaults to the current time.
+        """
+        if calendar in self.deferred_calendars:
+            # Was due already: as soon as the budget can pay for a sync
+            next_time = self.request_budget.next_available(time.time() if now is None else now)
+        else:
+            next_time = self._cadence(calendar.id).next_time
+        backoff = self._calendar_backoffs.get(calendar.id)
+        if backoff is not None:
+            next_time = max(next_time, backoff.next_attempt)
+        return next_time
+
+    def next_event_start(self, calendar: Calendar, now: float) -> float:
+        """
+        Epoch time the next (or current) cached event of a calendar starts. Infinity if there's
+        none, `now` if the calendar was never synced (its events could be anything).
+        """
+        events = self._calendar_events.get(calendar.id)
+        if events is None:
+            return now
+        return min(
+            (event.start_epoch for event in events.values() if event.end_epoch > now),
+            default=math.inf,
+        )
+
+    def _budget_jobs(self, jobs: list[_SyncJob], reserved: int = 0) -> list[_SyncJob]:
+        """
+        The sync jobs the request budget allows (a job costs a request per page). If the budget
+        is short, calendars with imminent events go first, then the others in order of their next
+        event while the budget lasts. The rest wait for the budget to refill.
+
+        Args:
+            jobs (list[_SyncJob]): Jobs to run.
+            reserved (int, optional): Requests needed besides the jobs (e.g. the calendar list).
+                Defaults to 0.
+
+        Returns:
+            list[_SyncJob]: Jobs to run now. The calendars of the others are deferred_calendars.
+        """
+        now = time.time()
+        budget = self.request_budget.available(now) - reserved
+        job_calendars = {job.calendar for job in jobs}
+        # Calendars that aren't due anymore (or got synced by a push) aren't waiting
+        self.deferred_calendars = [
+            cal for cal in self.deferred_calendars if cal not in job_calendars
+        ]
+        if budget >= len(jobs):
+            return jobs
+
+        # Never synced calendars count as imminent: their events could be anything
+        starts = {job.calendar.id: self.next_event_start(job.calendar, now) for job in jobs}
+        granted = []
+        for job in sorted(jobs, key=lambda job: starts[job.calendar.id]):
+            if budget >= 1:
+                granted.append(job)
+                budget -= 1
+            else:
+                self.deferred_calendars.append(job.calendar)
+        self.deferred_count += len(jobs) - len(granted)
+        logger.info(
+            "Request budget is short (%.1f requests left), deferred syncing %s",
+            self.request_budget.available(now),
+            ", ".join(str(cal) for cal in self.deferred_calendars),
+        )
+        return granted
+
+    def set_refresh_limits(self, floor: float, ceiling: float) -> None:
+        """
+        Set the minimum & maximum seconds between syncs of a calendar.
+
+        Args:
+            floor (float): Seconds between syncs of calendars that change all the time.
+            ceiling (float): Seconds between syncs of calendars that never change.
+        """
+        if self.refresh_limits == (floor, ceiling):
+            return
+        self.refresh_limits = (floor, ceiling)
+        for cadence in self._cadences.values():
+            cadence.set_limits(floor, ceiling)
+
+    def _cadence(self, calendar_id: str) -> AdaptiveInterval:
+        """Refresh cadence of a calendar."""
+        cadence = self._cadences.get(calendar_id)
+        if cadence is None:
+            cadence = AdaptiveInterval(*self.refresh_limits)
+            self._cadences[calendar_id] = cadence
+        return cadence
+
     def update_events(self, calendars: Optional[list[Calendar]] = None) -> None:
-        events = []
+        """
+        Incrementally sync the events of the calendars. Only changes since the previous sync are
+        downloaded, unless a calendar has not been synced yet or its sync token expired.
+
+        Args:
+            calendars (list[Calendar], optional): Calendars to sync. Defaults to all calendars.
+        """
         if calendars is None:
             calendars = self.calendars
 
-        for calendar in calendars:
-            events += self.get_events(calendar)
-        self.events = events
+        window = window_key(*self._window_days())
+        with self._request_lock:
+            self._drop_past_events()
+            self._execute_sync_jobs(self._budget_jobs(self._sync_jobs(calendars, window)))
+        self._finish_update(calendars)
+
+    def _finish_update(self, calendars: list[Calendar]) -> None:
+        """Gather the events of the synced calendars."""
+        self.events = self._gather_events(calendars)
         self.last_update_time = time.time()
         # self.events_gathered_signal.emit()
 
-    def get_events(self, calendar: Calendar) -> list[TimeEvent]:
-        """Get amazing events.
+    def _gather_events(self, calendars: list[Calendar]) -> list[TimeEvent]:
+        """Events of the calendars in the current time window."""
+        time_min, time_max = self._event_window()
+        events = []
+        for calendar in calendars:
+            for event in self._calendar_events.get(calendar.id, {}).values():
+                # Sync deltas are not bound to the time window - only keep the relevant events
+                if event.end_time > time_min and event.start_time < time_max:
+                    events.append(event)
+        return events
 
-        Args:
-            calendar (Calendar): calendar to get events from.
+    def _sync_jobs(self, calendars: list[Calendar], window: str) -> list[_SyncJob]:
+        """Jobs to sync the calendars, skipping calendars backing off after failures."""
+        now = time.time()
+        jobs = []
+        for calendar in calendars:
+            backoff = self._calendar_backoffs.get(calendar.id)
+            if backoff is not None and not backoff.ready(now):
+                logger.debug("Skipping %s (backing off after failures)", calendar)
+                continue
+            jobs.append(self._sync_job(calendar, window))
+        return jobs
 
-        Returns:
-            list[TimeEvent]
+    def _sync_job(self, calendar: Calendar, window: str) -> _SyncJob:
+        """
+        Create the job to sync a calendar. Incremental if we have a valid sync token for the
+        calendar's cached events, also downloading the days that entered the window since.
+        Otherwise a full sync of the time window.
         """
-        # Call the Calendar API
+        state = self._sync_tokens.get(calendar.id)
+        if not state or calendar.id not in self._calendar_events:
+            return _SyncJob(calendar, window)
+        synced = parse_window_key(state.get("window", ""))
+        first_day, last_day = parse_window_key(window)
+        if synced is None or not synced[0] <= first_day <= synced[1]:
+            # Nothing synced is still in the window
+            return _SyncJob(calendar, window)
+        if last_day <= synced[1]:
+            # All the days were synced already
+            return _SyncJob(calendar, window_key(first_day, synced[1]), state["sync_token"])
+        new_days = (day_start(synced[1] + ONE_DAY), day_start(last_day + ONE_DAY))
+        return _SyncJob(calendar, window, state["sync_token"], new_days)
 
-        # now_ = datetime.datetime.utcnow().isoformat() + "Z"  # 'Z' indicates UTC time
-        # time_min = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        # time_max = now.replace(hour=23, minute=59, second=59, microsecond=0)
-        now_ = now_datetime()
-        time_min = now_.replace(hour=0, minute=0, second=0)
-        time_max = now_.replace(hour=23, minute=59, second=59)
-        # print("Cal:", calendar.summary, "---", calendar.id)
-        events_query = self.service.events().list(  # type: ignore
-            calendarId=calendar.id,
-            maxAttendees=1,
-            timeMin=time_min.isoformat(),
-            timeMax=time_max.isoformat(),
-            maxResults=250,
-            singleEvents=True,
-            # orderBy="startTime",
+    def _execute_sync_jobs(
+        self, jobs: list[_SyncJob], include_calendar_list: bool = False
+    ) -> None:
+        """
+        Run the sync jobs as batch HTTP requests. Each round of batches requests the next page of
+        every unfinished job. A failing calendar is logged and keeps its previous events, without
+        affecting the other calendars.
+
+        Args:
+            jobs (list[_SyncJob]): Jobs to run.
+            include_calendar_list (bool, optional): Also download the calendar list in the first
+                batch. Defaults to False.
+        """
+        pending = list(jobs)
+        while pending or include_calendar_list:
+            requests = []  # type: list[tuple[HttpRequest, Callable[..., None]]]
+            if include_calendar_list:
+                requests.append((self._calendar_list_request(), self._on_calendar_list))
+                include_calendar_list = False
+            for job in pending:
+                requests.append(
+                    (
+                        self._events_list_request(job),
+                        functools.partial(self._on_events_page, job),
+                    )
+                )
+
+            # Pages of syncs in progress are always fetched - they may overdraw the budget
+            self.request_budget.spend(time.time(), len(requests))
+            for start in range(0, len(requests), BATCH_SIZE):
+                batch = self.service.new_batch_http_request()  # type: ignore
+                for request, callback in requests[start : start + BATCH_SIZE]:
+                    batch.add(request, callback=callback)
+                batch.execute(http=_GzipHttp(requests[start][0].http))
+            pending = [job for job in pending if not job.done]
+
+    def _events_list_request(self, job: _SyncJob) -> HttpRequest:
+        """Request for the next page of events of a sync job."""
+        if job.fetching_new_days:
+            query = self._events_query(
+                job.calendar, page_token=job.page_token, time_window=job.new_days
+            )
+        else:
+            query = self._events_query(job.calendar, job.sync_token, job.page_token)
+        return self.service.events().list(**query)  # type: ignore
+
+    def _on_calendar_list(
+        self, _request_id: str, response: dict[str, Any], exception: Exception | None
+    ) -> None:
+        """Batch callback for the calendar list."""
+        if exception is not None:
+            if (
+                isinstance(exception, HttpError)
+                and exception.resp.status == HTTP_NOT_MODIFIED
+            ):
+                logger.debug("The calendar list didn't change")
+                self._calendar_list_validated()
+                return
+            # Keep the previous calendars, and don't ask again right away
+            if is_rate_limited(exception):
+                self._rate_limit_error = exception
+            backoff = self._calendar_list_backoff
+            if is_retryable(exception):
+                delay = backoff.record_failure(time.time(), retry_after(exception))
+            else:
+                delay = backoff.record_failure(time.time(), backoff.maximum)
+            logger.error(
+                "Unable to download the calendar list (next try in %d seconds): %s",
+                delay,
+                exception,
+            )
+            return
+        self._set_calendars(response)
+        self.store.save_calendars(response["items"])
+        self._calendar_list_etag = response.get("etag")
+        self._calendar_list_validated()
+
+    def _calendar_list_validated(self) -> None:
+        """The calendar list is up to date - don't revalidate it until it expires."""
+        self._calendar_list_time = time.time()
+        self._calendar_list_backoff.record_success()
+        self.store.save_value(
+            "calendar_list",
+            {"etag": self._calendar_list_etag, "time": self._calendar_list_time},
+        )
+
+    def _on_events_page(
+        self,
+        job: _SyncJob,
+        _request_id: str,
+        response: dict[str, Any],
+        exception: Exception | None,
+    ) -> None:
+        """Batch callback for a page of events of a sync job."""
+        if exception is not None:
+            if (
+                isinstance(exception, HttpError)
+                and exception.resp.status == HTTP_GONE
+                and job.sync_token
+            ):
+                logger.debug("Sync token expired for %s, doing a full sync", job.calendar)
+                job.restart(window_key(*self._window_days()))
+            else:
+                self._sync_failed(job, exception)
+            return
+
+        job.items += response.get("items", [])
+        job.page_token = response.get("nextPageToken")
+        if job.page_token:
+            return
+
+        if job.new_days is not None and not job.fetching_new_days:
+            # Got the changes, now download the days that entered the window
+            job.fetching_new_days = True
+            job.next_sync_token = response.get("nextSyncToken")
+            return
+
+        # Last page
+        job.done = True
+        calendar = job.calendar
+        self._calendar_backoffs.pop(calendar.id, None)
+        previous = self._calendar_events.get(calendar.id)
+        previous_versions = None if previous is None else self._event_versions(previous)
+        if job.sync_token:
+            events = self._calendar_events[calendar.id]
+        else:
+            events = {}
+            self._calendar_events[calendar.id] = events
+        # Sync deltas are not bound to the time window: drop the events outside of it
+        self._apply_event_items(calendar, events, job.items, window_times(job.window))
+        changed = previous_versions != self._event_versions(events)
+        delay = self._cadence(calendar.id).record(time.time(), changed)
+        logger.debug(
+            "Synced %s (%s), next sync in %d seconds",
+            calendar,
+            "changed" if changed else "unchanged",
+            delay,
         )
-        events_result = events_query.execute()
+        # The sync token is only included on the last page (of the changes)
+        if job.fetching_new_days:
+            sync_token = job.next_sync_token
+        else:
+            sync_token = response.get("nextSyncToken")
+        self._set_sync_token(calendar, sync_token, job.window)
+        items = [
+            item if item["id"] in events else {"id": item["id"], "status": "cancelled"}
+            for item in job.items
+        ]
+        self.store.save_events(calendar.id, items, not job.sync_token, sync_token, job.window)
 
-        # pp(events_result)
-        # print("   Items:", len(events_result["items"]))
+    def _sync_failed(self, job: _SyncJob, exception: Exception) -> None:
+        """
+        Syncing a calendar failed. Back off from that calendar only - a broken (e.g. shared)
+        calendar shouldn't hold up the others.
+        """
+        job.done = True
+        if is_rate_limited(exception):
+            self._rate_limit_error = exception
+        backoff = self._calendar_backoffs.setdefault(
+            job.calendar.id, Backoff(CALENDAR_BACKOFF_BASE, CALENDAR_BACKOFF_MAX)
+        )
+        if is_retryable(exception):
+            delay = backoff.record_failure(time.time(), retry_after(exception))
+        else:
+            delay = backoff.record_failure(time.time(), backoff.maximum)
+        logger.error(
+            "Unable to sync events for %s (next try in %d seconds): %s",
+            job.calendar,
+            delay,
+            exception,
+        )
+
+    @staticmethod
+    def _event_versions(events: dict[str, TimeEvent]) -> frozenset[tuple[str, int]]:
+        """Content hashes of events, to tell whether a sync changed anything."""
+        return frozenset((id_, event.version) for id_, event in events.items())
 
-        items = events_result.get("items", [])
-        result = []
-        # Prints the start and name of the next 10 events
+    @staticmethod
+    def _apply_event_items(
+        calendar: Calendar,
+        events: dict[str, TimeEvent],
+        items: list[dict[str, Any]],
+        time_window: Optional[tuple[datetime.datetime, datetime.datetime]] = None,
+    ) -> None:
+        """
+        Apply downloaded event items (inserted, updated or cancelled) to a calendar's events.
+
+        Args:
+            calendar (Calendar): Calendar the items belong to.
+            events (dict[str, TimeEvent]): Event ID -> event. Modified in place.
+            items (list[dict]): Raw event items from the API.
+            time_window (tuple[datetime, datetime], optional): Events outside of this window are
+                removed. Defaults to keeping all the events.
+        """
         for item in items:
+            if item.get("status") == "cancelled":
+                events.pop(item["id"], None)
+                continue
             try:
                 event = TimeEvent(item, calendar)
             except ValueError:
-                #  print("Invalid event", item.get("summary", "<No Title>"))
+                # No longer (or never was) a timed event
+                events.pop(item["id"], None)
                 continue
             except:
                 # Unknown error needs to be handled
                 print(traceback.format_exc())
                 continue
-            result.append(event)
+            if time_window is None or (
+                event.end_time > time_window[0] and event.start_time < time_window[1]
+            ):
+                events[item["id"]] = event
+            else:
+                events.pop(item["id"], None)
+
+    @staticmethod
+    def _window_days() -> tuple[datetime.date, datetime.date]:
+        """
+        First & last day that events are downloaded for: today, through the end of the
+        look-ahead horizon. (Early meetings of the next day are known well before midnight.)
+        """
+        now_ = now_datetime()
+        horizon = now_ + datetime.timedelta(hours=PREFERENCES.look_ahead_hours)
+        return now_.date(), horizon.date()
+
+    @classmethod
+    def _event_window(cls) -> tuple[datetime.datetime, datetime.datetime]:
+        """Time window that events are downloaded for (see _window_days)."""
+        first_day, last_day = cls._window_days()
+        return day_start(first_day), day_start(last_day + ONE_DAY)
+
+    def _drop_past_events(self) -> None:
+        """Forget the events that ended before the window (i.e. after midnight)."""
+        time_min = self._event_window()[0]
+        for calendar_id, events in self._calendar_events.items():
+            past = [id_ for id_, event in events.items() if event.end_time <= time_min]
+            for id_ in past:
+                del events[id_]
+            if past:
+                self.store.remove_events(calendar_id, past)
 
-        return result
+    def _set_sync_token(
+        self, calendar: Calendar, sync_token: Optional[str], window: str
+    ) -> None:
+        """Remember the token for the next incremental sync of a calendar."""
+        if sync_token:
+            self._sync_tokens[calendar.id] = {"sync_token": sync_token, "window": window}
+        else:
+            self._sync_tokens.pop(calendar.id, None)
+
+    def iter_events(
+        self,
+        calendar: Calendar,
+        max_pages: Optional[int] = None,
+        time_window: Optional[tuple[datetime.datetime, datetime.datetime]] = None,
+    ) -> Iterator[TimeEvent]:
+        """
+        Iterate over the events of a calendar, following the page tokens. Events are yielded as
+        soon as their page is downloaded.
+
+        Args:
+            calendar (Calendar): calendar to get events from.
+            max_pages (int, optional): Maximum number of pages to download. Defaults to all pages.
+            time_window (tuple[datetime, datetime], optional): Get the events between these
+                times. Defaults to the look-ahead window.
+
+        Yields:
+            TimeEvent
+        """
+        for _, events in self.iter_event_pages([calendar], time_window, max_pages):
+            yield from events
+
+    def iter_event_pages(
+        self,
+        calendars: list[Calendar],
+        time_window: Optional[tuple[datetime.datetime, datetime.datetime]] = None,
+        max_pages: Optional[int] = None,
+    ) -> Iterator[tuple[Calendar, list[TimeEvent]]]:
+        """
+        Download the events of the calendars page by page, following the page tokens. Each round
+        requests the next page of every unfinished calendar in one batch, and the pages are
+        yielded as soon as their round arrives. A failing calendar is logged and skipped.
+
+        Args:
+            calendars (list[Calendar]): Calendars to get events from.
+            time_window (tuple[datetime, datetime], optional): Get the events between these
+                times. Defaults to the look-ahead window.
+            max_pages (int, optional): Maximum number of pages to download per calendar.
+                Defaults to all pages.
+
+        Yields:
+            tuple[Calendar, list[TimeEvent]]: A calendar and the events of one of its pages.
+        """
+        page_tokens = {cal.id: None for cal in calendars}  # type: dict[str, Optional[str]]
+        num_pages = 0
+        pages = []  # type: list[tuple[Calendar, list[TimeEvent]]]  # Of the current round
+
+        def on_page(
+            calendar: Calendar,
+            _request_id: str,
+            response: dict[str, Any],
+            exception: Exception | None,
+        ) -> None:
+            if exception is not None:
+                logger.error("Unable to download events of %s: %s", calendar, exception)
+                page_tokens.pop(calendar.id)
+                return
+            events = {}  # type: dict[str, TimeEvent]
+            self._apply_event_items(calendar, events, response.get("items", []))
+            pages.append((calendar, list(events.values())))
+            page_tokens[calendar.id] = response.get("nextPageToken")
+            if not page_tokens[calendar.id]:
+                page_tokens.pop(calendar.id)
+
+        pending = list(calendars)
+        while pending and (max_pages is None or num_pages < max_pages):
+            # Not held while the caller handles the pages
+            with self._request_lock:
+                requests = [
+                    self.service.events().list(  # type: ignore
+                        **self._events_query(
+                            cal, page_token=page_tokens[cal.id], time_window=time_window
+                        )
+                    )
+                    for cal in pending
+                ]
+                # The user is waiting - not deferred, but later syncs account for it
+                self.request_budget.spend(time.time(), len(requests))
+                for start in range(0, len(requests), BATCH_SIZE):
+                    batch = self.service.new_batch_http_request()  # type: ignore
+                    for request, calendar in zip(
+                        requests[start : start + BATCH_SIZE],
+                        pending[start : start + BATCH_SIZE],
+                    ):
+                        batch.add(request, callback=functools.partial(on_page, calendar))
+                    batch.execute(http=_GzipHttp(requests[start].http))
+            num_pages += 1
+            round_pages, pages[:] = list(pages), []
+            yield from round_pages
+            pending = [cal for cal in pending if cal.id in page_tokens]
+
+    def download_range(
+        self,
+        calendars: list[Calendar],
+        time_min: datetime.datetime,
+        time_max: datetime.datetime,
+    ) -> list[TimeEvent]:
+        """
+        Download the events of the calendars in a time range (e.g. days the user scrolled to in
+        the agenda), batching the calendars together. The synced events (and the cache) are left
+        alone.
+
+        Args:
+            calendars (list[Calendar]): Calendars to get events from.
+            time_min (datetime): Start of the range.
+            time_max (datetime): End of the range.
+
+        Returns:
+            list[TimeEvent]: The events, sorted by start time.
+        """
+        events = []  # type: list[TimeEvent]
+        for _, page in self.iter_event_pages(calendars, (time_min, time_max)):
+            events += page
+        return sorted(events, key=lambda event: event.start_epoch)
+
+    def get_event_item(self, calendar_id: str, event_id: str) -> Optional[dict[str, Any]]:
+        """
+        Download the latest data of a single event (e.g. right before alerting about it). Uses a
+        separate connection with a short timeout, so it doesn't wait for a refresh in progress.
+
+        Args:
+            calendar_id (str): Calendar of the event.
+            event_id (str): Google event ID.
+
+        Returns:
+            dict|None: Raw event item. None if the event was deleted/cancelled.
+
+        Raises:
+            HttpError, OSError: The download failed.
+        """
+        request = self.service.events().get(  # type: ignore
+            calendarId=calendar_id,
+            eventId=event_id,
+            fields=EVENT_ITEM_FIELDS,
+            maxAttendees=1,
+        )
+        http = None
+        if self._credentials is not None:
+            http = AuthorizedHttp(
+                self._credentials, http=httplib2.Http(timeout=EVENT_GET_TIMEOUT)
+            )
+        # Not deferred either: the alert is imminent by definition
+        self.request_budget.spend(time.time())
+        try:
+            item = request.execute(http=http)
+        except HttpError as err:
+            if err.resp.status in (HTTP_NOT_FOUND, HTTP_GONE):
+                return None
+            if is_rate_limited(err):
+                self.circuit_breaker.record_failure(time.time(), err)
+            raise
+        if item.get("status") == "cancelled":
+            return None
+        return item
+
+    def apply_event_item(
+        self, calendar: Calendar, event_id: str, item: Optional[dict[str, Any]]
+    ) -> None:
+        """
+        Apply the latest data of a single event (see get_event_item) to the synced events and the
+        cache. The next sync will bring the same change, this just doesn't wait for it.
+
+        Args:
+            calendar (Calendar): Calendar of the event.
+            event_id (str): Google event ID.
+            item (dict|None): Raw event item. None if the event was deleted/cancelled.
+        """
+        if item is None:
+            item = {"id": event_id, "status": "cancelled"}
+        with self._request_lock:
+            events = self._calendar_events.get(calendar.id)
+            state = self._sync_tokens.get(calendar.id)
+            if events is None or state is None:
+                return  # Not synced
+            self._apply_event_items(calendar, events, [item])
+            self.store.save_events(
+                calendar.id, [item], False, state["sync_token"], state["window"]
+            )
+            event = events.get(event_id)
+            self.events = [
+                old
+                for old in self.events
+                if old.calendar is not calendar or old.event_id != event_id
+            ] + ([event] if event is not None else [])
+
+    def _events_query(
+        self,
+        calendar: Calendar,
+        sync_token: Optional[str] = None,
+        page_token: Optional[str] = None,
+        time_window: Optional[tuple[datetime.datetime, datetime.datetime]] = None,
+    ) -> dict[str, Any]:
+        """
+        Arguments for an events().list() query.
+
+        Args:
+            calendar (Calendar): calendar to get events from.
+            sync_token (str, optional): Only get the changes since the token was issued. Defaults
+                to all events in the time window.
+            page_token (str, optional): Page to get. Defaults to the first page.
+            time_window (tuple[datetime, datetime], optional): Get the events between these
+                times. Defaults to the look-ahead window. (Not used with a sync token.)
+
+        Returns:
+            dict[str, Any]
+        """
+        query = {
+            "calendarId": calendar.id,
+            "fields": EVENT_FIELDS,
+            "maxAttendees": 1,
+            "maxResults": 250,
+            "singleEvents": True,
+        }  # type: dict[str, Any]
+        if sync_token:
+            query["syncToken"] = sync_token
+        else:
+            time_min, time_max = time_window or self._event_window()
+            query["timeMin"] = time_min.isoformat()
+            query["timeMax"] = time_max.isoformat()
+        if page_token:
+            query["pageToken"] = page_token
+        return query
 
 
 if __name__ == "__main__":
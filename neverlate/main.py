@@ -8,18 +8,24 @@ import sys
 import time
 import traceback
 import typing
+from typing import Optional
 
 from google.auth.exceptions import RefreshError
-from PySide6.QtCore import QRect, Qt, QThread, QTimer, Slot
+from PySide6.QtCore import QRect, Qt, QThread, QTimer, Signal, Slot
 from PySide6.QtWidgets import QApplication, QMenu, QMessageBox, QSystemTrayIcon
 
+from neverlate import google_cal_downloader
+from neverlate.agenda_dialog import AgendaDialog
+from neverlate.alert_scheduler import AlertScheduler
+from neverlate.alert_server import ALERT_SERVER
 from neverlate.constants import APP_NAME
 from neverlate.event_alerter import EventAlerter
-from neverlate.google_cal_downloader import GoogleCalDownloader
+from neverlate.google_cal_downloader import Calendar, GoogleCalDownloader, TimeEvent
 from neverlate.login_dialog import LoginDialog
 from neverlate.main_dialog import MainDialog
 from neverlate.preferences import PREFERENCES
 from neverlate.preferences_dialog import PreferencesDialog
+from neverlate.push_notifications import HttpNotificationReceiver, PushNotifier
 from neverlate.utils import get_icon, seconds_to_min_sec
 
 # TODO: add a column for attending status, join button, reset time alert button
@@ -34,13 +40,27 @@ if typing.TYPE_CHECKING:
 logger = logging.getLogger("NeverLate")
 
 
+# When push notifications are active, polling is only a safety net and runs this many times slower
+PUSH_POLL_FACTOR = 6
+# After the wall clock jumped (e.g. woke up from sleep), hold the alerts this long (in seconds),
+# so the overdue ones are merged into one dialog while the computer wakes up
+CLOCK_JUMP_ALERT_HOLD = 3
+# Keep the alert state (alerted, dismissed, snoozed) of events this long after they end (in seconds)
+ALERT_STATE_RETENTION = 24 * 60 * 60
+
+
 class UpdateCalendar(QThread):
     """Thread to download google calendars + events."""
 
-    def __init__(self, calendar: GoogleCalDownloader) -> None:
+    def __init__(
+        self, calendar: GoogleCalDownloader, push_notifier: Optional[PushNotifier]
+    ) -> None:
         super().__init__()
         self.gcal = calendar
+        self.push_notifier = push_notifier
         self.needs_login = False
+        self.calendar_ids = None  # type: Optional[set[str]]  # Only update these calendars
+        self.force = False  # Update all calendars, even those that aren't due
 
     def run(self):
         """Main entry point.
@@ -50,13 +70,14 @@ class UpdateCalendar(QThread):
         """
         self.needs_login = False
         try:
-            self.gcal.update_calendars()
-            calendars_to_update = [
-                cal
-                for cal in self.gcal.calendars
-                if PREFERENCES.calendar_visibility.get(cal.id, cal.selected)
-            ]
-            self.gcal.update_events(calendars=calendars_to_update)
+            self.gcal.refresh(
+                App.is_calendar_visible, calendar_ids=self.calendar_ids, force=self.force
+            )
+            if self.push_notifier is not None and self.calendar_ids is None:
+                self.push_notifier.update_channels(
+                    self.gcal,
+                    [cal for cal in self.gcal.calendars if App.is_calendar_visible(cal)],
+                )
         except RefreshError:
             logger.error("BAD THINGS HAVE HAPPENED AND NEED TO BE FIXED")
             self.needs_login = True
@@ -73,6 +94,43 @@ class UpdateCalendar(QThread):
             logger.error("%s\n%s\n%s", line, traceback.format_exc(), line)
 
 
+class RevalidateEvent(QThread):
+    """Thread to download the latest data of an event right before alerting about it."""
+
+    # Alerter key, latest event (None = cancelled). Only emitted if the event changed.
+    revalidated = Signal(str, object)
+
+    def __init__(self, calendar: GoogleCalDownloader, key: str, time_event: TimeEvent) -> None:
+        super().__init__()
+        self.gcal = calendar
+        self.key = key
+        self.time_event = time_event
+
+    def run(self):
+        """Main entry point."""
+        try:
+            item = self.gcal.get_event_item(
+                self.time_event.calendar.id, self.time_event.event_id
+            )
+        except:
+            # The alert goes ahead with the synced data
+            logger.debug(
+                "Unable to revalidate %s:\n%s", self.time_event.summary, traceback.format_exc()
+            )
+            return
+        # Before telling the app: a refresh finishing meanwhile must not bring back the old event
+        self.gcal.apply_event_item(self.time_event.calendar, self.time_event.event_id, item)
+        time_event = None  # type: Optional[TimeEvent]
+        if item is not None:
+            try:
+                time_event = TimeEvent(item, self.time_event.calendar)
+            except ValueError:
+                pass  # No longer a timed event
+        if time_event is not None and time_event.version == self.time_event.version:
+            return
+        self.revalidated.emit(self.key, time_event)
+
+
 class App:
     """Main Qt application."""
 
@@ -98,32 +156,82 @@ class App:
         self.preferences_dialog.logout_button.pressed.connect(
             lambda: self.login(force=True)
         )
+        self.preferences_dialog.apply_button.pressed.connect(self.preferences_changed)
+        self.preferences_dialog.refresh_calendars_button.pressed.connect(
+            self.on_refresh_calendars
+        )
         self._setup_tray()
 
+        # Get the alert dialogs ready now, so they show up quickly from the first alert
+        ALERT_SERVER.start()
+
         # Log in & get google calendar events
         self.gcal = GoogleCalDownloader()
         self.login()
 
-        # Timer - runs in the main thread every 1 second
+        # Past & future days, downloaded as the user scrolls
+        self.agenda_dialog = AgendaDialog(
+            self.gcal,
+            lambda: [cal for cal in self.gcal.calendars if self.is_calendar_visible(cal)],
+        )
+        self.main_dialog.agenda_button.clicked.connect(self.show_agenda_dialog)
+
+        # Alerts fire at their deadlines
+        self.alert_scheduler = AlertScheduler()
+        self.alert_scheduler.clock_jumped.connect(self.on_clock_jumped)
+        self.alert_scheduler.alert_approaching.connect(self.on_alert_approaching)
+        self._revalidations = {}  # type: dict[str, RevalidateEvent]  # Alerter key -> thread
+
+        # Start with the cached events while the first download is running
+        self.event_alerters = {}  # type: dict[str, EventAlerter]
+        self.gcal.load_cache(self.is_calendar_visible)
+        self.update_event_alerters()
+
+        # Timer - runs in the main thread every 1 second, while the main dialog is visible
         self.my_timer = QTimer()
         self.my_timer.timeout.connect(self.update)
-        self.my_timer.start(1 * 1000)  # 1 sec intervall
+        self.main_dialog.visibility_changed.connect(self.main_dialog_visibility_changed)
+
+        # Timer - downloads the calendars + events when it's time to
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh_timer_timeout)
+
+        # Push notifications (optional)
+        self.push_notifier = None  # type: Optional[PushNotifier]
+        self._pushed_calendar_ids = set()  # type: set[str]  # Changed calendars to update
+        if PREFERENCES.push_notifications_address:
+            try:
+                self.push_notifier = PushNotifier(
+                    PREFERENCES.push_notifications_address,
+                    HttpNotificationReceiver(PREFERENCES.push_notifications_port),
+                )
+            except OSError as err:
+                # E.g. the port is taken
+                logger.error(
+                    "Unable to receive push notifications on port %d, polling instead: %s",
+                    PREFERENCES.push_notifications_port,
+                    err,
+                )
+            else:
+                self.push_notifier.calendar_changed.connect(self.on_calendar_changed)
 
-        self.update_calendar_thread = UpdateCalendar(self.gcal)
+        self.update_calendar_thread = UpdateCalendar(self.gcal, self.push_notifier)
         self.update_calendar_thread.finished.connect(
             self.thread_download_calendar_finished
         )
         self.update_calendar_thread.started.connect(
             self.thread_download_calendar_started
         )
+        self.update_refresh_limits()
         self.update_calendar_thread.start()
 
-        self.event_alerters = {}  # type: dict[str, EventAlerter]
-
     def _setup_tray(self) -> None:
         menu = QMenu()
         main_dialog_action = menu.addAction("Show Overview")
         main_dialog_action.triggered.connect(self.show_main_dialog)
+        agenda_action = menu.addAction("Show Agenda")
+        agenda_action.triggered.connect(self.show_agenda_dialog)
         setting_action = menu.addAction("Show Preferences")
         setting_action.triggered.connect(self.show_preferences_dialog)
         exit_action = menu.addAction("Quit")
@@ -166,6 +274,11 @@ class App:
         dialog.show()
         dialog.activateWindow()
 
+    @staticmethod
+    def is_calendar_visible(calendar: Calendar) -> bool:
+        """Whether the user wants to see (and be alerted about) the calendar's events."""
+        return PREFERENCES.calendar_visibility.get(calendar.id, calendar.selected)
+
     def login(self, force: bool = False):
         """Log into Google!
 
@@ -175,12 +288,8 @@ class App:
         if force:
             self.gcal.logout()
         elif self.gcal.login(require_existing_credentials=True):
-            try:
-                self.gcal.update_calendars()
-                return
-            except RefreshError:
-                # Likely the user needs to log in again (credential issue)
-                pass
+            # Credential issues are reported by the download thread (it needs the user to log in)
+            return
         login_dialog = LoginDialog()
         login_dialog.login_button.pressed.connect(self.main_dialog.hide)
         login_dialog.login_button.pressed.connect(self.gcal.login)
@@ -189,17 +298,109 @@ class App:
             self.app.quit()  # TODO: test when in threads
             return sys.exit()
 
+    @Slot(str)
+    def on_calendar_changed(self, calendar_id: str):
+        """A push notification said the events of a calendar changed. Update only that calendar."""
+        self._pushed_calendar_ids.add(calendar_id)
+        if self.update_calendar_thread.isFinished():
+            self._start_update_calendar_thread(full=False)
+
+    @Slot(str)
+    def on_alert_approaching(self, key: str):
+        """
+        An event is about to alert. Check it's still on (the last refresh may be minutes old).
+        The alert doesn't wait for the check - it uses the synced data if the check is slow.
+        """
+        event_alerter = self.event_alerters.get(key)
+        if event_alerter is None:
+            return
+        # Forget the checks that finished
+        self._revalidations = {
+            key_: thread
+            for key_, thread in self._revalidations.items()
+            if not thread.isFinished()
+        }
+        if key in self._revalidations:
+            return
+        thread = RevalidateEvent(self.gcal, key, event_alerter.time_event)
+        thread.revalidated.connect(self.on_event_revalidated)
+        self._revalidations[key] = thread
+        thread.start()
+
+    @Slot(str, object)
+    def on_event_revalidated(self, key: str, time_event: Optional[TimeEvent]):
+        """
+        An event that is (about to be) alerting changed: suppress, reschedule or update its alert.
+        """
+        event_alerter = self.event_alerters.get(key)
+        if event_alerter is None:
+            return
+        if time_event is None:
+            logger.info("%s was cancelled, not alerting", event_alerter.time_event.summary)
+            self.alert_scheduler.remove(key)
+            event_alerter.close_pop_up()
+            del self.event_alerters[key]
+            return
+        if time_event.version != event_alerter.time_event.version:
+            logger.info("%s changed, updating its alert", time_event.summary)
+            event_alerter.update_event(time_event)
+            self.alert_scheduler.schedule(key, event_alerter)
+
+    @Slot(float)
+    def on_clock_jumped(self, seconds: float):
+        """The wall clock jumped (e.g. woke up from sleep). Events may have changed meanwhile."""
+        logger.info("The clock jumped by %d seconds", seconds)
+        ALERT_SERVER.hold(CLOCK_JUMP_ALERT_HOLD)
+        self.refresh_timer_timeout()
+
+    def on_refresh_calendars(self):
+        """User asked for the latest calendar list (it's otherwise only revalidated once a day)."""
+        self.gcal.expire_calendar_list()
+        if self.update_calendar_thread.isRunning():
+            return  # The next refresh revalidates it
+        self.preferences_dialog.refresh_calendars_button.setEnabled(False)
+        self._start_update_calendar_thread()
+
     def on_update_now(self):
         """User manually requested the calanders be re-downloaded."""
-        self.update_calendar_thread.start()
+        self._start_update_calendar_thread(force=True)
         self.update()
 
+    def _start_update_calendar_thread(self, full: bool = True, force: bool = False):
+        """
+        Start downloading the calendars + events.
+
+        Args:
+            full (bool, optional): Update the calendars that are due. Otherwise only the calendars
+                with pushed changes are updated. Defaults to True.
+            force (bool, optional): Update all calendars, even those that aren't due. Defaults to
+                False.
+        """
+        if self.update_calendar_thread.isRunning():
+            return
+        if full:
+            self.update_calendar_thread.calendar_ids = None
+        else:
+            self.update_calendar_thread.calendar_ids = set(self._pushed_calendar_ids)
+        self.update_calendar_thread.force = force
+        self._pushed_calendar_ids.clear()
+        self.update_calendar_thread.start()
+
     def quitting(self) -> None:
         """Quitting the app. Make sure we terminate all threads first."""
+        self.alert_scheduler.stop()
+        self.refresh_timer.stop()
+        self.my_timer.stop()
+        if self.push_notifier is not None:
+            self.push_notifier.stop()
         self.update_calendar_thread.finished.disconnect()
         self.update_calendar_thread.terminate()
+        for thread in self._revalidations.values():
+            thread.terminate()
+        self.agenda_dialog.model.stop()
         for event in self.event_alerters.values():
             event.close_pop_up()
+        ALERT_SERVER.stop()
 
     def run(self):
         """Start the application."""
@@ -223,6 +424,10 @@ class App:
         # Make sure the UI is up to date with the latest events
         self.update()
 
+    def show_agenda_dialog(self):
+        """Show the agenda of past & future days."""
+        self._show_dialog(self.agenda_dialog)
+
     def show_preferences_dialog(self):
         """Show the preferences dialog. Make sure it has the latest calendars."""
         self.preferences_dialog.update_calendars(self.gcal.calendars)
@@ -245,12 +450,23 @@ class App:
             mb.setStandardButtons(QMessageBox.Ok)
             mb.exec()
             self.login(force=True)
-            self.update_calendar_thread.start()
+            self._start_update_calendar_thread()
             return
 
         # Update the GUI
         self.main_dialog.update_now_button.setEnabled(True)
-
+        if not self.preferences_dialog.refresh_calendars_button.isEnabled():
+            self.preferences_dialog.refresh_calendars_button.setEnabled(True)
+            self.preferences_dialog.update_calendars(self.gcal.calendars, keep_toggles=True)
+        self.update_event_alerters()
+        self.arm_refresh_timer()
+
+        # Changes pushed while we were busy
+        if self._pushed_calendar_ids:
+            self._start_update_calendar_thread(full=False)
+
+    def update_event_alerters(self):
+        """Sync the event alerters with the downloaded (or cached) calendars + events."""
         # Check if new calendars need to be saved
         save_prefs = False
         for cal in self.gcal.calendars:
@@ -264,15 +480,82 @@ class App:
         # Process new/old events (close pop-ups for deleted events)
         cur_event_ids = {event.id for event in self.gcal.events}
         for time_event in self.gcal.events:
-            if time_event.id not in self.event_alerters:
-                self.event_alerters[time_event.id] = EventAlerter(time_event)
-            else:
-                self.event_alerters[time_event.id].time_event = time_event
+            event_alerter = self.event_alerters.get(time_event.id)
+            if event_alerter is None:
+                event_alerter = EventAlerter(time_event)
+                state = self.gcal.store.load_alert_state(time_event.id)
+                if state is not None:
+                    event_alerter.set_state(**state)
+                event_alerter.on_state_change = self.save_alert_state
+                self.event_alerters[time_event.id] = event_alerter
+            elif event_alerter.time_event.version != time_event.version:
+                # The event changed (e.g. moved). Unchanged events are skipped.
+                event_alerter.update_event(time_event)
 
         for id_ in set(self.event_alerters) - cur_event_ids:
+            self.alert_scheduler.remove(id_)
             self.event_alerters[id_].close_pop_up()
             del self.event_alerters[id_]
 
+        self.gcal.store.remove_alert_states(ended_before=time.time() - ALERT_STATE_RETENTION)
+        self.schedule_alerts()
+
+    def save_alert_state(self, event_alerter: EventAlerter):
+        """Save the alert state of an event, so it's kept across restarts."""
+        self.gcal.store.save_alert_state(
+            event_alerter.time_event.id,
+            event_alerter.time_event.end_epoch,
+            **event_alerter.get_state(),
+        )
+
+    def schedule_alerts(self):
+        """(Re)schedule the alerts of all events. Events of hidden calendars don't alert."""
+        for id_, event_alerter in self.event_alerters.items():
+            if PREFERENCES.calendar_visibility.get(
+                event_alerter.time_event.calendar.id, False
+            ):
+                self.alert_scheduler.schedule(id_, event_alerter)
+            else:
+                # Calendar is not enabled, close pop-ups and move on
+                self.alert_scheduler.remove(id_)
+                event_alerter.close_pop_up()
+
+    def preferences_changed(self):
+        """The user applied new preferences (calendar visibility, alert padding...)."""
+        self.schedule_alerts()
+        ALERT_SERVER.start()  # In case the alert backend changed
+        self.arm_refresh_timer()
+        self.update()
+
+    def update_refresh_limits(self):
+        """Set the minimum & maximum time between refreshes of a calendar (see preferences)."""
+        floor = PREFERENCES.download_cal_freq * 60
+        ceiling = max(floor, PREFERENCES.download_cal_max_interval * 60)
+        if self.push_notifier is not None and self.push_notifier.active:
+            floor *= PUSH_POLL_FACTOR
+            ceiling *= PUSH_POLL_FACTOR
+        self.gcal.set_refresh_limits(floor, ceiling)
+
+    def arm_refresh_timer(self):
+        """Arm the timer to download the calendars + events when the next refresh is due."""
+        self.update_refresh_limits()
+        time_to_update = self.time_to_update()
+        # Re-check at least every minute - the timer doesn't notice wall clock jumps
+        self.refresh_timer.start(int(min(max(0, time_to_update), 60) * 1000))
+
+    def refresh_timer_timeout(self):
+        """Time to download the calendars + events (maybe)."""
+        if self.update_calendar_thread.needs_login or self.update_calendar_thread.isRunning():
+            return  # The thread finishing re-arms the timer
+        if self.time_to_update() <= 0:
+            self._start_update_calendar_thread()
+        else:
+            self.arm_refresh_timer()
+
+    def time_to_update(self) -> float:
+        """Seconds until the calendars + events should be downloaded again."""
+        return self.gcal.next_update_time(self.is_calendar_visible) - time.time()
+
     def thread_download_calendar_started(self):
         """Called when the thread to download calendars + events is triggered. Updates the UI accordingly."""
         self.main_dialog.time_to_update_label.setText("Updating events...")
@@ -300,37 +583,63 @@ class App:
                 else:
                     self.show_main_dialog()
 
+    @Slot(bool)
+    def main_dialog_visibility_changed(self, visible: bool):
+        """Only tick every second while there's a countdown to show."""
+        if visible:
+            self.my_timer.start(1 * 1000)  # 1 sec intervall
+        else:
+            self.my_timer.stop()
+
     def update(self):
-        """Main update thread that should be continuously running."""
-        QMenu()
+        """Update the main dialog. Runs every second while it's visible."""
         if (
             not self.update_calendar_thread.needs_login
             and self.update_calendar_thread.isFinished()
         ):
-            time_to_update = (PREFERENCES.download_cal_freq * 60) - (
-                time.time() - self.gcal.last_update_time
-            )
-            if time_to_update <= 0:
-                self.update_calendar_thread.start()
+            time_label = seconds_to_min_sec(int(max(0, self.time_to_update())))
+            if self.gcal.circuit_breaker.degraded:
+                self.main_dialog.time_to_update_label.setText(
+                    f"Degraded: unable to reach Google, retrying in {time_label}"
+                )
             else:
-                time_label = seconds_to_min_sec(int(time_to_update))
                 self.main_dialog.time_to_update_label.setText(
                     f"Updating events in {time_label}"
                 )
 
+        if not self.main_dialog.isVisible():
+            return
+
+        # One clock reading for the whole update
+        now = time.time()
+        budget = self.gcal.request_budget
+        budget_label = (
+            f"Request budget: {max(0, int(budget.available(now)))}/{int(budget.capacity)} "
+            f"left, {budget.spent} spent, {self.gcal.deferred_count} syncs deferred"
+        )
+        if self.gcal.deferred_calendars:
+            budget_label += " (waiting: " + ", ".join(
+                cal.summary for cal in self.gcal.deferred_calendars
+            ) + ")"
+        self.main_dialog.calendar_refresh_label.setText(
+            "Next refresh: "
+            + ", ".join(
+                f"{cal.summary} in "
+                + seconds_to_min_sec(int(max(0, self.gcal.next_calendar_refresh(cal) - now)))
+                for cal in self.gcal.calendars
+                if self.is_calendar_visible(cal)
+            )
+            + "\n"
+            + budget_label
+        )
         display_events = []
         for event_alerter in self.event_alerters.values():
-            if not PREFERENCES.calendar_visibility.get(
+            if PREFERENCES.calendar_visibility.get(
                 event_alerter.time_event.calendar.id, False
             ):
-                # Calendar is not enabled, close pop-ups and move on
-                # TODO: broken?
-                event_alerter.close_pop_up()
-            else:
-                event_alerter.update()
+                event_alerter.update(now)
                 display_events.append(event_alerter)
-        if self.main_dialog.isVisible():
-            self.main_dialog.update_table_with_events(display_events)
+        self.main_dialog.update_table_with_events(display_events, now)
         # self.main_dialog.setSizePolicy(QSizePolicy.Expanding)
 
 
@@ -343,6 +652,9 @@ def run():
     if "--verbose" in sys.argv or "-v" in sys.argv:
         logger.setLevel(logging.DEBUG)
         logger.debug("Verbose mode is enabled!")
+    if "--keep-raw-data" in sys.argv:
+        # Keep the raw API data on calendars/events, handy when debugging
+        google_cal_downloader.KEEP_RAW_DATA = True
 
     app = App()
     app.run()
@@ -2,13 +2,16 @@
 """Main dialog with the Table view of events."""
 from __future__ import annotations
 
+import datetime
+import functools
 import typing
 import webbrowser
-from datetime import timedelta
+from typing import Any, Optional
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QAction, QColor, QCursor, QFont
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, Signal
+from PySide6.QtGui import QAction, QBrush, QColor, QCursor, QFont, QPalette
 from PySide6.QtWidgets import (
+    QAbstractItemView,
     QAbstractScrollArea,
     QDialog,
     QHBoxLayout,
@@ -16,23 +19,25 @@ from PySide6.QtWidgets import (
     QLabel,
     QMenu,
     QPushButton,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QVBoxLayout,
 )
 
-from neverlate.utils import get_icon, now_datetime, pretty_datetime
+from neverlate.utils import LOCAL_TIMEZONE, get_icon
 
 if typing.TYPE_CHECKING:
     from PySide6.QtCore import QEvent
+    from PySide6.QtGui import QHideEvent, QShowEvent
 
     from neverlate.event_alerter import EventAlerter
+    from neverlate.google_cal_downloader import TimeEvent
 
 # Table columns
 TABLE_SUMMARY = 0
 TABLE_TIME_TILL_ALERT = 1
 TABLE_EVENT_TIMES = 2
 TABLE_CALENDAR = 3
+TABLE_HEADERS = ("Event", "Tim Till Alert", "Time", "Calendar")
 
 # Colors
 BLACK = QColor(*(3 * [0]))
@@ -43,10 +48,216 @@ LIGHT_RED = QColor(255, 200, 200)
 LIGHT_YELLOW = QColor(255, 255, 200)
 WHITE = QColor(*(3 * [255]))
 
+# Row styles: (background, foreground, bold)
+STYLE_ENDED = "ended"  # Meeting is over. 'Disable' it.
+STYLE_ATTENDING = "attending"  # Meeting is happening, user is in the meeting (in theory)
+STYLE_MISSING = "missing"  # Meeting is happening, user should be in the meeting
+STYLE_SOON = "soon"  # Meeting is coming up soon
+STYLE_FUTURE = "future"
+ROW_STYLES = {
+    STYLE_ENDED: (LIGHT_GREY, DARK_GREY, False),
+    STYLE_ATTENDING: (LIGHT_GREEN, BLACK, True),
+    STYLE_MISSING: (LIGHT_RED, BLACK, True),
+    STYLE_SOON: (LIGHT_YELLOW, BLACK, True),
+    STYLE_FUTURE: (WHITE, BLACK, False),
+}
+SOON = 30 * 60  # Seconds before an event it's "coming up soon"
+
+
+@functools.lru_cache(maxsize=None)
+def _palette(style: str) -> tuple[QBrush, QBrush]:
+    """Shared (cached) background & foreground brushes of a row style."""
+    background, foreground, _ = ROW_STYLES[style]
+    return (
+        QBrush(background, Qt.BrushStyle.SolidPattern),
+        QBrush(foreground, Qt.BrushStyle.SolidPattern),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _font(bold: bool, declined: bool) -> QFont:
+    """Shared (cached) font. Declined events are in a strikethrough & italic font."""
+    font = QFont()
+    font.setBold(bold)
+    font.setItalic(declined)
+    font.setStrikeOut(declined)
+    return font
+
+
+def row_style(alerter: EventAlerter, now: float) -> str:
+    """The style of an event's row (one of ROW_STYLES)."""
+    time_event = alerter.time_event
+    if now > time_event.end_epoch:
+        return STYLE_ENDED
+    if time_event.start_epoch < now < time_event.end_epoch:
+        return STYLE_ATTENDING if alerter.dismissed_alerts else STYLE_MISSING
+    if now + SOON > time_event.start_epoch:
+        return STYLE_SOON
+    return STYLE_FUTURE
+
+
+def time_till_alert_label(seconds: int) -> str:
+    """Countdown label (e.g. 105 -> '1:45', 3725 -> '1:02:05'). '---' = no alert."""
+    if seconds <= 0:
+        return "---"
+    min_, secs = divmod(seconds, 60)
+    hours, min_ = divmod(min_, 60)
+    if hours:
+        return f"{hours}:{str(min_).zfill(2)}:{str(secs).zfill(2)}"
+    return f"{min_}:{str(secs).zfill(2)}"
+
+
+def event_times_label(time_event: TimeEvent, today: datetime.date) -> str:
+    """Time range of an event, with the day if it's not today (e.g. 'Tue 9:00 - 9:30 AM')."""
+    start_time = time_event.start_time.astimezone(LOCAL_TIMEZONE)
+    if start_time.date() == today:
+        return time_event.time_range_label
+    return f"{start_time.strftime('%a')} {time_event.time_range_label}"
+
+
+class _Row:  # pylint: disable=too-few-public-methods
+    """What a table row currently displays."""
+
+    __slots__ = ("alerter", "time_event", "time_label", "time_till_alert", "style")
+
+    def __init__(self, alerter: EventAlerter) -> None:
+        self.alerter = alerter
+        self.time_event = None  # type: Optional[TimeEvent]
+        self.time_label = ""
+        self.time_till_alert = ""
+        self.style = ""
+
+
+class EventTableModel(QAbstractTableModel):
+    """
+    Table model of the event alerters. Only the cells that changed since the last update are
+    signalled to the view, so a countdown tick repaints just the countdown cells.
+    """
+
+    def __init__(self, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self._rows = []  # type: list[_Row]
+        self._today = None  # type: Optional[datetime.date]  # Of the last update
+
+    def alerter(self, row: int) -> Optional[EventAlerter]:
+        """The alerter displayed in a row."""
+        if 0 <= row < len(self._rows):
+            return self._rows[row].alerter
+        return None
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:  # pylint: disable=invalid-name
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(  # pylint: disable=invalid-name
+        self, parent: QModelIndex = QModelIndex()
+    ) -> int:
+        return 0 if parent.isValid() else len(TABLE_HEADERS)
+
+    def headerData(  # pylint: disable=invalid-name
+        self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole
+    ) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return TABLE_HEADERS[section]
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            time_event = row.time_event
+            if column == TABLE_SUMMARY:
+                return time_event.summary
+            if column == TABLE_TIME_TILL_ALERT:
+                return row.time_till_alert
+            if column == TABLE_EVENT_TIMES:
+                return row.time_label
+            if column == TABLE_CALENDAR:
+                return time_event.calendar.summary
+            return None
+        if role == Qt.BackgroundRole:
+            return _palette(row.style)[0]
+        if role == Qt.ForegroundRole:
+            return _palette(row.style)[1]
+        if role == Qt.FontRole:
+            declined = column == TABLE_SUMMARY and row.time_event.declined
+            return _font(ROW_STYLES[row.style][2], declined)
+        return None
+
+    def set_alerters(self, alerters: list[EventAlerter], now: float) -> bool:
+        """
+        Display the alerters, sorted by start time.
+
+        Args:
+            alerters (list[EventAlerter]): Alerters, already updated with the same `now`.
+            now (float): Current epoch time.
+
+        Returns:
+            bool: True if the number of rows changed.
+        """
+        alerters = sorted(alerters, key=lambda a: a.time_event.start_epoch)
+        row_count_changed = len(alerters) != len(self._rows)
+        if row_count_changed:
+            self.beginResetModel()
+            self._rows = [_Row(alerter) for alerter in alerters]
+            self._update_rows(now)
+            self.endResetModel()
+        elif any(row.alerter is not alerter for row, alerter in zip(self._rows, alerters)):
+            # Same number of events, but different ones or in another order
+            self.layoutAboutToBeChanged.emit()
+            rows = {id(row.alerter): row for row in self._rows}
+            self._rows = [rows.get(id(alerter)) or _Row(alerter) for alerter in alerters]
+            self._update_rows(now)
+            self.layoutChanged.emit()
+        else:
+            for idx, changed in enumerate(self._update_rows(now)):
+                if changed is None:
+                    continue
+                first = TABLE_TIME_TILL_ALERT if changed else 0
+                last = TABLE_TIME_TILL_ALERT if changed else len(TABLE_HEADERS) - 1
+                self.dataChanged.emit(self.index(idx, first), self.index(idx, last))
+        return row_count_changed
+
+    def _update_rows(self, now: float) -> list[Optional[bool]]:
+        """
+        Update what the rows display.
+
+        Returns:
+            list[bool|None]: Per row: None = unchanged, True = only the countdown changed,
+                False = the whole row changed.
+        """
+        changes = []  # type: list[Optional[bool]]
+        today = datetime.date.fromtimestamp(now)
+        new_day, self._today = today != self._today, today
+        for row in self._rows:
+            alerter = row.alerter
+            time_till_alert = time_till_alert_label(alerter.secs_till_alert)
+            style = row_style(alerter, now)
+            time_label = row.time_label
+            if new_day or row.time_event is not alerter.time_event:
+                row.time_label = event_times_label(alerter.time_event, today)
+            if (
+                row.time_event is not alerter.time_event
+                or row.style != style
+                or row.time_label != time_label
+            ):
+                changes.append(False)
+            elif row.time_till_alert != time_till_alert:
+                changes.append(True)
+            else:
+                changes.append(None)
+            row.time_event = alerter.time_event
+            row.time_till_alert = time_till_alert
+            row.style = style
+        return changes
+
 
 class MainDialog(QDialog):
     """Main dialog to show general info."""
 
+    visibility_changed = Signal(bool)
+
     def __init__(self) -> None:
         super().__init__()
         self.setWindowTitle("NeverLate")
@@ -68,23 +279,16 @@ class MainDialog(QDialog):
         self.trigger_alert_action = self.table_menu.addAction("Reset/Retrigger Alert")
         self.trigger_alert_action.setIcon(get_icon("alarm.png"))
 
+        self.agenda_button = QPushButton("Agenda")
         self.update_now_button = QPushButton("Update Now")
         self.time_to_update_label = QLabel()
-        self.row_to_event_alerter = {}  # type: dict[int, EventAlerter]
-
-        self.event_table = QTableWidget(0, 4)
-        self.event_table.setHorizontalHeaderItem(
-            TABLE_SUMMARY, QTableWidgetItem("Event")
-        )
-        self.event_table.setHorizontalHeaderItem(
-            TABLE_EVENT_TIMES, QTableWidgetItem("Time")
-        )
-        self.event_table.setHorizontalHeaderItem(
-            TABLE_TIME_TILL_ALERT, QTableWidgetItem("Tim Till Alert")
-        )
-        self.event_table.setHorizontalHeaderItem(
-            TABLE_CALENDAR, QTableWidgetItem("Calendar")
-        )
+        # Next refresh of each calendar
+        self.calendar_refresh_label = QLabel()
+        self.calendar_refresh_label.setWordWrap(True)
+        self.calendar_refresh_label.setForegroundRole(QPalette.PlaceholderText)
+        self.event_model = EventTableModel(self)
+        self.event_table = QTableView()
+        self.event_table.setModel(self.event_model)
 
         # self.event_table.horizontalHeader().hide()
         self.event_table.verticalHeader().hide()
@@ -93,17 +297,19 @@ class MainDialog(QDialog):
             QHeaderView.ResizeToContents
         )
         self.event_table.horizontalHeader().setStretchLastSection(True)
-        self.event_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.event_table.setSelectionMode(QTableWidget.NoSelection)
+        self.event_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.event_table.setSelectionMode(QAbstractItemView.NoSelection)
         self.event_table.setFocusPolicy(Qt.NoFocus)
         self.event_table.contextMenuEvent = self.table_context_menu
         # table->horizontalHeader()->setSectionResizeMode(QHeaderView::Stretch);
 
         main_layout = QVBoxLayout()
         main_layout.addWidget(self.event_table)
+        main_layout.addWidget(self.calendar_refresh_label)
         # main_layout.addStretch()
 
         layout = QHBoxLayout()
+        layout.addWidget(self.agenda_button)
         layout.addStretch()
         layout.addWidget(self.time_to_update_label)
         layout.addWidget(self.update_now_button)
@@ -111,9 +317,17 @@ class MainDialog(QDialog):
         main_layout.addLayout(layout)
         self.setLayout(main_layout)
 
+    def showEvent(self, event: QShowEvent):  # pylint: disable=invalid-name
+        super().showEvent(event)
+        self.visibility_changed.emit(True)
+
+    def hideEvent(self, event: QHideEvent):  # pylint: disable=invalid-name
+        super().hideEvent(event)
+        self.visibility_changed.emit(False)
+
     def join_meeting(self, alerter: EventAlerter):
         """Join a meeting - opening a browser to the given URL"""
-        url = alerter.time_event.get_video_url()
+        url = alerter.time_event.video_url
         if url:
             webbrowser.open(url, autoraise=True)
 
@@ -130,7 +344,7 @@ class MainDialog(QDialog):
             event (QEvent): Event triggered
         """
         row = self.event_table.rowAt(event.pos().y())
-        alerter = self.row_to_event_alerter.get(row)
+        alerter = self.event_model.alerter(row)
         if alerter is None:
             # This should not happen...
             return
@@ -142,7 +356,7 @@ class MainDialog(QDialog):
         self.trigger_alert_action.triggered.connect(alerter.reset_alert)
 
         # Join meeting
-        url = alerter.time_event.get_video_url()
+        url = alerter.time_event.video_url
         self.join_meeting_action.setEnabled(bool(url))
         self.join_meeting_action.setText(
             "Join Meeting (Google Meet)" if "meet.google" in url else "Join Meeting"
@@ -151,129 +365,12 @@ class MainDialog(QDialog):
 
         self.table_menu.popup(QCursor.pos())
 
-    def update_table_with_events(self, alerters: list[EventAlerter]):
-        """Update the table with the specified alerter events."""
-        # TODO: break this function up
-        orig_row_count = self.event_table.rowCount()
-        self.event_table.setRowCount(len(alerters))
-        alerters.sort(key=lambda a: a.time_event.start_time)
-        now = now_datetime()
-        self.row_to_event_alerter.clear()
-        for idx, alerter in enumerate(alerters):
-            self.row_to_event_alerter[idx] = alerter
-
-            self.event_table.setItem(
-                idx, TABLE_SUMMARY, QTableWidgetItem(alerter.time_event.summary)
-            )
-
-            # Start time
-            start_label = pretty_datetime(alerter.time_event.start_time).split()[0]
-            end_label = pretty_datetime(alerter.time_event.end_time)
-            self.event_table.setItem(
-                idx,
-                TABLE_EVENT_TIMES,
-                QTableWidgetItem(f"{start_label} - {end_label}"),
-            )
-
-            # Time till alert
-            time_till_alert = alerter.time_till_alert()
-            if time_till_alert <= 0:
-                time_till_alert = "---"
-            else:
-                min_, secs = divmod(time_till_alert, 60)
-                hours, min_ = divmod(min_, 60)
-                if hours:
-                    secs = str(secs).zfill(2)
-                    min_ = str(min_).zfill(2)
-                    time_till_alert = f"{hours}:{min_}:{secs}"
-                else:
-                    secs = str(secs).zfill(2)
-                    time_till_alert = f"{min_}:{secs}"
-
-                time_till_alert = str(time_till_alert)
-
-            # Set the base text
-            self.event_table.setItem(
-                idx, TABLE_TIME_TILL_ALERT, QTableWidgetItem(time_till_alert)
-            )
-
-            # Calendar
-            self.event_table.setItem(
-                idx,
-                TABLE_CALENDAR,
-                QTableWidgetItem(alerter.time_event.calendar.summary),
-            )
-
-            # =================== Styles =====================
-            if alerter.time_event.has_declined():
-                # User declined. Set strikethrough font & italic
-                # for column in range(self.event_table.columnCount()):
-                item = self.event_table.item(idx, TABLE_SUMMARY)
-                font = QFont()
-                font.setItalic(True)
-                font.setStrikeOut(True)
-                item.setFont(font)
-            if now > alerter.time_event.end_time:
-                # Meeting is over. 'Disable' it.
-                for column in range(self.event_table.columnCount()):
-                    item = self.event_table.item(idx, column)
-                    background = item.background()
-                    background.setColor(LIGHT_GREY)
-                    foreground = item.foreground()
-                    foreground.setColor(DARK_GREY)
-                    background.setStyle(Qt.BrushStyle.SolidPattern)
-                    foreground.setStyle(Qt.BrushStyle.SolidPattern)
-                    item.setBackground(background)
-                    item.setForeground(foreground)
-            elif alerter.time_event.start_time < now < alerter.time_event.end_time:
-                # Meeting is happening
-                for column in range(self.event_table.columnCount()):
-                    if alerter.dismissed_alerts:  # User is in the meeting (in theory)
-                        bg_color = LIGHT_GREEN  # Light green
-                    else:  # User should be in th emeeting
-                        bg_color = LIGHT_RED
-                    item = self.event_table.item(idx, column)
-                    background = item.background()
-                    foreground = item.foreground()
-                    foreground.setColor(BLACK)
-                    background.setColor(bg_color)
-                    background.setStyle(Qt.BrushStyle.SolidPattern)
-                    foreground.setStyle(Qt.BrushStyle.SolidPattern)
-                    item.setBackground(background)
-                    item.setForeground(foreground)
-                    font = item.font()
-                    font.setBold(True)
-                    item.setFont(font)
-            elif now + timedelta(minutes=30) > alerter.time_event.start_time:
-                # Meeting is coming up soon
-                for column in range(self.event_table.columnCount()):
-                    item = self.event_table.item(idx, column)
-                    background = item.background()
-                    background.setColor(LIGHT_YELLOW)
-                    foreground = item.foreground()
-                    foreground.setColor(BLACK)
-                    background.setStyle(Qt.BrushStyle.SolidPattern)
-                    foreground.setStyle(Qt.BrushStyle.SolidPattern)
-                    item.setBackground(background)
-                    item.setForeground(foreground)
-                    font = item.font()
-                    font.setBold(True)
-                    item.setFont(font)
-            else:
-                # Future event
-                for column in range(self.event_table.columnCount()):
-                    item = self.event_table.item(idx, column)
-                    background = item.background()
-                    background.setColor(WHITE)
-                    foreground = item.foreground()
-                    foreground.setColor(BLACK)
-                    background.setStyle(Qt.BrushStyle.SolidPattern)
-                    foreground.setStyle(Qt.BrushStyle.SolidPattern)
-                    item.setBackground(background)
-                    item.setForeground(foreground)
-                    font = item.font()
-                    item.setFont(font)
-
-        # self.event_table.resizeColumnsToContents()
-        if orig_row_count != len(alerters):
+    def update_table_with_events(self, alerters: list[EventAlerter], now: float):
+        """Update the table with the specified alerter events.
+
+        Args:
+            alerters (list[EventAlerter]): Alerters, already updated with the same `now`.
+            now (float): Current epoch time.
+        """
+        if self.event_model.set_alerters(alerters, now):
             self.adjustSize()
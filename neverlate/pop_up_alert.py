@@ -1,11 +1,14 @@
 # pylint: disable=no-name-in-module
 import ctypes
 import sys
+import threading
 import webbrowser
 from datetime import datetime, timedelta
 from time import time
+from typing import Any, Callable, Sequence
 
-from PySide6.QtCore import Qt, QTimer, Slot
+from PySide6.QtCore import QObject, Qt, QTimer, Signal, Slot
+from PySide6.QtGui import QCursor, QGuiApplication, QIcon
 from PySide6.QtWidgets import (
     QApplication,
     QComboBox,
@@ -16,13 +19,24 @@ from PySide6.QtWidgets import (
     QVBoxLayout,
 )
 
-from neverlate.constants import APP_NAME, OUTPUT_DISMISS, OUTPUT_SNOOZE
+from neverlate.alert_protocol import HEARTBEAT_INTERVAL, decode_message, encode_message
+from neverlate.constants import (
+    APP_NAME,
+    COMMAND_CLOSE,
+    COMMAND_SHOW,
+    COMMAND_UPDATE,
+    OUTPUT_CLOSED,
+    OUTPUT_DISMISS,
+    OUTPUT_HEARTBEAT,
+    OUTPUT_JOIN,
+    OUTPUT_SNOOZE,
+)
 from neverlate.preferences import PREFERENCES
 from neverlate.utils import get_icon, now_datetime, pretty_datetime
 
 LOCAL_TIMEZONE = datetime.now().astimezone().tzinfo
 
-RESTART_TIMER = 15 * 1000  # 15 seconds  (in milliseconds)
+REFOCUS_TIMER = 15 * 1000  # 15 seconds  (in milliseconds)
 
 SNOOZE_UNTIL_MINUTES = [0, 0.1, 1, 3, 5, 10, 15, 30]  # Minute for the snooze until...
 FONT_SIZE_MULTIPLIER = 1  # Multiply font size
@@ -32,18 +46,31 @@ class AlertDialog(QDialog):
     """Pop up alert dialog."""
 
     has_shown_maximized: bool = False
-
-    def __init__(self, title: str, start_time: str, video_uri: str) -> None:
+    dismissed = Signal()
+    joined = Signal()  # Dismissed and joined the video conference
+    snoozed = Signal(int)  # Seconds
+    closed = Signal()  # Closed by the user without dismissing/snoozing
+
+    def __init__(
+        self, title: str, start_time: str, video_uri: str, others: Sequence[str] = ()
+    ) -> None:
+        """
+        Args:
+            title (str): Title of the event.
+            start_time (str): Start time of the event (iso format).
+            video_uri (str): Video conference link of the event. Empty if none.
+            others (Sequence[str]): Other events alerted about in the same dialog, e.g.
+                ["10:30 AM  Standup"]. Dismissing/snoozing applies to all of them.
+        """
         super().__init__()
-        self.start_time = datetime.fromisoformat(start_time)
-        self.video_uri = video_uri
-        self.setWindowTitle(
-            f"Don't Be Late: {title} @ {pretty_datetime(self.start_time)}"
-        )
+        self._finished = False
         self.setWindowIcon(get_icon("tray_icon.png"))
 
-        self.start_time_label = QLabel("Starts at: " + pretty_datetime(self.start_time))
+        self.title_label = QLabel()
+        self.start_time_label = QLabel()
         self.start_time_label.setAlignment(Qt.AlignCenter)
+        self.others_label = QLabel()
+        self.others_label.setAlignment(Qt.AlignCenter)
         self.time_to_event_label = QLabel(" ")
         self.standard_font_size = self.time_to_event_label.font().pointSize()
         self.time_to_event_label.setAlignment(Qt.AlignCenter)
@@ -51,13 +78,9 @@ class AlertDialog(QDialog):
         self.button_accept = QPushButton("Dismiss")
         self.button_accept.setIcon(get_icon("dismiss.png"))
         self.button_accept.clicked.connect(self.dismiss)
-        self.button_join = QPushButton("Joing Meeting")
-        if "meet.google" in self.video_uri:
-            self.button_join.setText("Join Meeting (Google Meet)")
+        self.button_join = QPushButton()
         self.button_join.clicked.connect(self.dismiss_and_join)
         self.button_join.setIcon(get_icon("video.png"))
-        if not self.video_uri:
-            self.button_join.setVisible(False)
 
         self.snooze_until_button = QPushButton("Snooze Until Right Before")
         self.snooze_until_button.setIcon(get_icon("zzz.png"))
@@ -86,13 +109,11 @@ class AlertDialog(QDialog):
         self.update_timer.timeout.connect(self.update_ui)
         self.update_timer.start(0.9 * 1000)  # 1 sec intervall
 
-        # Auto close the dialog and re-open after X seconds. This makes sure the dialog wasn't opened on a different
-        # workspace than the user is currently on.
-        # TODO: do NOT
-        self.kill_timer = QTimer()
-        self.kill_timer.timeout.connect(self.kill_timer_complete)
-        self.kill_timer.setSingleShot(True)
-        self.kill_timer.start(RESTART_TIMER)
+        # Every X seconds, bring the dialog back in front of the user if they can't see it. This
+        # makes sure the dialog isn't left on a different workspace than the user is currently on.
+        self.refocus_timer = QTimer()
+        self.refocus_timer.timeout.connect(self.refocus)
+        self.refocus_timer.start(REFOCUS_TIMER)
 
         self.enable_widgets_timer = QTimer()
         self.enable_widgets_timer.timeout.connect(self.enable_widgets)
@@ -100,7 +121,30 @@ class AlertDialog(QDialog):
         self.enable_widgets(value=False)
 
         # self.setWindowFlags(Qt.FramelessWindowHint)
-        self.layout_ui(title)
+        self.layout_ui()
+        self.update_event(title, start_time, video_uri, others)
+
+    def update_event(
+        self, title: str, start_time: str, video_uri: str, others: Sequence[str] = ()
+    ) -> None:
+        """Show the (latest) details of the event(s). (See __init__ for the arguments.)"""
+        self.start_time = datetime.fromisoformat(start_time)
+        self.video_uri = video_uri
+        more = f" (+{len(others)} more)" if others else ""
+        self.setWindowTitle(
+            f"Don't Be Late: {title}{more} @ {pretty_datetime(self.start_time)}"
+        )
+        self.title_label.setText(title)
+        self.start_time_label.setText("Starts at: " + pretty_datetime(self.start_time))
+        self.others_label.setText("\n".join(["Also:"] + list(others)))
+        self.others_label.setVisible(bool(others))
+        self.button_join.setText("Joing Meeting")
+        if "meet.google" in self.video_uri:
+            self.button_join.setText("Join Meeting (Google Meet)")
+        self.button_join.setVisible(bool(self.video_uri))
+        # The event may have moved later - update_ui() sets the warnings again if still needed
+        self.setStyleSheet("")
+        self.snooze_until_button.setVisible(True)
         self.update_ui()
 
     def enable_widgets(self, value: bool = True) -> None:
@@ -108,20 +152,20 @@ class AlertDialog(QDialog):
         for widget in (self.button_join, self.button_accept, self.snooze_until_button):
             widget.setEnabled(value)
 
-    def layout_ui(self, title: str):
+    def layout_ui(self):
         """Define the main UI layout."""
         main_layout = QVBoxLayout()
         self.setLayout(main_layout)
 
         main_layout.addStretch()
-        main_label = QLabel(title)
-        main_label.setAlignment(Qt.AlignCenter)
-        font = main_label.font()
+        self.title_label.setAlignment(Qt.AlignCenter)
+        font = self.title_label.font()
         font.setPointSize(self.standard_font_size * 3 * FONT_SIZE_MULTIPLIER)
         font.setBold(True)
-        main_label.setFont(font)
-        main_layout.addWidget(main_label)
+        self.title_label.setFont(font)
+        main_layout.addWidget(self.title_label)
         main_layout.addWidget(self.start_time_label)
+        main_layout.addWidget(self.others_label)
         main_layout.addWidget(self.time_to_event_label)
 
         # Primary buttons
@@ -149,22 +193,74 @@ class AlertDialog(QDialog):
         # return super().close()
         self.snooze(0)
 
+    def finish(self) -> None:
+        """Close the dialog for good, without reporting anything."""
+        self._finished = True
+        for timer in (self.update_timer, self.refocus_timer, self.enable_widgets_timer):
+            timer.stop()
+        super().close()
+        self.deleteLater()
+
+    def closeEvent(self, event) -> None:  # pylint: disable=invalid-name
+        """Closed with the window's close button."""
+        if not self._finished:
+            self._finished = True
+            self.closed.emit()
+        super().closeEvent(event)
+
+    def reject(self) -> None:
+        """Closed with the Escape key."""
+        if not self._finished:
+            self._finished = True
+            self.closed.emit()
+        super().reject()
+
     def dismiss_and_join(self):
         """Dismiss teh alert, and open the video URI link in a web browser."""
         webbrowser.open(self.video_uri, autoraise=True)
-        self.dismiss()
+        self._finished = True
+        self.joined.emit()
 
     def dismiss(self):
         """Dismiss the alert permanently."""
-        print(OUTPUT_DISMISS)
-        sys.exit(0)
+        self._finished = True
+        self.dismissed.emit()
+
+    def is_seen(self) -> bool:
+        """
+        True if the dialog is on screen: shown, not minimized, exposed (e.g. not on another
+        workspace) and not moved off the screens. Having the focus doesn't matter - the user may
+        be typing in another app with the dialog in plain sight.
+        """
+        window = self.windowHandle()
+        if not self.isVisible() or self.isMinimized() or window is None or not window.isExposed():
+            return False
+        geometry = self.frameGeometry()
+        return any(
+            screen.geometry().intersects(geometry) for screen in QGuiApplication.screens()
+        )
 
-    def kill_timer_complete(self):
-        """Called when the restart timer ends. If the UI doesn't have focus, restart."""
-        # TODO: check if the mouse is over the dialog
-        # print(OUTPUT_RESTART)
-        self.snooze(0.001)
-        # sys.exit(0)
+    def refocus(self):
+        """
+        Called by the refocus timer. If the user can't see the dialog, show it again on the
+        screen (and workspace) they're on - the same window, nothing is re-created.
+        """
+        if self.is_seen():
+            return
+        # Center it on the mouse's screen, unless it's already there
+        screen = QGuiApplication.screenAt(QCursor.pos())
+        if screen is not None and screen != self.screen():
+            geometry = self.frameGeometry()
+            geometry.moveCenter(screen.availableGeometry().center())
+            self.move(geometry.topLeft())
+        # Re-mapping the window puts it on the current workspace
+        self.hide()
+        if self.has_shown_maximized:
+            self.showMaximized()
+        else:
+            self.showNormal()  # Also un-minimizes it
+        self.raise_()
+        self.activateWindow()
 
     def update_snooze_for_combo_box_icons(self):
         """Add a warning icon to any combo box item that would make the user late to the meeting."""
@@ -173,6 +269,8 @@ class AlertDialog(QDialog):
             minutes = int(self.snooze_for_combo_box.itemText(idx).split()[0])
             if now + timedelta(minutes=minutes) > self.start_time:
                 self.snooze_for_combo_box.setItemIcon(idx, get_icon("warning.png"))
+            else:
+                self.snooze_for_combo_box.setItemIcon(idx, QIcon())
 
     def update_snooze_until_options(self):
         """Update the valid options for the snooze until"""
@@ -196,9 +294,9 @@ class AlertDialog(QDialog):
 
     def update_ui(self):
         """Update the UI."""
-        # If the user is observing the dialog, restart the kill timer
+        # If the user is observing the dialog, restart the refocus timer
         if self.underMouse():
-            self.kill_timer.start(RESTART_TIMER)
+            self.refocus_timer.start(REFOCUS_TIMER)
         self.update_snooze_for_combo_box_icons()
         # self.update_snooze_until_options()
 
@@ -239,8 +337,8 @@ class AlertDialog(QDialog):
 
     def snooze(self, minutes: float):
         """Close the dialog and snooze for X minutes."""
-        print(f"{OUTPUT_SNOOZE} {int(minutes * 60)}")
-        sys.exit(0)
+        self._finished = True
+        self.snoozed.emit(int(minutes * 60))
 
     @Slot()
     def snooze_till_start(self):
@@ -265,17 +363,170 @@ class AlertDialog(QDialog):
         self.snooze(-time_to_snooze.total_seconds() / 60)
 
 
+class AlertDialogs:
+    """Open alert dialogs, by alert ID. The user's choices are reported to `on_result`."""
+
+    def __init__(self, on_result: Callable[..., None]) -> None:
+        """
+        Args:
+            on_result (Callable): Called with the result type (e.g. OUTPUT_SNOOZE), the alert ID
+                (`id` keyword) and the result's other fields (e.g. `seconds`).
+        """
+        self.on_result = on_result
+        self.dialogs = {}  # type: dict[str, AlertDialog]
+
+    def show(
+        self,
+        alert_id: str,
+        title: str,
+        start_time: str,
+        video_uri: str,
+        others: Sequence[str] = (),
+    ) -> None:
+        """Show a new dialog. (See AlertDialog for the arguments.)"""
+        dialog = AlertDialog(title, start_time, video_uri, others)
+        dialog.dismissed.connect(lambda: self.report(alert_id, OUTPUT_DISMISS))
+        dialog.joined.connect(lambda: self.report(alert_id, OUTPUT_JOIN))
+        dialog.snoozed.connect(
+            lambda seconds: self.report(alert_id, OUTPUT_SNOOZE, seconds=seconds)
+        )
+        dialog.closed.connect(lambda: self.report(alert_id, OUTPUT_CLOSED))
+        self.dialogs[alert_id] = dialog
+        dialog.show()
+        dialog.raise_()
+        dialog.activateWindow()
+
+    def update(
+        self,
+        alert_id: str,
+        title: str,
+        start_time: str,
+        video_uri: str,
+        others: Sequence[str] = (),
+    ) -> None:
+        """Show the latest details of the event(s) in a dialog."""
+        if alert_id in self.dialogs:
+            self.dialogs[alert_id].update_event(title, start_time, video_uri, others)
+
+    def close(self, alert_id: str) -> None:
+        """Close a dialog (reported as OUTPUT_CLOSED)."""
+        self.report(alert_id, OUTPUT_CLOSED)
+
+    def close_all(self) -> None:
+        """Close all the dialogs, without reporting anything."""
+        for dialog in self.dialogs.values():
+            dialog.finish()
+        self.dialogs.clear()
+
+    def report(self, alert_id: str, result: str, **fields: Any) -> None:
+        """Close a dialog and report the result."""
+        dialog = self.dialogs.pop(alert_id, None)
+        if dialog is None:
+            return
+        dialog.finish()
+        self.on_result(result, id=alert_id, **fields)
+
+
+class PopUpServer(QObject):
+    """
+    Long lived pop-up process. Shows, updates and closes the dialogs as the app commands (on
+    stdin), and reports the user's choices (on stdout), so the interpreter, Qt and the icons are
+    only loaded once instead of for every alert. See alert_protocol for the messages.
+    """
+
+    command_received = Signal(str)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.dialogs = AlertDialogs(self._on_result)
+        self.command_received.connect(self.handle_command)
+        threading.Thread(target=self._read_commands, daemon=True).start()
+
+        # Heartbeats come from the event loop, so they stop if the dialogs hang. Only while
+        # dialogs are open - when idle, neither process wakes up.
+        self.heartbeat_timer = QTimer()
+        self.heartbeat_timer.timeout.connect(lambda: self.send(OUTPUT_HEARTBEAT))
+
+    def _read_commands(self) -> None:
+        """Read the commands (in a background thread)."""
+        for line in sys.stdin:
+            if line.strip():
+                self.command_received.emit(line)
+        # The app has gone away
+        self.command_received.emit("")
+
+    @Slot(str)
+    def handle_command(self, line: str) -> None:
+        """Run a command from the app."""
+        if not line:
+            QApplication.quit()
+            return
+        try:
+            command = decode_message(line)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return
+        alert_id = command.get("id", "")
+        if command["type"] == COMMAND_SHOW:
+            self.dialogs.show(
+                alert_id,
+                command["title"],
+                command["start_time"],
+                command["video_uri"],
+                command.get("others", ()),
+            )
+        elif command["type"] == COMMAND_UPDATE:
+            self.dialogs.update(
+                alert_id,
+                command["title"],
+                command["start_time"],
+                command["video_uri"],
+                command.get("others", ()),
+            )
+        elif command["type"] == COMMAND_CLOSE:
+            self.dialogs.close(alert_id)
+        self._update_heartbeat()
+
+    def _on_result(self, result: str, **fields: Any) -> None:
+        """The user closed a dialog."""
+        self.send(result, **fields)
+        self._update_heartbeat()
+
+    def _update_heartbeat(self) -> None:
+        """Send heartbeats while dialogs are open."""
+        if not self.dialogs.dialogs:
+            self.heartbeat_timer.stop()
+        elif not self.heartbeat_timer.isActive():
+            self.send(OUTPUT_HEARTBEAT)
+            self.heartbeat_timer.start(HEARTBEAT_INTERVAL * 1000)
+
+    @staticmethod
+    def send(message_type: str, **fields: Any) -> None:
+        """Send a message to the app."""
+        sys.stdout.write(encode_message(message_type, **fields))
+        sys.stdout.flush()
+
+
+def warm_up() -> None:
+    """Load everything a dialog needs now, so the first alert shows up quickly."""
+    for icon in ("dismiss.png", "tray_icon.png", "video.png", "warning.png", "zzz.png"):
+        get_icon(icon)
+    AlertDialog("", now_datetime().isoformat(), "").finish()
+
+
 if __name__ == "__main__":
-    # _, title, start_time_iso, video_uri = sys.argv
-    # start_time = datetime.fromisoformat(start_time_iso)
+    # Titles aren't necessarily in the platform's encoding
+    sys.stdin.reconfigure(encoding="utf-8")
+    sys.stdout.reconfigure(encoding="utf-8")
 
     app = QApplication()
+    app.setQuitOnLastWindowClosed(False)
     if hasattr(ctypes, "windll"):
         # Rename the process so we can get a better icon for Windows
-        myappid = f"bw.{APP_NAME.lower()}.dialog" + str(sys.argv[1:])
+        myappid = f"bw.{APP_NAME.lower()}.dialog"
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
 
     app.setWindowIcon(get_icon("tray_icon.png"))  # Mac OSX
-    d = AlertDialog(*sys.argv[1:])  # pylint: disable=no-value-for-parameter
-    d.show()
+    warm_up()
+    server = PopUpServer()
     app.exec()
@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import json
 import os
+import sys
 from typing import Any, ClassVar
 
 from neverlate.utils import app_local_data_dir
@@ -16,7 +17,12 @@ class _Preferences:
 
     alert_padding: int  # Minutes before an event that an alert should be displayed
     calendar_visibility: dict[str, bool]  # Wether the calendar is enabled or not
-    download_cal_freq: int  # Frequency in minutes that the calendar + events are downloaded
+    download_cal_freq: int  # Minimum minutes between downloads of a calendar's events
+    download_cal_max_interval: int  # Maximum minutes between downloads of a calendar's events
+    in_process_alerts: bool  # Show the alert dialogs in the app's process (not a separate one)
+    look_ahead_hours: int  # Download the events this many hours ahead (whole days)
+    push_notifications_address: str  # HTTPS URL for Google push notifications. Empty = disabled
+    push_notifications_port: int  # Local port receiving the push notifications
     show_snooze_for_menu: bool  # In the alert dialogs, always show the snooze_For_menu
     snooze_until_seconds: int  # Number of seconds before an event to show a snoozed dialog
 
@@ -25,6 +31,13 @@ class _Preferences:
         self.show_snooze_for_menu = False
         self.calendar_visibility = {}  # ty
         self.download_cal_freq = 5
+        self.download_cal_max_interval = 60
+        # Dialogs of a separate process reliably come up on the user's current workspace on
+        # Windows/Mac. On Linux, the app's own dialogs do too, and show up much faster.
+        self.in_process_alerts = sys.platform.startswith("linux")
+        self.look_ahead_hours = 48
+        self.push_notifications_address = ""
+        self.push_notifications_port = 8765
         self.snooze_until_seconds = 10
 
     def deserialize(self, **kwargs: Any):
@@ -57,6 +70,11 @@ class _Preferences:
             "alert_padding": self.alert_padding,
             "calendar_visibility": self.calendar_visibility,
             "download_cal_freq": self.download_cal_freq,
+            "download_cal_max_interval": self.download_cal_max_interval,
+            "in_process_alerts": self.in_process_alerts,
+            "look_ahead_hours": self.look_ahead_hours,
+            "push_notifications_address": self.push_notifications_address,
+            "push_notifications_port": self.push_notifications_port,
             "show_snooze_for_menu": self.show_snooze_for_menu,
             "snooze_until_seconds": self.snooze_until_seconds,
         }
@@ -9,6 +9,7 @@ from PySide6.QtWidgets import (
     QFormLayout,
     QHBoxLayout,
     QLabel,
+    QLineEdit,
     QPushButton,
     QScrollArea,
     QSpinBox,
@@ -43,6 +44,24 @@ class PreferencesDialog(QDialog):  # pylint: disable=too-few-public-methods
         self.download_cal_freq_sb.setValue(PREFERENCES.download_cal_freq)
         self.download_cal_freq_sb.setMinimum(3)
 
+        self.download_cal_max_interval_sb = QSpinBox()
+        self.download_cal_max_interval_sb.setRange(3, 24 * 60)
+        self.download_cal_max_interval_sb.setValue(PREFERENCES.download_cal_max_interval)
+
+        self.look_ahead_hours_sb = QSpinBox()
+        self.look_ahead_hours_sb.setRange(1, 14 * 24)
+        self.look_ahead_hours_sb.setValue(PREFERENCES.look_ahead_hours)
+
+        # Push notifications
+        self.push_notifications_address_le = QLineEdit(
+            PREFERENCES.push_notifications_address
+        )
+        self.push_notifications_address_le.setPlaceholderText("Disabled")
+        self.push_notifications_address_le.setToolTip(
+            "HTTPS URL forwarding Google's push notifications to "
+            f"port {PREFERENCES.push_notifications_port} on this computer. (Requires a restart.)"
+        )
+
         # Snooze timer box
         self.snooze_untill_seconds_sb = QSpinBox()
         self.snooze_untill_seconds_sb.setValue(PREFERENCES.snooze_until_seconds)
@@ -53,6 +72,21 @@ class PreferencesDialog(QDialog):  # pylint: disable=too-few-public-methods
         )
         self.show_snooze_for_cb.setChecked(PREFERENCES.show_snooze_for_menu)
 
+        # Alert backend toggle
+        self.in_process_alerts_cb = QCheckBox(
+            "Show the alert dialogs faster (may not come up on the current workspace)"
+        )
+        self.in_process_alerts_cb.setToolTip(
+            "Show the alert dialogs in this app instead of a separate process."
+        )
+        self.in_process_alerts_cb.setChecked(PREFERENCES.in_process_alerts)
+
+        # Calendar list refresh button
+        self.refresh_calendars_button = QPushButton("Refresh")
+        self.refresh_calendars_button.setToolTip(
+            "Download the calendar list again (e.g. after subscribing to a calendar)"
+        )
+
         # Log out button
         self.logout_button = QPushButton("Logout")
         self.logout_button.pressed.connect(self.close)
@@ -86,12 +120,27 @@ class PreferencesDialog(QDialog):  # pylint: disable=too-few-public-methods
         toggle_layout.addRow(
             "Frequency in minutes to check for new events", self.download_cal_freq_sb
         )
+        toggle_layout.addRow(
+            "Maximum minutes between checks of calendars that rarely change",
+            self.download_cal_max_interval_sb,
+        )
+        toggle_layout.addRow(
+            "Hours ahead to download events for", self.look_ahead_hours_sb
+        )
+        toggle_layout.addRow(
+            "Push notification URL (optional)", self.push_notifications_address_le
+        )
 
         main_layout.addLayout(toggle_layout)
         main_layout.addWidget(self.show_snooze_for_cb)
+        main_layout.addWidget(self.in_process_alerts_cb)
 
         # Calendars
-        main_layout.addWidget(QLabel("Calendar(s)"))
+        calendars_layout = QHBoxLayout()
+        calendars_layout.addWidget(QLabel("Calendar(s)"))
+        calendars_layout.addStretch()
+        calendars_layout.addWidget(self.refresh_calendars_button)
+        main_layout.addLayout(calendars_layout)
         scroll_area = QScrollArea()
         scroll_layout = QVBoxLayout()
         scroll_layout.setContentsMargins(0, 0, 0, 0)
@@ -119,18 +168,34 @@ class PreferencesDialog(QDialog):  # pylint: disable=too-few-public-methods
         """Save the preferences and close the dialog."""
         PREFERENCES.alert_padding = self.alert_padding_sb.value()
         PREFERENCES.download_cal_freq = self.download_cal_freq_sb.value()
+        PREFERENCES.download_cal_max_interval = self.download_cal_max_interval_sb.value()
+        PREFERENCES.look_ahead_hours = self.look_ahead_hours_sb.value()
+        PREFERENCES.push_notifications_address = (
+            self.push_notifications_address_le.text().strip()
+        )
         PREFERENCES.calendar_visibility = {
             id_: toggle.isChecked() for id_, toggle in self.calendar_toggles.items()
         }
         PREFERENCES.show_snooze_for_menu = self.show_snooze_for_cb.isChecked()
+        PREFERENCES.in_process_alerts = self.in_process_alerts_cb.isChecked()
         PREFERENCES.snooze_until_seconds = self.snooze_untill_seconds_sb.value()
 
         PREFERENCES.save()
         self.close()
 
-    def update_calendars(self, calendars: list[Calendar]):
-        """Display toggles for all calendar(s)"""
-
+    def update_calendars(self, calendars: list[Calendar], keep_toggles: bool = False):
+        """Display toggles for all calendar(s)
+
+        Args:
+            calendars (list[Calendar]): Calendars to display.
+            keep_toggles (bool, optional): Keep the (unsaved) state of the existing toggles, e.g.
+                the calendar list was refreshed while the dialog is open. Defaults to False.
+        """
+        checked = {}  # type: dict[str, bool]
+        if keep_toggles:
+            checked = {
+                id_: toggle.isChecked() for id_, toggle in self.calendar_toggles.items()
+            }
         num_items = len(self.calendar_toggles)
         self.calendar_toggles.clear()
         scroll_layout = self.scroll_widget.layout()
@@ -153,7 +218,9 @@ class PreferencesDialog(QDialog):  # pylint: disable=too-few-public-methods
                 if calendar.primary
                 else calendar.summary
             )
-            if calendar.id not in PREFERENCES.calendar_visibility:
+            if calendar.id in checked:
+                visibility = checked[calendar.id]
+            elif calendar.id not in PREFERENCES.calendar_visibility:
                 visibility = True
             else:
                 visibility = PREFERENCES.calendar_visibility[calendar.id]
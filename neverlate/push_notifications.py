@@ -0,0 +1,226 @@
+"""Push notifications from Google when the events of a calendar change."""
+# pylint: disable=no-name-in-module
+from __future__ import annotations
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from googleapiclient.errors import HttpError
+from PySide6.QtCore import QObject, Signal
+
+from neverlate.utils import app_local_data_dir
+
+if TYPE_CHECKING:
+    from neverlate.google_cal_downloader import Calendar, GoogleCalDownloader
+
+logger = logging.getLogger("NeverLate")
+
+# Renew channels this long before they expire (must be longer than the slowest polling interval)
+RENEW_MARGIN = 24 * 60 * 60  # 1 day (in seconds)
+
+# Callback for a received notification: channel ID, channel token, resource state
+NotificationCallback = Callable[[str, str, str], None]
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    """Handles the POST requests Google sends to the channel address."""
+
+    server: _NotificationServer
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """A notification. All the info is in the X-Goog-* headers."""
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.end_headers()
+        self.server.callback(
+            self.headers.get("X-Goog-Channel-ID", ""),
+            self.headers.get("X-Goog-Channel-Token", ""),
+            self.headers.get("X-Goog-Resource-State", ""),
+        )
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        logger.debug("Push notification receiver: " + format, *args)
+
+
+class _NotificationServer(ThreadingHTTPServer):
+    daemon_threads = True
+    callback: NotificationCallback
+
+
+class HttpNotificationReceiver:
+    """
+    Local HTTP server receiving the notifications. Google needs to be able to reach it at the
+    channel address (e.g. through a tunnel or reverse proxy).
+
+    Any object with the same start/stop methods can be used instead (e.g. a stand-in for tests).
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1") -> None:
+        self.host = host
+        self.port = port
+        self._server = None  # type: Optional[_NotificationServer]
+
+    def start(self, callback: NotificationCallback) -> None:
+        """Start serving in a background thread."""
+        self._server = _NotificationServer((self.host, self.port), _NotificationHandler)
+        self._server.callback = callback
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class PushNotifier(QObject):
+    """
+    Manages a notification channel (events().watch) per calendar, and emits `calendar_changed`
+    when Google tells us a calendar's events changed.
+    """
+
+    calendar_changed = Signal(str)  # Calendar ID
+
+    def __init__(self, address: str, receiver: Any) -> None:
+        """
+        Args:
+            address (str): HTTPS URL Google sends the notifications to.
+            receiver (HttpNotificationReceiver): Receives the notifications sent to the address.
+        """
+        super().__init__()
+        self.address = address
+        self.receiver = receiver
+        self._channels_file_path = os.path.join(
+            app_local_data_dir(), "push_channels.json"
+        )
+        self._lock = threading.Lock()
+        # Calendar ID -> {"address": str, "id": str, "resource_id": str, "token": str,
+        #                 "expiration": float}
+        self._channels = self._load_channels()  # type: dict[str, dict[str, Any]]
+        self.receiver.start(self._on_notification)
+
+    @property
+    def active(self) -> bool:
+        """True if we're watching at least one calendar."""
+        with self._lock:
+            return bool(self._channels)
+
+    def stop(self) -> None:
+        """Stop receiving notifications. (Channels are kept, and reused on the next start.)"""
+        self.receiver.stop()
+
+    def update_channels(self, gcal: GoogleCalDownloader, calendars: list[Calendar]) -> None:
+        """
+        Watch the calendars: create missing channels, renew the ones about to expire, and stop
+        the ones for calendars we no longer need. Makes API calls - call from a worker thread.
+
+        Args:
+            gcal (GoogleCalDownloader): Makes the API calls.
+            calendars (list[Calendar]): Calendars to watch.
+        """
+        now = time.time()
+        with self._lock:
+            channels = dict(self._channels)
+
+        wanted = {calendar.id for calendar in calendars}
+        for calendar_id in set(channels) - wanted:
+            self._stop_channel(gcal, channels.pop(calendar_id))
+
+        for calendar in calendars:
+            channel = channels.get(calendar.id)
+            if (
+                channel
+                and channel.get("address") == self.address
+                and channel["expiration"] - now > RENEW_MARGIN
+            ):
+                continue
+            try:
+                new_channel = self._watch(gcal, calendar)
+            except HttpError as err:
+                # Not all calendars support push notifications (e.g. holidays)
+                logger.debug("Unable to watch %s: %s", calendar, err)
+                continue
+            if channel:
+                self._stop_channel(gcal, channel)
+            channels[calendar.id] = new_channel
+
+        with self._lock:
+            self._channels = channels
+        self._save_channels()
+
+    def _watch(self, gcal: GoogleCalDownloader, calendar: Calendar) -> dict[str, Any]:
+        """Create a channel for a calendar."""
+        token = secrets.token_urlsafe(16)
+        result = gcal.execute_request(
+            gcal.service.events().watch(  # type: ignore
+                calendarId=calendar.id,
+                body={
+                    "id": str(uuid.uuid4()),
+                    "type": "web_hook",
+                    "address": self.address,
+                    "token": token,
+                },
+            )
+        )
+        logger.debug("Watching %s", calendar)
+        return {
+            "address": self.address,
+            "id": result["id"],
+            "resource_id": result["resourceId"],
+            "token": token,
+            "expiration": int(result["expiration"]) / 1000.0,
+        }
+
+    @staticmethod
+    def _stop_channel(gcal: GoogleCalDownloader, channel: dict[str, Any]) -> None:
+        """Stop a channel. Errors are ignored (the channel will expire on its own)."""
+        try:
+            gcal.execute_request(
+                gcal.service.channels().stop(  # type: ignore
+                    body={"id": channel["id"], "resourceId": channel["resource_id"]}
+                )
+            )
+        except HttpError as err:
+            logger.debug("Unable to stop channel %s: %s", channel["id"], err)
+
+    def _on_notification(self, channel_id: str, token: str, state: str) -> None:
+        """Called (in a receiver thread) for every notification."""
+        if state == "sync":
+            # Sent once when the channel is created - nothing changed
+            return
+        with self._lock:
+            for calendar_id, channel in self._channels.items():
+                if channel["id"] == channel_id and channel["token"] == token:
+                    break
+            else:
+                logger.debug("Notification for unknown channel: %s", channel_id)
+                return
+        self.calendar_changed.emit(calendar_id)
+
+    def _load_channels(self) -> dict[str, dict[str, Any]]:
+        """Load the channels from the previous run."""
+        if not os.path.exists(self._channels_file_path):
+            return {}
+        try:
+            with open(self._channels_file_path, "r") as channels_file:
+                return json.load(channels_file)
+        except:
+            logger.warning("Unable to load push notification channels")
+            return {}
+
+    def _save_channels(self) -> None:
+        """Save the channels to disk."""
+        with self._lock:
+            data = dict(self._channels)
+        with open(self._channels_file_path, "w") as channels_file:
+            json.dump(data, channels_file, sort_keys=True, indent=4)
@@ -0,0 +1,242 @@
+"""
+When to download (again) - exponential backoff and a circuit breaker for failed downloads, an
+adaptive polling interval, and a request budget.
+"""
+from __future__ import annotations
+
+import email.utils
+import logging
+import random
+import time
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger("NeverLate")
+
+# Statuses worth retrying (later)
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 403 reasons meaning we're going too fast
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True if the error is Google telling us to slow down."""
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    if error.resp.status != 403:
+        return False
+    content = error.content.decode("utf-8", "replace") if error.content else ""
+    return any(reason in content for reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True if the request may succeed later (as opposed to e.g. a calendar that doesn't exist)."""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES or is_rate_limited(error)
+    # Network issues
+    return isinstance(error, (ConnectionError, TimeoutError, OSError))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Seconds the server asked us to wait (Retry-After header), if any.
+
+    Args:
+        error (BaseException): Error from a request.
+
+    Returns:
+        float|None
+    """
+    if not isinstance(error, HttpError):
+        return None
+    value = error.resp.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_time.timestamp() - time.time())
+
+
+class Backoff:
+    """Exponential backoff with jitter: base, 2 x base, 4 x base... up to the maximum."""
+
+    failures: int  # Consecutive failures
+    next_attempt: float  # Epoch time we may try again
+
+    def __init__(self, base: float, maximum: float) -> None:
+        """
+        Args:
+            base (float): Seconds to wait after the first failure.
+            maximum (float): Maximum seconds to wait.
+        """
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    def ready(self, now: float) -> bool:
+        """True if we may try again."""
+        return now >= self.next_attempt
+
+    def record_failure(self, now: float, wait: Optional[float] = None) -> float:
+        """
+        A failed attempt - back off.
+
+        Args:
+            now (float): Epoch time of the failure.
+            wait (float, optional): Minimum seconds to wait (e.g. the Retry-After header).
+
+        Returns:
+            float: Seconds until the next attempt.
+        """
+        self.failures += 1
+        delay = min(self.maximum, self.base * 2 ** (self.failures - 1))
+        # Jitter so many clients failing at once don't all retry at once
+        delay = random.uniform(delay / 2, delay)
+        if wait is not None:
+            delay = max(delay, wait)
+        self.next_attempt = now + delay
+        return delay
+
+    def record_success(self) -> None:
+        """A successful attempt - back to normal."""
+        self.failures = 0
+        self.next_attempt = 0.0
+
+
+class AdaptiveInterval:
+    """
+    Polling interval adapting to how often the polled data changes: shorter after a poll found
+    changes, longer after a poll found none, between the floor and the ceiling.
+    """
+
+    SHRINK = 0.5  # Interval factor after a change
+    GROW = 1.5  # Interval factor after no change
+
+    interval: float  # Seconds between polls
+    next_time: float  # Epoch time of the next poll
+
+    def __init__(self, floor: float, ceiling: float) -> None:
+        """
+        Args:
+            floor (float): Minimum seconds between polls.
+            ceiling (float): Maximum seconds between polls.
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.interval = floor
+        self.next_time = 0.0
+
+    def set_limits(self, floor: float, ceiling: float) -> None:
+        """Change the floor & ceiling (e.g. the preferences changed)."""
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        interval = min(self.ceiling, max(self.floor, self.interval))
+        if self.next_time:
+            self.next_time += interval - self.interval
+        self.interval = interval
+
+    def record(self, now: float, changed: bool) -> float:
+        """
+        A poll happened.
+
+        Args:
+            now (float): Epoch time of the poll.
+            changed (bool): The poll found changes.
+
+        Returns:
+            float: Seconds until the next poll.
+        """
+        factor = self.SHRINK if changed else self.GROW
+        self.interval = min(self.ceiling, max(self.floor, self.interval * factor))
+        self.next_time = now + self.interval
+        return self.interval
+
+
+class TokenBucket:
+    """
+    Request budget: `rate` requests per minute, saving up to `capacity` for bursts. Requests that
+    can't wait (e.g. the next page of a sync in progress) may overdraw it, delaying later ones.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        Args:
+            rate (float): Requests per minute.
+            capacity (float, optional): Maximum requests saved up. Defaults to `rate`.
+        """
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.spent = 0  # Requests spent in total
+        self._time = time.time()
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens earned since the last refill."""
+        if now > self._time:
+            self.tokens = min(self.capacity, self.tokens + (now - self._time) * self.rate / 60)
+        self._time = now
+
+    def available(self, now: float) -> float:
+        """Requests that can be made right now (negative if overdrawn)."""
+        self._refill(now)
+        return self.tokens
+
+    def spend(self, now: float, count: int = 1) -> None:
+        """Requests were made."""
+        self._refill(now)
+        self.tokens -= count
+        self.spent += count
+
+    def next_available(self, now: float, count: int = 1) -> float:
+        """Epoch time `count` requests can be made."""
+        missing = min(count, self.capacity) - self.available(now)
+        if missing <= 0:
+            return now
+        return now + missing * 60 / self.rate
+
+
+class CircuitBreaker:
+    """
+    Backs off refreshing after failures. After `threshold` consecutive failures the circuit is
+    open: we're degraded and only try again once the backoff expires.
+    """
+
+    def __init__(
+        self, threshold: int = 3, base: float = 30.0, maximum: float = 30 * 60.0
+    ) -> None:
+        self.threshold = threshold
+        self.backoff = Backoff(base, maximum)
+
+    @property
+    def degraded(self) -> bool:
+        """True if the circuit is open (repeated failures)."""
+        return self.backoff.failures >= self.threshold
+
+    @property
+    def next_attempt(self) -> float:
+        """Epoch time we may try again."""
+        return self.backoff.next_attempt
+
+    def record_failure(self, now: float, error: BaseException) -> None:
+        """A refresh failed."""
+        delay = self.backoff.record_failure(now, retry_after(error))
+        if self.degraded:
+            logger.warning(
+                "%d refreshes failed in a row, next try in %d seconds",
+                self.backoff.failures,
+                delay,
+            )
+
+    def record_success(self) -> None:
+        """A refresh succeeded."""
+        self.backoff.record_success()
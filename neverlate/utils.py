@@ -49,6 +49,11 @@ def now_datetime() -> datetime.datetime:
     return datetime.datetime.now(LOCAL_TIMEZONE)
 
 
+def day_start(day: datetime.date) -> datetime.datetime:
+    """Local midnight at the start of a day."""
+    return datetime.datetime.combine(day, datetime.time(), LOCAL_TIMEZONE)
+
+
 def pretty_datetime(dt: datetime.datetime) -> str:
     """Converts a date time to a a pretty syntax, e.g.: '4:33 PM'."""
     label = dt.strftime("%I:%M %p")
@@ -0,0 +1,201 @@
+"""Shared fixtures: a stand-in for the Google Calendar API, and an isolated app folder."""
+from __future__ import annotations
+
+import datetime
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from neverlate.utils import now_datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def event_item(event_id: str, minutes_from_now: float, duration: float = 30, **extra) -> dict:
+    """Raw API event item starting some minutes from now."""
+    start = now_datetime().replace(microsecond=0) + datetime.timedelta(minutes=minutes_from_now)
+    item = {
+        "id": event_id,
+        "summary": f"Event {event_id}",
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + datetime.timedelta(minutes=duration)).isoformat()},
+    }
+    item.update(extra)
+    return item
+
+
+def time_event(event_id: str, minutes_from_now: float, **extra):
+    """TimeEvent starting some minutes from now."""
+    from neverlate.google_cal_downloader import Calendar, TimeEvent
+
+    return TimeEvent(event_item(event_id, minutes_from_now, **extra), Calendar({"id": "work"}))
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5) -> bool:
+    """Run the Qt event loop until the condition holds (or the timeout). Returns the condition."""
+    from PySide6.QtCore import QCoreApplication
+
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def http_error(status: int, content: bytes = b"{}", headers: Optional[dict] = None) -> HttpError:
+    """HttpError as raised by the API client."""
+    resp = type("Response", (dict,), {"status": status, "reason": "test"})(headers or {})
+    return HttpError(resp, content, uri="test")
+
+
+class FakeRequest:
+    """HttpRequest stand-in."""
+
+    def __init__(self, handler, kwargs: dict[str, Any]) -> None:
+        self.handler = handler
+        self.kwargs = kwargs
+        self.headers = {}  # type: dict[str, str]
+        self.http = None
+
+    def execute(self, **_):
+        return self.handler(self, **self.kwargs)
+
+
+class FakeBatch:
+    """BatchHttpRequest stand-in."""
+
+    def __init__(self, service: FakeService) -> None:
+        self.service = service
+        self.requests = []  # type: list[tuple[FakeRequest, Any]]
+
+    def add(self, request: FakeRequest, callback=None, request_id=None) -> None:
+        self.requests.append((request, callback))
+
+    def execute(self, **_):
+        self.service.round_trips += 1
+        for idx, (request, callback) in enumerate(self.requests):
+            try:
+                response = request.handler(request, **request.kwargs)
+            except HttpError as err:
+                callback(str(idx), None, err)
+            else:
+                callback(str(idx), response, None)
+
+
+class FakeService:
+    """
+    Calendar API with the given events. Records the requests made, and fails the calendars or the
+    calendar list on demand. Incremental syncs get the items in `changes`.
+    """
+
+    def __init__(self, calendars: dict[str, list[dict]]) -> None:
+        self.calendars = calendars  # Calendar ID -> event items
+        self.round_trips = 0
+        self.requests = []  # type: list[tuple[str, dict]]  # (method, arguments)
+        self.fail = {}  # type: dict[str, HttpError]  # Calendar ID (or "calendarList") -> error
+        self.page_size = 250  # Events per page
+        self.changes = {}  # type: dict[str, list[dict]]  # Calendar ID -> items since the token
+        self.expired_tokens = set()  # type: set[str]  # Sync tokens answered with 410 Gone
+        self.list_etag = '"list-1"'
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self)
+
+    def calendarList(self):
+        return SimpleNamespace(list=lambda **kw: FakeRequest(self._calendar_list, kw))
+
+    def events(self):
+        return SimpleNamespace(
+            list=lambda **kw: FakeRequest(self._list, kw),
+            get=lambda **kw: FakeRequest(self._get, kw),
+            watch=lambda **kw: FakeRequest(self._watch, kw),
+        )
+
+    def channels(self):
+        return SimpleNamespace(stop=lambda **kw: FakeRequest(self._stop, kw))
+
+    def _calendar_list(self, request, **kwargs):
+        self.requests.append(("calendarList.list", kwargs))
+        if "calendarList" in self.fail:
+            raise self.fail["calendarList"]
+        if request.headers.get("If-None-Match") == self.list_etag:
+            raise http_error(304)
+        return {
+            "etag": self.list_etag,
+            "items": [
+                {"id": id_, "summary": id_, "selected": True, "primary": idx == 0}
+                for idx, id_ in enumerate(self.calendars)
+            ],
+        }
+
+    def _list(self, request, **kwargs):
+        self.requests.append(("events.list", kwargs))
+        calendar_id = kwargs["calendarId"]
+        if calendar_id in self.fail:
+            raise self.fail[calendar_id]
+        if "syncToken" in kwargs:
+            if kwargs["syncToken"] in self.expired_tokens:
+                raise http_error(410)
+            items = self.changes.get(calendar_id, [])
+        else:
+            items = self.calendars[calendar_id]
+        start = int(kwargs.get("pageToken") or 0)
+        response = {"items": items[start : start + self.page_size]}  # type: dict[str, Any]
+        if start + self.page_size < len(items):
+            response["nextPageToken"] = str(start + self.page_size)
+        else:
+            response["nextSyncToken"] = f"sync-{calendar_id}"
+        return response
+
+    def _get(self, request, **kwargs):
+        self.requests.append(("events.get", kwargs))
+        if kwargs["calendarId"] in self.fail:
+            raise self.fail[kwargs["calendarId"]]
+        for item in self.calendars[kwargs["calendarId"]]:
+            if item["id"] == kwargs["eventId"]:
+                return item
+        raise http_error(404)
+
+    def _watch(self, request, **kwargs):
+        self.requests.append(("events.watch", kwargs))
+        return {"id": kwargs["body"]["id"], "resourceId": "resource", "expiration": "9999999999999"}
+
+    def _stop(self, request, **kwargs):
+        self.requests.append(("channels.stop", kwargs))
+        return {}
+
+    def count(self, method: str) -> int:
+        """Number of requests made to an API method, e.g. "events.list"."""
+        return sum(1 for method_, _ in self.requests if method_ == method)
+
+
+@pytest.fixture(autouse=True)
+def app_home(tmp_path, monkeypatch):
+    """Keep the preferences, token and event cache out of the real home folder."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    """The QApplication (timers, processes and models need one)."""
+    from PySide6.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def make_downloader():
+    """GoogleCalDownloader talking to a FakeService."""
+    from neverlate.google_cal_downloader import GoogleCalDownloader
+
+    def make(service: FakeService) -> GoogleCalDownloader:
+        gcal = GoogleCalDownloader()
+        gcal._service = service
+        return gcal
+
+    return make
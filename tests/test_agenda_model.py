@@ -0,0 +1,83 @@
+"""The agenda's rows, as days are downloaded and dropped from the cache."""
+import datetime
+
+from conftest import wait_until
+from PySide6.QtCore import QtMsgType, qInstallMessageHandler
+from PySide6.QtTest import QAbstractItemModelTester
+
+from neverlate.agenda_dialog import AgendaModel, DayBuckets
+from neverlate.google_cal_downloader import Calendar, TimeEvent
+from neverlate.utils import day_start
+
+CALENDAR = Calendar({"id": "work"})
+
+
+class FakeDownloader:
+    """Two events a day."""
+
+    def download_range(self, calendars, start, end):
+        events = []
+        day = start.date()
+        while day < end.date():
+            for hour in (10, 14):
+                begin = day_start(day) + datetime.timedelta(hours=hour)
+                item = {
+                    "id": f"{day}-{hour}",
+                    "summary": f"Event {hour}",
+                    "start": {"dateTime": begin.isoformat()},
+                    "end": {"dateTime": (begin + datetime.timedelta(hours=1)).isoformat()},
+                }
+                events.append(TimeEvent(item, CALENDAR))
+            day += datetime.timedelta(days=1)
+        return events
+
+
+class FixedAgendaModel(AgendaModel):
+    """The model tester fetches more (days) on each check: keep a fixed range."""
+
+    def canFetchMore(self, parent):
+        return False
+
+    def fetchMore(self, parent):
+        pass
+
+
+# Smaller than the real cache (the model tester checks all the rows on each change)
+CACHE_DAYS = 30
+
+
+def test_rows_stay_consistent_past_the_cache_size(qapp):
+    failures = []
+
+    def on_message(msg_type, _context, message):
+        if msg_type != QtMsgType.QtDebugMsg:
+            failures.append(message)
+
+    previous_handler = qInstallMessageHandler(on_message)
+    try:
+        model = FixedAgendaModel(FakeDownloader(), lambda: [CALENDAR])
+        model.buckets = DayBuckets(CACHE_DAYS)
+        tester = QAbstractItemModelTester(  # pylint: disable=unused-variable
+            model, QAbstractItemModelTester.FailureReportingMode.Warning
+        )
+        model.extend_future()
+
+        # Scroll through all the days: the first ones are dropped from the cache on the way
+        for first in range(0, len(model._days) - 10, 10):
+            model.request_days(model._days[first], model._days[first + 9])
+            assert wait_until(
+                lambda: model._wanted is None and not model._fetch_thread.isRunning()
+            )
+            starts, num_rows = list(model._starts), model.rowCount()
+            model._update_starts()
+            assert (model._starts, model.rowCount()) == (starts, num_rows)
+            for day in model._days[first : first + 10]:
+                row = model.day_row(day)
+                assert model.day_at(row) == day
+                assert model.event_at(row) is None
+                assert model.event_at(row + 1).start_time.date() == day
+        assert model.buckets.peek(model._days[0]) is None
+        model.stop()
+    finally:
+        qInstallMessageHandler(previous_handler)
+    assert not failures
@@ -0,0 +1,151 @@
+"""The alert scheduler, driven by a fake clock."""
+from __future__ import annotations
+
+from typing import Optional
+
+import pytest
+
+from neverlate import alert_scheduler
+from neverlate.alert_scheduler import APPROACH_LEAD, MAX_SLEEP, AlertScheduler
+
+START = 1_700_000_000.0
+
+
+class FakeClock:
+    """Wall clock and monotonic time, moved by hand."""
+
+    def __init__(self) -> None:
+        self.wall = START
+        self.mono = 1000.0
+
+    def time(self) -> float:
+        return self.wall
+
+    def monotonic(self) -> float:
+        return self.mono
+
+    def advance(self, seconds: float, wall_jump: float = 0) -> None:
+        self.wall += seconds + wall_jump
+        self.mono += seconds
+
+
+class FakeAlerter:
+    """Alerts once, at a given time."""
+
+    def __init__(self, deadline: Optional[float]) -> None:
+        self.deadline = deadline
+        self.alerted_at = []  # type: list[float]
+        self.on_change = None
+
+    def next_alert_time(self, now: Optional[float] = None) -> Optional[float]:
+        return self.deadline
+
+    def update(self, now: Optional[float] = None) -> None:
+        if self.deadline is not None and now >= self.deadline:
+            self.alerted_at.append(now)
+            self.deadline = None
+
+    def move(self, deadline: float, scheduler: AlertScheduler, key: str) -> None:
+        self.deadline = deadline
+        self.on_change()
+        scheduler._reschedule(key)  # (What the queued signal does)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(alert_scheduler, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def scheduler(qapp, clock):
+    scheduler = AlertScheduler()
+    yield scheduler
+    scheduler.stop()
+
+
+def timer_delay(scheduler: AlertScheduler) -> float:
+    """Seconds the timer is armed for."""
+    assert scheduler._timer.isActive()
+    return scheduler._timer.interval() / 1000
+
+
+def run_until(scheduler: AlertScheduler, clock: FakeClock, end: float) -> None:
+    """Fire the timer each time it's due, until the end time."""
+    while scheduler._timer.isActive():
+        delay = timer_delay(scheduler)
+        if clock.wall + delay > end:
+            return
+        clock.advance(delay)
+        scheduler._fire()
+
+
+def test_rekeyed_alerter_fires_at_its_new_time(scheduler, clock):
+    early, late = FakeAlerter(START + 100), FakeAlerter(START + 200)
+    scheduler.schedule("early", early)
+    scheduler.schedule("late", late)
+    assert scheduler.next_deadline() == START + 100
+
+    # Snoozed past the other one: its old heap entry is stale
+    early.move(START + 300, scheduler, "early")
+    assert scheduler.next_deadline() == START + 200
+    run_until(scheduler, clock, START + 250)
+    assert late.alerted_at == [START + 200]
+    assert early.alerted_at == []
+
+    run_until(scheduler, clock, START + 400)
+    assert early.alerted_at == [START + 300]
+    assert scheduler.next_deadline() is None
+
+
+def test_removed_alerter_does_not_fire(scheduler, clock):
+    alerter = FakeAlerter(START + 10)
+    scheduler.schedule("key", alerter)
+    scheduler.remove("key")
+    assert scheduler.next_deadline() is None
+    assert not scheduler._timer.isActive()
+    assert alerter.on_change is None
+
+
+def test_sleeps_at_most_max_sleep(scheduler, clock):
+    alerter = FakeAlerter(START + 3600)
+    scheduler.schedule("key", alerter)
+    assert timer_delay(scheduler) == MAX_SLEEP
+
+    # Wakes up every MAX_SLEEP seconds until the alert approaches, then alerts on time
+    wake_ups = 0
+    while not alerter.alerted_at:
+        clock.advance(timer_delay(scheduler))
+        scheduler._fire()
+        wake_ups += 1
+    assert alerter.alerted_at == [START + 3600]
+    assert wake_ups <= 3600 / MAX_SLEEP + 2
+
+
+def test_approaching_alert_is_signalled(scheduler, clock):
+    approaching = []
+    scheduler.alert_approaching.connect(approaching.append)
+    scheduler.schedule("key", FakeAlerter(START + 30))
+    assert timer_delay(scheduler) == 30 - APPROACH_LEAD
+    clock.advance(30 - APPROACH_LEAD)
+    scheduler._fire()
+    assert approaching == ["key"]
+    assert timer_delay(scheduler) == APPROACH_LEAD
+
+
+def test_clock_jump_is_detected(scheduler, clock):
+    jumps = []
+    scheduler.clock_jumped.connect(jumps.append)
+    alerter = FakeAlerter(START + 600)
+    scheduler.schedule("key", alerter)
+
+    clock.advance(MAX_SLEEP)
+    scheduler._fire()
+    assert jumps == []
+
+    # Asleep for an hour: the monotonic timer only saw a minute go by
+    clock.advance(MAX_SLEEP, wall_jump=3600)
+    scheduler._fire()
+    assert jumps == [3600]
+    assert alerter.alerted_at == [clock.wall]  # Overdue: alerted right away
@@ -0,0 +1,146 @@
+"""Alert admission: merging alerts into dialogs, and limiting the dialogs open at once."""
+from __future__ import annotations
+
+import pytest
+from conftest import time_event, wait_until
+
+from neverlate import alert_server
+from neverlate.alert_server import MAX_EVENTS_PER_DIALOG, MAX_OPEN_DIALOGS, AlertServer
+from neverlate.constants import OUTPUT_DISMISS
+from neverlate.main import CLOCK_JUMP_ALERT_HOLD
+from neverlate.preferences import PREFERENCES
+
+
+class FakeBackend:
+    """Records the dialogs instead of showing them."""
+
+    def __init__(self) -> None:
+        self.dialogs = {}  # type: dict[str, list]  # Dialog ID -> summaries of its events
+        self._callbacks = {}
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        self.dialogs.clear()
+
+    def show(self, dialog_id, time_events, callback) -> None:
+        self.dialogs[dialog_id] = [time_event.summary for time_event in time_events]
+        self._callbacks[dialog_id] = callback
+
+    def update(self, dialog_id, time_events) -> None:
+        self.dialogs[dialog_id] = [time_event.summary for time_event in time_events]
+
+    def close(self, dialog_id) -> None:
+        self.user_closed(dialog_id, "closed")
+
+    def user_closed(self, dialog_id: str, result: str) -> None:
+        del self.dialogs[dialog_id]
+        self._callbacks.pop(dialog_id)({"type": result, "id": dialog_id})
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.mono = 1000.0
+
+    def monotonic(self) -> float:
+        return self.mono
+
+
+@pytest.fixture
+def backend(qapp, monkeypatch):
+    monkeypatch.setattr(PREFERENCES, "in_process_alerts", False)
+    return FakeBackend()
+
+
+@pytest.fixture
+def server(backend):
+    server = AlertServer()
+    server.pop_up_process = backend
+    yield server
+    server.stop()
+
+
+def show_alerts(server: AlertServer, count: int, results: dict, first: int = 0) -> None:
+    """Alert about events "first", "first + 1"... starting that many minutes from now."""
+    for idx in reversed(range(first, first + count)):  # Not in start order
+        alert_id = f"alert{idx}"
+        callback = results.setdefault(alert_id, []).append
+        server.show(alert_id, time_event(str(idx), idx + 1), callback)
+
+
+def settle() -> None:
+    """Let the admission timer run."""
+    wait_until(lambda: False, timeout=0.1)
+
+
+def test_alerts_requested_together_share_a_dialog(server, backend):
+    results = {}
+    show_alerts(server, MAX_EVENTS_PER_DIALOG + 2, results)
+    settle()
+    assert sorted(backend.dialogs.values()) == [
+        [f"Event {idx}" for idx in range(MAX_EVENTS_PER_DIALOG)],
+        [f"Event {idx}" for idx in range(MAX_EVENTS_PER_DIALOG, MAX_EVENTS_PER_DIALOG + 2)],
+    ]
+
+    # The user's choice applies to all the events of the dialog
+    (first,) = [id_ for id_, events in backend.dialogs.items() if "Event 0" in events]
+    backend.user_closed(first, OUTPUT_DISMISS)
+    for idx in range(MAX_EVENTS_PER_DIALOG):
+        assert results[f"alert{idx}"] == [{"type": OUTPUT_DISMISS, "id": f"alert{idx}"}]
+    assert results[f"alert{MAX_EVENTS_PER_DIALOG}"] == []
+
+
+def test_queued_alerts_wait_for_a_dialog_to_close(server, backend):
+    results = {}
+    per_dialog = MAX_EVENTS_PER_DIALOG
+    show_alerts(server, per_dialog * (MAX_OPEN_DIALOGS + 1), results)
+    settle()
+    assert len(backend.dialogs) == MAX_OPEN_DIALOGS
+    shown = sorted(summary for events in backend.dialogs.values() for summary in events)
+    # The earliest events first
+    assert shown == sorted(f"Event {idx}" for idx in range(per_dialog * MAX_OPEN_DIALOGS))
+
+    backend.user_closed(next(iter(backend.dialogs)), OUTPUT_DISMISS)
+    settle()
+    assert len(backend.dialogs) == MAX_OPEN_DIALOGS
+    queued = range(per_dialog * MAX_OPEN_DIALOGS, per_dialog * (MAX_OPEN_DIALOGS + 1))
+    assert [f"Event {idx}" for idx in queued] in backend.dialogs.values()
+
+    while backend.dialogs:
+        backend.user_closed(next(iter(backend.dialogs)), OUTPUT_DISMISS)
+        settle()
+    assert all(len(result) == 1 for result in results.values())
+
+
+def test_closing_a_queued_alert(server, backend):
+    results = {}
+    show_alerts(server, MAX_EVENTS_PER_DIALOG * MAX_OPEN_DIALOGS + 1, results)
+    settle()
+    last = f"alert{MAX_EVENTS_PER_DIALOG * MAX_OPEN_DIALOGS}"
+    server.close(last)
+    assert results[last] == [{"type": "closed", "id": last}]
+    while backend.dialogs:
+        backend.user_closed(next(iter(backend.dialogs)), OUTPUT_DISMISS)
+        settle()
+    assert results[last] == [{"type": "closed", "id": last}]
+
+
+def test_hold_after_a_clock_jump(server, backend, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(alert_server, "time", clock)
+    results = {}
+    server.hold(CLOCK_JUMP_ALERT_HOLD)
+    show_alerts(server, 2, results)
+    assert server._admit_timer.interval() == CLOCK_JUMP_ALERT_HOLD * 1000
+
+    # The timer fired a bit early: still holding
+    clock.mono += CLOCK_JUMP_ALERT_HOLD - 0.5
+    server._admit()
+    assert not backend.dialogs
+    show_alerts(server, 2, results, first=2)
+
+    # All the alerts requested while holding are merged
+    clock.mono += 0.5
+    server._admit()
+    assert list(backend.dialogs.values()) == [[f"Event {idx}" for idx in range(4)]]
@@ -0,0 +1,60 @@
+"""Revalidating the cached calendar list."""
+from __future__ import annotations
+
+import time
+
+from conftest import FakeService, event_item, http_error
+
+
+def visible(_calendar) -> bool:
+    return True
+
+
+def test_calendar_list_not_modified(make_downloader):
+    """A 304 keeps the calendars and restarts the TTL."""
+    service = FakeService({"work": [event_item("a", 30)]})
+    gcal = make_downloader(service)
+    gcal.refresh(visible)
+    gcal.expire_calendar_list()
+
+    gcal.refresh(visible)
+
+    assert [cal.id for cal in gcal.calendars] == ["work"]
+    assert not gcal.calendar_list_expired()
+
+
+def test_rate_limited_calendar_list_backs_off(make_downloader):
+    """A rejected calendar list request isn't retried right away, and slows down the refreshes."""
+    service = FakeService({"work": [event_item("a", 30)]})
+    gcal = make_downloader(service)
+    gcal.refresh(visible)
+    gcal.expire_calendar_list()
+    service.fail["calendarList"] = http_error(429)
+
+    gcal.refresh(visible)
+
+    now = time.time()
+    assert [cal.id for cal in gcal.calendars] == ["work"]
+    assert not gcal.calendar_list_expired(now)
+    assert gcal.circuit_breaker.backoff.failures == 1
+    assert gcal.next_update_time(visible) > now
+
+
+def test_failed_calendar_list_backs_off(make_downloader):
+    """Server errors back off from the calendar list too, even if the events synced fine."""
+    service = FakeService({"work": [event_item("a", 30)]})
+    gcal = make_downloader(service)
+    gcal.refresh(visible)
+    gcal.expire_calendar_list()
+    service.fail["calendarList"] = http_error(503)
+
+    gcal.refresh(visible)
+
+    now = time.time()
+    assert not gcal.calendar_list_expired(now)
+    assert gcal.next_update_time(visible) > now
+    # Succeeds again once the backoff expired
+    del service.fail["calendarList"]
+    gcal._calendar_list_backoff.next_attempt = 0.0
+    gcal.refresh(visible)
+    assert gcal._calendar_list_backoff.failures == 0
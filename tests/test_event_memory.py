@@ -0,0 +1,60 @@
+"""
+Memory held per TimeEvent, measured with tracemalloc: the compact representation against keeping
+the raw API payload (KEEP_RAW_DATA, as every event did before).
+"""
+from __future__ import annotations
+
+import json
+import tracemalloc
+
+from conftest import event_item
+
+from neverlate import google_cal_downloader
+from neverlate.google_cal_downloader import Calendar, TimeEvent
+
+EVENT_COUNT = 2000
+
+
+def typical_item() -> dict:
+    """A field-projected event item, with the video/phone/PIN entry points meetings have."""
+    return event_item(
+        "0123456789abcdefghijklmnop",
+        60,
+        recurringEventId="0123456789abcdefghij",
+        originalStartTime={"dateTime": "2024-01-01T09:00:00-08:00"},
+        status="confirmed",
+        summary="Weekly planning sync with the platform team",
+        eventType="default",
+        attendees=[{"self": True, "responseStatus": "accepted"}],
+        conferenceData={
+            "entryPoints": [
+                {"entryPointType": "video", "uri": "https://meet.google.com/abc-defg-hij"},
+                {"entryPointType": "phone", "uri": "tel:+1-555-0100"},
+                {"entryPointType": "more", "uri": "https://tel.meet/abc-defg-hij?pin=1234"},
+            ]
+        },
+    )
+
+
+def bytes_per_event(monkeypatch, keep_raw_data: bool) -> float:
+    """Memory still held by EVENT_COUNT events once the downloaded items are gone."""
+    monkeypatch.setattr(google_cal_downloader, "KEEP_RAW_DATA", keep_raw_data)
+    calendar = Calendar({"id": "work@example.com", "summary": "Work"})
+    # Every downloaded item is a separate object, like the parsed API responses
+    payload = json.dumps(typical_item())
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        events = [TimeEvent(json.loads(payload), calendar) for _ in range(EVENT_COUNT)]
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert len(events) == EVENT_COUNT
+    return held / EVENT_COUNT
+
+
+def test_compact_events_drop_the_payload(monkeypatch):
+    raw = bytes_per_event(monkeypatch, True)
+    compact = bytes_per_event(monkeypatch, False)
+    assert not hasattr(TimeEvent(typical_item(), Calendar({"id": "x"})), "__dict__")
+    assert compact < raw / 3
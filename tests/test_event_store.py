@@ -0,0 +1,81 @@
+"""The event cache: what it keeps, and what happens when it can't be used."""
+import os
+
+from conftest import time_event
+
+from neverlate import event_store
+from neverlate.event_alerter import EventAlerter
+from neverlate.event_store import EventStore
+
+
+def cached_events(store: EventStore) -> dict:
+    store.save_events("work", [{"id": "1"}], True, "sync-1", "window")
+    return store.load_events()
+
+
+def test_corrupt_database_is_replaced(tmp_path):
+    file_path = str(tmp_path / "events.db")
+    with open(file_path, "wb") as file:
+        file.write(b"This is not a database" * 100)
+    store = EventStore(file_path)
+    assert cached_events(store) == {"work": [{"id": "1"}]}
+    assert EventStore(file_path).load_events() == {"work": [{"id": "1"}]}
+
+
+def test_database_with_a_corrupt_page_is_replaced(tmp_path, caplog):
+    file_path = str(tmp_path / "events.db")
+    store = EventStore(file_path)
+    store.save_events("work", [{"id": str(idx)} for idx in range(5000)], True, "sync", "window")
+    store._connection.close()
+    with open(file_path, "r+b") as file:
+        file.seek(3 * 4096)
+        file.write(b"\xab" * 4096)
+    assert cached_events(EventStore(file_path)) == {"work": [{"id": "1"}]}
+    assert "Event cache is corrupt" in caplog.text
+
+
+def test_unopenable_database_is_left_alone(tmp_path):
+    file_path = str(tmp_path / "events.db")
+    os.mkdir(file_path)  # e.g. locked, or no permission: an OperationalError
+    store = EventStore(file_path)
+    assert cached_events(store) == {"work": [{"id": "1"}]}
+    assert os.path.isdir(file_path)
+
+
+def test_undeletable_corrupt_database_is_kept_in_memory(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "events.db")
+    with open(file_path, "wb") as file:
+        file.write(b"This is not a database" * 100)
+
+    def remove(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(event_store.os, "remove", remove)
+    store = EventStore(file_path)
+    assert cached_events(store) == {"work": [{"id": "1"}]}
+    with open(file_path, "rb") as file:
+        assert file.read().startswith(b"This is not a database")
+
+
+def test_alert_state_round_trip(tmp_path):
+    file_path = str(tmp_path / "events.db")
+    alerter = EventAlerter(time_event("1", 5))
+    alerter.has_alerted = True
+    alerter.snooze(60)
+    store = EventStore(file_path)
+    store.save_alert_state(
+        alerter.time_event.id, alerter.time_event.end_epoch, **alerter.get_state()
+    )
+
+    # Restarted
+    store = EventStore(file_path)
+    restored = EventAlerter(time_event("1", 5))
+    restored.set_state(**store.load_alert_state(restored.time_event.id))
+    assert restored.get_state() == alerter.get_state()
+    assert restored.next_alert_time() == alerter.next_alert_time()
+    assert store.load_alert_state(time_event("2", 5).id) is None
+
+    store.remove_alert_states(ended_before=alerter.time_event.end_epoch)
+    assert store.load_alert_state(alerter.time_event.id) is not None
+    store.remove_alert_states(ended_before=alerter.time_event.end_epoch + 1)
+    assert store.load_alert_state(alerter.time_event.id) is None
@@ -0,0 +1,239 @@
+"""
+The `fields` projections must include everything Calendar and TimeEvent read - a dropped field
+would silently parse as missing. And what they (and gzip) save on a page of events.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+from typing import Any
+
+from conftest import event_item
+
+from neverlate.google_cal_downloader import (
+    CALENDAR_LIST_FIELDS,
+    EVENT_FIELDS,
+    Calendar,
+    TimeEvent,
+    _GzipHttp,
+)
+
+# Link of the fake transport: a slow connection, where the payload size matters
+ROUND_TRIP = 0.1  # Seconds
+BANDWIDTH = 1_000_000 / 8  # Bytes per second
+
+
+def parse_fields(fields: str) -> set[tuple[str, ...]]:
+    """Paths selected by a partial response `fields` parameter, e.g. "a,b/c,d(e,f)"."""
+    paths, _ = _parse_fields(fields, 0, ())
+    return paths
+
+
+def _parse_fields(fields: str, pos: int, prefix: tuple[str, ...]) -> tuple[set, int]:
+    paths = set()
+    name = ""
+    while pos < len(fields):
+        char = fields[pos]
+        pos += 1
+        if char == "(":
+            sub_paths, pos = _parse_fields(fields, pos, prefix + tuple(name.split("/")))
+            paths |= sub_paths
+            name = ""
+        elif char in ",)":
+            if name:
+                paths.add(prefix + tuple(name.split("/")))
+            name = ""
+            if char == ")":
+                return paths, pos
+        else:
+            name += char
+    if name:
+        paths.add(prefix + tuple(name.split("/")))
+    return paths, pos
+
+
+def is_selected(path: tuple[str, ...], selected: set[tuple[str, ...]]) -> bool:
+    """A path is selected if it, or one of its parents, is."""
+    return any(path[: idx + 1] in selected for idx in range(len(path)))
+
+
+def is_returned(path: tuple[str, ...], selected: set[tuple[str, ...]]) -> bool:
+    """A path is in the response if it's selected, or is the parent of selected paths."""
+    return is_selected(path, selected) or any(sel[: len(path)] == path for sel in selected)
+
+
+def project(value: Any, selected: set[tuple[str, ...]], prefix: tuple[str, ...] = ()) -> Any:
+    """What the API returns for `value` with the `fields` parameter."""
+    if isinstance(value, list):
+        return [project(item, selected, prefix) for item in value]
+    if not isinstance(value, dict) or is_selected(prefix, selected):
+        return value
+    result = {}
+    for key, item in value.items():
+        path = prefix + (key,)
+        if is_returned(path, selected):
+            result[key] = project(item, selected, path)
+    return result
+
+
+class TrackingDict(dict):
+    """Dict recording the paths of the keys read."""
+
+    def __init__(self, data: dict, reads: set, prefix: tuple[str, ...] = ()) -> None:
+        super().__init__(
+            {key: _track(value, reads, prefix + (key,)) for key, value in data.items()}
+        )
+        self.reads = reads
+        self.prefix = prefix
+
+    def __getitem__(self, key):
+        self.reads.add(self.prefix + (key,))
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.reads.add(self.prefix + (key,))
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        self.reads.add(self.prefix + (key,))
+        return super().__contains__(key)
+
+
+def _track(value: Any, reads: set, prefix: tuple[str, ...]) -> Any:
+    if isinstance(value, dict):
+        return TrackingDict(value, reads, prefix)
+    if isinstance(value, list):
+        return [_track(item, reads, prefix) for item in value]
+    return value
+
+
+def full_event() -> dict:
+    """An event as the API returns it without projection: heavily annotated, many attendees."""
+    item = event_item(
+        "0123456789abcdefghijklmnop",
+        60,
+        recurringEventId="0123456789abcdefghij",
+        originalStartTime={"dateTime": "2024-01-01T09:00:00-08:00", "timeZone": "UTC"},
+        status="confirmed",
+        eventType="default",
+        kind="calendar#event",
+        etag='"3391234567890000"',
+        htmlLink="https://www.google.com/calendar/event?eid=" + "x" * 80,
+        created="2023-01-01T00:00:00.000Z",
+        updated="2024-01-01T00:00:00.000Z",
+        description="Agenda:\n" + "- discuss the roadmap and the open questions\n" * 40,
+        location="Building 4, Room 12",
+        creator={"email": "organizer@example.com"},
+        organizer={"email": "organizer@example.com", "displayName": "Organizer"},
+        iCalUID="0123456789abcdefghij@google.com",
+        sequence=3,
+        reminders={"useDefault": True},
+        attendees=[{"self": True, "email": "me@example.com", "responseStatus": "declined"}]
+        + [
+            {"email": f"person{idx}@example.com", "responseStatus": "accepted"}
+            for idx in range(40)
+        ],
+        conferenceData={
+            "entryPoints": [
+                {"entryPointType": "video", "uri": "https://meet.google.com/abc-defg-hij"},
+                {"entryPointType": "phone", "uri": "tel:+1-555-0100", "pin": "1234"},
+            ],
+            "conferenceSolution": {"name": "Google Meet", "iconUri": "https://x/" + "y" * 60},
+            "conferenceId": "abc-defg-hij",
+        },
+    )
+    item["start"]["timeZone"] = "America/Los_Angeles"
+    item["end"]["timeZone"] = "America/Los_Angeles"
+    return item
+
+
+def test_event_fields_cover_what_time_event_reads():
+    selected = parse_fields(EVENT_FIELDS)
+    item = full_event()
+    reads = set()  # type: set[tuple[str, ...]]
+    TimeEvent(TrackingDict(item, reads, ("items",)), Calendar({"id": "work"}))
+
+    # Reading a key the API didn't send looks the same as the event not having it
+    missing = {path for path in reads if not is_returned(path, selected)}
+    assert not missing
+
+    # Parsing the projected item gives the same event
+    projected = project({"items": [item]}, selected)["items"][0]
+    # maxAttendees=1 is sent along: only the user is included
+    projected["attendees"] = [
+        attendee for attendee in projected["attendees"] if attendee.get("self")
+    ]
+    event = TimeEvent(item, Calendar({"id": "work"}))
+    projected_event = TimeEvent(projected, Calendar({"id": "work"}))
+    assert projected_event.version == event.version
+    assert projected_event.id == event.id
+    assert projected_event.declined and projected_event.video_url
+
+    assert len(json.dumps(projected)) < len(json.dumps(item)) / 5
+
+
+def test_calendar_list_fields_cover_what_calendar_reads():
+    selected = parse_fields(CALENDAR_LIST_FIELDS)
+    reads = set()  # type: set[tuple[str, ...]]
+    data = {
+        "id": "work@example.com",
+        "summary": "Work",
+        "summaryOverride": "My work",
+        "primary": False,
+        "selected": True,
+        "deleted": False,
+        "kind": "calendar#calendarListEntry",
+        "description": "x" * 200,
+        "defaultReminders": [{"method": "popup", "minutes": 10}],
+    }
+    Calendar(TrackingDict(data, reads, ("items",)))
+    assert {path for path in reads if not is_returned(path, selected)} == set()
+
+
+class FakeTransport:
+    """
+    http object answering with a page of events, and adding up the time it would take on the
+    link. Like Google, it only compresses for user agents that include "gzip".
+    """
+
+    def __init__(self, page: dict) -> None:
+        self.body = json.dumps(page).encode("utf-8")
+        self.elapsed = 0.0
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        headers = headers or {}
+        content = self.body
+        response = {"status": "200"}
+        if "gzip" in headers.get("accept-encoding", "") and "gzip" in headers.get(
+            "user-agent", ""
+        ):
+            content = gzip.compress(content)
+            response["content-encoding"] = "gzip"
+        self.elapsed += ROUND_TRIP + len(content) / BANDWIDTH
+        return response, content
+
+
+def page_latency(projected: bool, gzipped: bool) -> float:
+    """Seconds to download a full page of events."""
+    items = [dict(full_event(), id=f"event{idx}") for idx in range(250)]
+    if projected:
+        items = project({"items": items}, parse_fields(EVENT_FIELDS))["items"]
+        for item in items:  # maxAttendees=1
+            item["attendees"] = [
+                attendee for attendee in item["attendees"] if attendee.get("self")
+            ]
+    transport = FakeTransport({"items": items})
+    http = _GzipHttp(transport) if gzipped else transport
+    http.request("https://www.googleapis.com/batch/calendar/v3", "POST", headers={})
+    return transport.elapsed
+
+
+def test_projected_gzipped_pages_download_faster():
+    full = page_latency(projected=False, gzipped=False)
+    projected = page_latency(projected=True, gzipped=False)
+    gzipped = page_latency(projected=False, gzipped=True)
+    both = page_latency(projected=True, gzipped=True)
+    assert projected < full / 4
+    assert gzipped < full / 4
+    assert both < min(projected, gzipped)
+    assert both < full / 20
@@ -0,0 +1,55 @@
+"""Downloading events page by page."""
+from __future__ import annotations
+
+import datetime
+
+from conftest import FakeService, event_item
+
+from neverlate.utils import day_start
+
+
+def test_iter_events_follows_page_tokens(make_downloader):
+    service = FakeService({"busy": [event_item(f"e{idx}", 60 + idx) for idx in range(7)]})
+    service.page_size = 3
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    events = gcal.iter_events(gcal.calendars[0])
+
+    # The first page is available before the others are downloaded
+    first = [next(events) for _ in range(3)]
+    assert service.count("events.list") == 1
+    assert [event.event_id for event in first] == ["e0", "e1", "e2"]
+    assert len(list(events)) == 4
+    assert service.count("events.list") == 3
+
+
+def test_iter_events_max_pages(make_downloader):
+    service = FakeService({"busy": [event_item(f"e{idx}", 60 + idx) for idx in range(7)]})
+    service.page_size = 3
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+
+    assert len(list(gcal.iter_events(gcal.calendars[0], max_pages=2))) == 6
+    assert service.count("events.list") == 2
+
+
+def test_download_range_batches_pages(make_downloader):
+    """The agenda's ranges: the pages of all the calendars, one batch per round."""
+    service = FakeService(
+        {
+            "busy": [event_item(f"b{idx}", 60 + idx) for idx in range(5)],
+            "quiet": [event_item("q0", 30)],
+        }
+    )
+    service.page_size = 2
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    today = datetime.date.today()
+    round_trips = service.round_trips
+
+    events = gcal.download_range(
+        gcal.calendars, day_start(today), day_start(today + datetime.timedelta(days=2))
+    )
+
+    assert [event.event_id for event in events] == ["q0", "b0", "b1", "b2", "b3", "b4"]
+    assert service.round_trips - round_trips == 3
@@ -0,0 +1,97 @@
+"""Supervising the pop-up process: one that dies or hangs is restarted, without looping alerts."""
+import os
+import time
+
+from conftest import time_event, wait_until
+
+from neverlate import alert_server, event_alerter
+from neverlate.alert_server import AlertServer, PopUpProcess
+from neverlate.event_alerter import FAILED_ALERT_RETRY, EventAlerter
+from neverlate.preferences import PREFERENCES
+
+CRASH = "sys.exit(1)"
+HANG = "time.sleep(60)"  # Never reads its input, never sends a heartbeat
+
+
+def fake_pop_up(tmp_path, monkeypatch, behavior: str):
+    """Run a fake pop-up process instead of the real one. Returns how many times it started."""
+    path = str(tmp_path / "fake_pop_up.py")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("import sys, time\n")
+        file.write("open(__file__ + '.starts', 'a').write('start\\n')\n")
+        file.write(behavior + "\n")
+    monkeypatch.setattr(PopUpProcess, "APP_PATH", path)
+
+    def starts() -> int:
+        if not os.path.exists(path + ".starts"):
+            return 0
+        with open(path + ".starts", encoding="utf-8") as file:
+            return len(file.readlines())
+
+    return starts
+
+
+def test_crashing_process_is_not_restarted_on_demand(qapp, tmp_path, monkeypatch):
+    starts = fake_pop_up(tmp_path, monkeypatch, CRASH)
+    pop_up = PopUpProcess()
+    results = []
+    pop_up.start()
+    pop_up.show("first", [time_event("1", 5)], results.append)
+    assert wait_until(lambda: results == [None])
+
+    # Alerts shown meanwhile fail, instead of starting the process again and again
+    for idx in range(20):
+        pop_up.show(f"retry-{idx}", [time_event("1", 5)], results.append)
+    assert wait_until(lambda: len(results) == 21)
+    assert results == [None] * 21
+    assert starts() == 1
+    pop_up.stop()
+
+
+def test_restart_delay_grows(qapp, tmp_path, monkeypatch):
+    starts = fake_pop_up(tmp_path, monkeypatch, CRASH)
+    monkeypatch.setattr(alert_server, "MIN_UPTIME", 1)
+    monkeypatch.setattr(alert_server, "MAX_RESTART_DELAY", 2)
+    pop_up = PopUpProcess()
+    begin = time.monotonic()
+    pop_up.start()
+    assert wait_until(lambda: starts() == 4, timeout=15)
+    # Waited 1, 2, then 2 seconds (the maximum) before restarting it
+    assert time.monotonic() - begin >= 5
+    assert pop_up._restart_delay == 2
+    pop_up.stop()
+
+
+def test_hung_process_is_killed_and_restarted(qapp, tmp_path, monkeypatch):
+    starts = fake_pop_up(tmp_path, monkeypatch, HANG)
+    monkeypatch.setattr(alert_server, "HEARTBEAT_INTERVAL", 0.1)
+    monkeypatch.setattr(alert_server, "HEARTBEAT_TIMEOUT", 0.5)
+    monkeypatch.setattr(alert_server, "MIN_UPTIME", 0.2)
+    pop_up = PopUpProcess()
+    results = []
+    pop_up.start()
+    pop_up.show("first", [time_event("1", 5)], results.append)
+    assert wait_until(lambda: results == [None])
+    # It ran for a while before hanging: restarted right away, and left alone while idle
+    assert wait_until(lambda: starts() == 2)
+    assert not pop_up._watchdog.isActive()
+    wait_until(lambda: False, timeout=1)
+    assert starts() == 2
+    pop_up.stop()
+
+
+def test_failed_alert_is_retried_later(qapp, tmp_path, monkeypatch):
+    fake_pop_up(tmp_path, monkeypatch, CRASH)
+    monkeypatch.setattr(PREFERENCES, "in_process_alerts", False)
+    monkeypatch.setattr(PREFERENCES, "alert_padding", 1)
+    server = AlertServer()
+    monkeypatch.setattr(event_alerter, "ALERT_SERVER", server)
+    alerter = EventAlerter(time_event("1", 0.5))
+    alerter.update()
+    assert alerter.is_alerting()
+
+    assert wait_until(lambda: not alerter.is_alerting())
+    assert alerter.next_alert_time() >= time.time() + FAILED_ALERT_RETRY - 1
+    alerter.update()
+    assert not alerter.is_alerting()
+    server.stop()
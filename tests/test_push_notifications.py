@@ -0,0 +1,56 @@
+"""Push notification channels."""
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from conftest import FakeRequest, FakeService, http_error
+
+from neverlate.push_notifications import PushNotifier
+
+
+class FakeReceiver:
+    """Receives nothing."""
+
+    def start(self, callback) -> None:
+        self.callback = callback
+
+    def stop(self) -> None:
+        pass
+
+
+def test_update_channels_charges_the_budget(make_downloader):
+    """Watching and stopping channels goes through the downloader (its lock and budget)."""
+    service = FakeService({"work": [], "home": []})
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    notifier = PushNotifier("https://example.com/notify", FakeReceiver())
+    spent = gcal.request_budget.spent
+
+    notifier.update_channels(gcal, gcal.calendars)
+    notifier.update_channels(gcal, gcal.calendars[:1])
+
+    assert service.count("events.watch") == 2
+    assert service.count("channels.stop") == 1
+    assert gcal.request_budget.spent - spent == 3
+    assert notifier.active
+
+
+def test_rate_limited_watch_slows_down_refreshes(make_downloader):
+    """Being rate limited on a channel call reaches the circuit breaker."""
+    service = FakeService({"work": []})
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    notifier = PushNotifier("https://example.com/notify", FakeReceiver())
+    service.events = lambda: SimpleNamespace(
+        watch=lambda **kw: FakeRequest(lambda request, **_: raise_(http_error(429)), kw)
+    )
+
+    notifier.update_channels(gcal, gcal.calendars)
+
+    assert not notifier.active
+    assert gcal.circuit_breaker.backoff.failures == 1
+    assert gcal.next_update_time(lambda _calendar: True) == gcal.circuit_breaker.next_attempt
+
+
+def raise_(error: Exception):
+    raise error
@@ -0,0 +1,65 @@
+"""The request budget: calendars with imminent events are synced first, the rest wait their turn."""
+from __future__ import annotations
+
+import time
+
+from conftest import FakeService, event_item
+
+from neverlate.google_cal_downloader import REQUEST_BUDGET_PER_MINUTE
+
+
+def visible(_calendar) -> bool:
+    return True
+
+
+def test_more_calendars_than_budget(make_downloader):
+    """More non-imminent calendars than the budget: spend all of it, schedule the rest."""
+    calendar_count = REQUEST_BUDGET_PER_MINUTE + 10
+    service = FakeService(
+        {f"cal{idx}": [event_item(f"event{idx}", 24 * 60 + idx)] for idx in range(calendar_count)}
+    )
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    # Restarting with every calendar cached: all of them are due, none has imminent events
+    for calendar in gcal.calendars:
+        gcal._calendar_events[calendar.id] = {}
+    service.requests.clear()
+
+    gcal.refresh(visible)
+
+    synced = [
+        kwargs["calendarId"] for method, kwargs in service.requests if method == "events.list"
+    ]
+    assert len(synced) == int(gcal.request_budget.capacity) - 1  # The calendar list was requested
+    assert len(gcal.deferred_calendars) == calendar_count - len(synced)
+    # The deferred calendars wait until the budget can pay for a sync - not a busy loop
+    now = time.time()
+    next_update = gcal.next_update_time(visible)
+    assert now < next_update <= now + 60 / REQUEST_BUDGET_PER_MINUTE + 1
+
+    # Once the budget refilled, the deferred calendars are synced
+    gcal.request_budget.tokens = gcal.request_budget.capacity
+    service.requests.clear()
+    gcal.refresh(visible)
+    assert service.count("events.list") == calendar_count - len(synced)
+    assert not gcal.deferred_calendars
+
+
+def test_imminent_calendars_first(make_downloader):
+    """A short budget goes to the calendars whose next event is soonest."""
+    service = FakeService(
+        {
+            "later": [event_item("later", 10 * 60)],
+            "soon": [event_item("soon", 30)],
+            "empty": [],
+        }
+    )
+    gcal = make_downloader(service)
+    gcal.refresh(visible, force=True)
+    gcal.request_budget.tokens = 1.5
+    service.requests.clear()
+
+    gcal.refresh(visible, force=True)
+
+    assert [kwargs["calendarId"] for _, kwargs in service.requests] == ["soon"]
+    assert {cal.id for cal in gcal.deferred_calendars} == {"later", "empty"}
@@ -0,0 +1,103 @@
+"""Checking an event right before alerting about it: cancelled, moved, or unreachable."""
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+from conftest import FakeService, event_item, http_error
+
+from neverlate.alert_scheduler import AlertScheduler
+from neverlate.event_alerter import EventAlerter
+from neverlate.main import App, RevalidateEvent
+
+
+@pytest.fixture
+def synced(qapp, make_downloader):
+    """A downloader with one synced event, and the app's alerter for it."""
+    service = FakeService({"work": [event_item("e1", 1)]})
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    gcal.update_events()
+    (time_event,) = gcal.events
+    alerter = EventAlerter(time_event)
+    app = SimpleNamespace(
+        gcal=gcal,
+        event_alerters={time_event.id: alerter},
+        alert_scheduler=AlertScheduler(),
+    )
+    app.alert_scheduler.schedule(time_event.id, alerter)
+    yield app
+    app.alert_scheduler.stop()
+
+
+def revalidate(app) -> list[tuple]:
+    """Run the check (in this thread), and hand its result to the app like the signal does."""
+    ((key, alerter),) = app.event_alerters.items()
+    thread = RevalidateEvent(app.gcal, key, alerter.time_event)
+    emitted = []
+    thread.revalidated.connect(lambda *args: emitted.append(args))
+    thread.run()
+    for args in emitted:
+        App.on_event_revalidated(app, *args)
+    return emitted
+
+
+@pytest.mark.parametrize(
+    "item", [None, {"id": "e1", "status": "cancelled"}], ids=["deleted", "cancelled"]
+)
+def test_cancelled_event_is_not_alerted(synced, item):
+    key = next(iter(synced.event_alerters))
+    synced.gcal.service.calendars["work"] = [] if item is None else [item]
+    assert revalidate(synced) == [(key, None)]
+    assert not synced.event_alerters
+    assert synced.alert_scheduler.next_deadline() is None
+    assert synced.gcal.events == []
+    assert synced.gcal.store.load_events()["work"] == []
+
+
+def test_moved_event_is_rescheduled(synced):
+    ((key, alerter),) = synced.event_alerters.items()
+    deadline = synced.alert_scheduler.next_deadline()
+    synced.gcal.service.calendars["work"] = [event_item("e1", 30)]
+    ((emitted_key, time_event),) = revalidate(synced)
+    assert emitted_key == key
+    assert alerter.time_event is time_event
+    assert synced.alert_scheduler.next_deadline() == alerter.next_alert_time()
+    assert synced.alert_scheduler.next_deadline() > deadline
+
+
+def test_unchanged_event_is_left_alone(synced):
+    deadline = synced.alert_scheduler.next_deadline()
+    assert revalidate(synced) == []
+    assert synced.alert_scheduler.next_deadline() == deadline
+
+
+def test_alert_goes_ahead_when_the_check_fails(synced):
+    ((key, alerter),) = synced.event_alerters.items()
+    deadline = synced.alert_scheduler.next_deadline()
+    synced.gcal.service.fail["work"] = http_error(503)
+    assert revalidate(synced) == []
+    assert synced.event_alerters == {key: alerter}
+    assert synced.alert_scheduler.next_deadline() == deadline
+
+
+def test_change_is_applied_before_the_app_hears_of_it(synced):
+    """A refresh finishing right after the check must not bring back the old event."""
+    gcal = synced.gcal
+    ((key, alerter),) = synced.event_alerters.items()
+    gcal.service.calendars["work"] = [event_item("e1", 30)]
+    thread = RevalidateEvent(gcal, key, alerter.time_event)
+    seen = []
+    thread.revalidated.connect(
+        lambda _key, time_event: seen.append(
+            (
+                [event.version for event in gcal.events],
+                gcal._gather_events(gcal.calendars)[0].version,
+                time_event.version,
+            )
+        )
+    )
+    thread.run()
+    ((events, gathered, version),) = seen
+    assert events == [version]
+    assert gathered == version
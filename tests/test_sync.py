@@ -0,0 +1,83 @@
+"""Incremental syncs: reusing the sync token, and what the deltas may contain."""
+from __future__ import annotations
+
+import datetime
+
+from conftest import FakeService, event_item
+
+from neverlate.google_cal_downloader import window_key
+
+
+def list_requests(service: FakeService) -> list[dict]:
+    return [kwargs for method, kwargs in service.requests if method == "events.list"]
+
+
+def synced_event_ids(gcal) -> set[str]:
+    return set(gcal._calendar_events["work"])
+
+
+def stored_event_ids(gcal) -> set[str]:
+    return {item["id"] for item in gcal.store.load_events().get("work", [])}
+
+
+def test_sync_token_is_reused(make_downloader):
+    service = FakeService({"work": [event_item("e1", 60)]})
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    gcal.update_events()
+    (full_sync,) = list_requests(service)
+    assert "timeMin" in full_sync and "syncToken" not in full_sync
+
+    service.requests.clear()
+    service.changes["work"] = [event_item("e2", 90)]
+    gcal.update_events()
+    (incremental,) = list_requests(service)
+    assert incremental["syncToken"] == "sync-work" and "timeMin" not in incremental
+    assert synced_event_ids(gcal) == {"e1", "e2"}
+    assert stored_event_ids(gcal) == {"e1", "e2"}
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync(make_downloader):
+    service = FakeService({"work": [event_item("e1", 60)]})
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    gcal.update_events()
+    window = gcal._sync_tokens["work"]["window"]
+    # Synced further ahead than the current window (e.g. the look-ahead was shortened since)
+    first_day, last_day = gcal._window_days()
+    gcal._sync_tokens["work"]["window"] = window_key(
+        first_day, last_day + datetime.timedelta(days=3)
+    )
+
+    service.requests.clear()
+    service.expired_tokens.add("sync-work")
+    service.calendars["work"].append(event_item("e2", 90))
+    gcal.update_events()
+
+    incremental, full_sync = list_requests(service)
+    assert incremental["syncToken"] == "sync-work"
+    assert "timeMin" in full_sync and "syncToken" not in full_sync
+    assert synced_event_ids(gcal) == {"e1", "e2"}
+    # The new token covers what the full sync downloaded, not the previous window
+    assert gcal._sync_tokens["work"]["window"] == window
+    assert gcal.store.load_sync_tokens()["work"]["window"] == window
+
+
+def test_cancelled_and_out_of_window_changes_are_dropped(make_downloader):
+    service = FakeService({"work": [event_item("e1", 60), event_item("e2", 90)]})
+    gcal = make_downloader(service)
+    gcal.update_calendars()
+    gcal.update_events()
+
+    next_month = 30 * 24 * 60  # Minutes from now
+    service.changes["work"] = [
+        {"id": "e1", "status": "cancelled"},
+        event_item("e2", next_month),  # Moved out of the window
+        event_item("e3", next_month),  # Created outside of the window
+        event_item("e4", 120),
+    ]
+    gcal.update_events()
+
+    assert synced_event_ids(gcal) == {"e4"}
+    assert stored_event_ids(gcal) == {"e4"}
+    assert [event.event_id for event in gcal.events] == ["e4"]